@@ -1,35 +1,105 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, Response, current_app, jsonify, request, session, g
 from flask_sqlalchemy import SQLAlchemy
-from flask_admin import Admin, AdminIndexView, expose
-from flask_admin.contrib.sqla import ModelView
-from flask_admin.form import Select2Widget
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
-from wtforms import Form, StringField, SelectField, PasswordField
-from wtforms.fields import SelectField as WTFSelectField
-from sqlalchemy import text
+from functools import wraps
+from instrumentation import Instrumentation
+from catalog import CatalogCache, make_backend
+from seat_events import SeatBroadcaster, make_event_backend
+from auth import DEFAULT_HASH_METHOD, PasswordPolicy, IdentityCache, make_hashing_pool, make_identity_backend
+from exporter import FORMATS as EXPORT_FORMATS
+from deletion import DeletionService
+from schedule import MEETING_COLUMNS, Meeting, meeting_columns, student_schedule
+from grade_stats import ABSENT, apply_grade_changes, parse_grade, recompute_grade_stats
+from db_profile import engine_options, sqlite_pragmas, install_sqlite_pragmas
+from rate_limit import NoRateLimit, RateLimiter, make_bucket_backend
+from idempotency import IdempotencyCache, make_idempotency_backend
+from replica import RoutingSession, make_replica_router, primary_reads, reset_routing
+from sqlalchemy import text, func, inspect, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, aliased, validates
 import os
+import base64
+import json
+import math
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///enrollment.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def load_config():
+    """Settings read from the environment, before create_app() applies its overrides."""
+    trusted_proxies = os.environ.get('TRUSTED_PROXIES', '0')
+    return {
+        'SECRET_KEY': 'your-secret-key-here',
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'sqlite:///enrollment.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', '0') == '1',
+        # JSON-only workers can leave Flask-Admin out entirely
+        'ADMIN_ENABLED': os.environ.get('ADMIN_ENABLED', '1') == '1',
+        'CATALOG_STORE': os.environ.get('CATALOG_STORE', ''),
+        'SEAT_EVENTS_STORE': os.environ.get('SEAT_EVENTS_STORE', ''),
+        'SEAT_STREAM_HEARTBEAT': 15,
+        'SEAT_STREAM_COALESCE': 0.2,
+        # Threads asgi.py runs the Flask-routed requests on; each open seat stream holds one
+        'WSGI_THREADS': int(os.environ.get('WSGI_THREADS', '100')),
+        'IDENTITY_STORE': os.environ.get('IDENTITY_STORE', ''),
+        'PASSWORD_HASH_METHOD': os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD),
+        'PASSWORD_HASH_WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS', '0')),
+        'PASSWORD_HASH_QUEUE': int(os.environ.get('PASSWORD_HASH_QUEUE', '32')),
+        'PASSWORD_HASH_TIMEOUT': float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5')),
+        'EXPORT_BATCH_SIZE': 1000,
+        'DELETE_CHUNK_SIZE': int(os.environ.get('DELETE_CHUNK_SIZE', '1000')),
+        'DB_PROFILE': os.environ.get('DB_PROFILE', 'development'),
+        # Reverse proxies in front of the app; the client address is taken
+        # from that many X-Forwarded-For hops back
+        'TRUSTED_PROXIES': int(trusted_proxies),
+        # Token buckets as refill per second/burst: per signed-in user and per
+        # IP address on the JSON writes, per IP address on login attempts
+        'RATE_LIMIT_ENABLED': os.environ.get('RATE_LIMIT_ENABLED', '1') == '1',
+        # The per-IP rules are off unless the address can be trusted to be the client's
+        'RATE_LIMIT_BY_IP': os.environ.get('RATE_LIMIT_BY_IP', '0' if trusted_proxies == '0' else '1') == '1',
+        'RATE_LIMIT_SESSION': os.environ.get('RATE_LIMIT_SESSION', '2/10'),
+        'RATE_LIMIT_IP': os.environ.get('RATE_LIMIT_IP', '20/60'),
+        'RATE_LIMIT_LOGIN': os.environ.get('RATE_LIMIT_LOGIN', '1/30'),
+        'RATE_LIMIT_STORE': os.environ.get('RATE_LIMIT_STORE', ''),
+        'IDEMPOTENCY_STORE': os.environ.get('IDEMPOTENCY_STORE', ''),
+        'IDEMPOTENCY_TTL': int(os.environ.get('IDEMPOTENCY_TTL', str(24 * 60 * 60))),
+        # Read-only views read from a replica: another database URL, or a SQLite
+        # snapshot of the primary refreshed every REPLICA_SNAPSHOT_INTERVAL seconds
+        'REPLICA_DATABASE_URL': os.environ.get('REPLICA_DATABASE_URL', ''),
+        'REPLICA_SNAPSHOT_INTERVAL': float(os.environ.get('REPLICA_SNAPSHOT_INTERVAL', '0')),
+        'REPLICA_SNAPSHOT_DIR': os.environ.get('REPLICA_SNAPSHOT_DIR', ''),
+        'REPLICA_MAX_STALENESS': float(os.environ.get('REPLICA_MAX_STALENESS', '30')),
+        'REPLICA_STICKY_SECONDS': float(os.environ.get('REPLICA_STICKY_SECONDS', '5')),
+        'REPLICA_STICKY_STORE': os.environ.get('REPLICA_STICKY_STORE', ''),
+    }
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-db = SQLAlchemy(app)
+# Per-application services, built by create_app() and stored in app.extensions;
+# these names resolve to the current app's instance.
+password_policy = LocalProxy(lambda: current_app.extensions['password_policy'])
+hashing_pool = LocalProxy(lambda: current_app.extensions['hashing_pool'])
+course_catalog = LocalProxy(lambda: current_app.extensions['course_catalog'])
+seat_broadcaster = LocalProxy(lambda: current_app.extensions['seat_broadcaster'])
+identity_cache = LocalProxy(lambda: current_app.extensions['identity_cache'])
+rate_limiter = LocalProxy(lambda: current_app.extensions['rate_limiter'])
+idempotency_cache = LocalProxy(lambda: current_app.extensions['idempotency_cache'])
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False) 
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     
+    # Teacher/student dropdowns filter on role and list people by name
+    __table_args__ = (db.Index('ix_user_role_name', 'role', 'last_name', 'first_name'),)
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_policy.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_policy.verify(self.password_hash, password)
     
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -40,9 +110,32 @@ class Course(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     time = db.Column(db.String(50), nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
-    
-    teacher = db.relationship('User', backref=db.backref('courses_taught', cascade='all, delete-orphan'))
-    enrollments = db.relationship('Enrollment', backref='course', cascade='all, delete-orphan')
+    # Denormalized seat counter, kept in step with the enrollment table so that a
+    # seat can be claimed with a single conditional UPDATE.
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # `time` parsed into a bitmask of days and minutes after midnight whenever
+    # it is set (see schedule.py); NULL if it is not a recognizable meeting time
+    meeting_days = db.Column(db.Integer, nullable=True)
+    start_minute = db.Column(db.Integer, nullable=True)
+    end_minute = db.Column(db.Integer, nullable=True)
+    
+    # passive_deletes leaves children to the database's ON DELETE CASCADE
+    # instead of loading them all to delete one by one
+    teacher = db.relationship('User', backref=db.backref('courses_taught', cascade='all, delete-orphan',
+                                                         passive_deletes=True))
+    enrollments = db.relationship('Enrollment', backref='course', cascade='all, delete-orphan', passive_deletes=True)
+    
+    __table_args__ = (db.Index('ix_course_teacher_id', 'teacher_id'),)
+    
+    @validates('time')
+    def parse_time(self, key, value):
+        for column, parsed in meeting_columns(value).items():
+            setattr(self, column, parsed)
+        return value
+    
+    @property
+    def meeting(self):
+        return Meeting(self.meeting_days, self.start_minute, self.end_minute) if self.meeting_days else None
 
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,396 +144,597 @@ class Enrollment(db.Model):
     grade = db.Column(db.Integer, nullable=True)
     enrolled_date = db.Column(db.DateTime, default=datetime.utcnow)
     
-    student = db.relationship('User', backref=db.backref('enrollments', cascade='all, delete-orphan'))
+    student = db.relationship('User', backref=db.backref('enrollments', cascade='all, delete-orphan', passive_deletes=True))
     
-    __table_args__ = (db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment'),)
+    # unique_enrollment serves lookups by student; rosters and seat counts go by course
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment'),
+        db.Index('ix_enrollment_course_student', 'course_id', 'student_id'),
+    )
 
-class SecureAdminIndexView(AdminIndexView):
-    def is_accessible(self):
-        return session.get('user_role') == 'admin'
-    
-    def inaccessible_callback(self, name, **kwargs):
-        return redirect(url_for('login'))
-    
-    @expose('/')
-    def index(self):
-        users_count = User.query.count()
-        courses_count = Course.query.count()
-        enrollments_count = Enrollment.query.count()
-        
-        return self.render('admin/index.html', 
-                         admin_view=self,
-                         users_count=users_count,
-                         courses_count=courses_count,
-                         enrollments_count=enrollments_count)
-
-class UserForm(Form):
-    username = StringField('Username')
-    first_name = StringField('First Name')
-    last_name = StringField('Last Name')
-    role = SelectField('Role', choices=[('student', 'Student'), ('teacher', 'Teacher'), ('admin', 'Admin')])
-    password = PasswordField('Password', description='Leave blank to keep current password when editing')
-
-class UserModelView(ModelView):
-    def is_accessible(self):
-        return session.get('user_role') == 'admin'
-    
-    column_list = ['username', 'first_name', 'last_name', 'role']
-    form = UserForm
-    can_delete = True
-    page_size = 1000
-    action_disallowed_list = ['delete']  
-    
-    def on_model_change(self, form, model, is_created):
-        if hasattr(form, 'password') and form.password.data:
-            model.set_password(form.password.data)
-        elif is_created:
-            model.set_password('defaultpassword123')
-        
-        super(UserModelView, self).on_model_change(form, model, is_created)
-    
-    def delete_model(self, model):
-        try:
-            username = model.username
-            user_id = model.id
-            
-            courses_count = Course.query.filter_by(teacher_id=user_id).count()
-            enrollments_count = Enrollment.query.filter_by(student_id=user_id).count()
-            
-            db.session.execute(text("DELETE FROM enrollment WHERE student_id = :user_id"), {"user_id": user_id})
-            
-            db.session.execute(text("DELETE FROM enrollment WHERE course_id IN (SELECT id FROM course WHERE teacher_id = :user_id)"), {"user_id": user_id})
-            
-            db.session.execute(text("DELETE FROM course WHERE teacher_id = :user_id"), {"user_id": user_id})
-            
-            db.session.execute(text("DELETE FROM user WHERE id = :user_id"), {"user_id": user_id})
-            
-            db.session.commit()
-            
-            try:
-                if courses_count > 0 or enrollments_count > 0:
-                    flash(f'User "{username}" had {courses_count} courses and {enrollments_count} enrollments. These were also deleted.', 'warning')
-                flash(f'User "{username}" has been successfully deleted.', 'success')
-            except RuntimeError:
-                pass
-                
-            return True
-        except Exception as e:
-            db.session.rollback()
-            try:
-                flash(f'Error deleting user "{username}": {str(e)}', 'error')
-            except RuntimeError:
-                pass
-            return False
-
-class CourseModelView(ModelView):
-    def is_accessible(self):
-        return session.get('user_role') == 'admin'
-    
-    column_list = ['name', 'teacher', 'time', 'capacity']
-    form_columns = ['name', 'teacher_id', 'time', 'capacity']
-    action_disallowed_list = ['delete']
-    
-    column_formatters = {
-        'teacher': lambda v, c, m, p: f"{m.teacher.first_name} {m.teacher.last_name}" if m.teacher else 'N/A'
-    }
-    
-    form_overrides = {
-        'teacher_id': WTFSelectField
-    }
-    
-    def create_form(self):
-        form = super(CourseModelView, self).create_form()
-        teachers = User.query.filter_by(role='teacher').all()
-        form.teacher_id.choices = [(t.id, f"{t.first_name} {t.last_name} ({t.username})") for t in teachers]
-        return form
-    
-    def edit_form(self, obj):
-        form = super(CourseModelView, self).edit_form(obj)
-        teachers = User.query.filter_by(role='teacher').all()
-        form.teacher_id.choices = [(t.id, f"{t.first_name} {t.last_name} ({t.username})") for t in teachers]
-        return form
-
-class EnrollmentModelView(ModelView):
-    def is_accessible(self):
-        return session.get('user_role') == 'admin'
-    
-    column_list = ['student', 'course', 'grade', 'enrolled_date']
-    form_columns = ['student_id', 'course_id', 'grade']
-    action_disallowed_list = ['delete']
-    page_size = 1000
-    
-    column_formatters = {
-        'student': lambda v, c, m, p: f"{m.student.first_name} {m.student.last_name}" if m.student else 'N/A',
-        'course': lambda v, c, m, p: m.course.name if m.course else 'N/A',
-        'enrolled_date': lambda v, c, m, p: m.enrolled_date.strftime('%Y-%m-%d') if m.enrolled_date else 'N/A'
-    }
-    
-    form_overrides = {
-        'student_id': WTFSelectField,
-        'course_id': WTFSelectField
+class Waitlist(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), nullable=False)
+    joined_date = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    student = db.relationship('User', backref=db.backref('waitlist_entries', cascade='all, delete-orphan',
+                                                         passive_deletes=True))
+    course = db.relationship('Course', backref=db.backref('waitlist_entries', cascade='all, delete-orphan',
+                                                          passive_deletes=True))
+    
+    # Ids only grow, so (course_id, id) is the queue order for each course
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_waitlist'),
+        db.Index('ix_waitlist_course_id', 'course_id', 'id'),
+    )
+
+# Running grade aggregates, one row per course and per student, kept current
+# by apply_grade_changes() in every transaction that adds, removes or regrades
+# an enrollment (see grade_stats.py)
+class CourseStats(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), primary_key=True)
+    graded_count = db.Column(db.Integer, nullable=False, default=0)
+    grade_sum = db.Column(db.Integer, nullable=False, default=0)
+    grade_sum_squares = db.Column(db.Integer, nullable=False, default=0)
+    missing_count = db.Column(db.Integer, nullable=False, default=0)
+    bucket_a = db.Column(db.Integer, nullable=False, default=0)
+    bucket_b = db.Column(db.Integer, nullable=False, default=0)
+    bucket_c = db.Column(db.Integer, nullable=False, default=0)
+    bucket_d = db.Column(db.Integer, nullable=False, default=0)
+    bucket_f = db.Column(db.Integer, nullable=False, default=0)
+
+class StudentStats(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    graded_count = db.Column(db.Integer, nullable=False, default=0)
+    grade_sum = db.Column(db.Integer, nullable=False, default=0)
+    grade_points = db.Column(db.Integer, nullable=False, default=0)
+    missing_count = db.Column(db.Integer, nullable=False, default=0)
+
+def sync_enrolled_counts(course_ids=None):
+    """Recompute Course.enrolled_count from the enrollment table."""
+    seats = db.select(func.count(Enrollment.id)).where(Enrollment.course_id == Course.id).scalar_subquery()
+    stmt = db.update(Course).values(enrolled_count=seats)
+    if course_ids is not None:
+        stmt = stmt.where(Course.id.in_(course_ids))
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+def promote_waitlist(course_id, db_session=None):
+    """Move students from the front of a course's waitlist into its free seats.
+    
+    Runs in the caller's transaction and does not commit, so a seat released by
+    an unenroll or a capacity raise is handed on atomically. The first
+    statement writes the course row, which holds its lock (on SQLite, the
+    database write lock) until commit; concurrent promotions for the course
+    queue behind it and can never hand out the same seat. Calling it again
+    with no free seats or no one waiting changes nothing. Students whose
+    schedule now overlaps the course are passed over and keep their place.
+    Returns the promoted student ids in queue order.
+    """
+    if db_session is None:
+        db_session = db.session
+    
+    course = db_session.execute(
+        db.update(Course).where(Course.id == course_id).values(enrolled_count=Course.enrolled_count)
+        .returning((Course.capacity - Course.enrolled_count).label('free'),
+                   Course.meeting_days, Course.start_minute, Course.end_minute),
+        execution_options={'synchronize_session': False}
+    ).first()
+    if course is None or course.free <= 0:
+        return []
+    
+    enrolled = db.select(Enrollment.student_id).where(Enrollment.course_id == course_id)
+    waiting = db.select(Waitlist.student_id).where(Waitlist.course_id == course_id, Waitlist.student_id.not_in(enrolled))
+    if course.meeting_days:
+        taken = aliased(Course)
+        clash = db.select(Enrollment.id).join(taken, taken.id == Enrollment.course_id).where(
+            Enrollment.student_id == Waitlist.student_id,
+            taken.meeting_days.op('&')(course.meeting_days) != 0,
+            taken.start_minute < course.end_minute,
+            taken.end_minute > course.start_minute
+        )
+        waiting = waiting.where(~clash.exists())
+    promoted = db_session.execute(waiting.order_by(Waitlist.id).limit(course.free)).scalars().all()
+    
+    if promoted:
+        now = datetime.utcnow()
+        db_session.execute(db.insert(Enrollment), [
+            {'student_id': student_id, 'course_id': course_id, 'enrolled_date': now} for student_id in promoted
+        ])
+        apply_grade_changes(db_session, [(student_id, course_id, ABSENT, None) for student_id in promoted])
+        db_session.execute(
+            db.update(Course).where(Course.id == course_id).values(enrolled_count=Course.enrolled_count + len(promoted)),
+            execution_options={'synchronize_session': False}
+        )
+    # Promoted students, and any enrolled some other way meanwhile, leave the queue
+    db_session.execute(
+        db.delete(Waitlist).where(Waitlist.course_id == course_id, Waitlist.student_id.in_(enrolled)),
+        execution_options={'synchronize_session': False}
+    )
+    
+    return promoted
+
+def deletion_service():
+    """A DeletionService on the request session, deleting in batches of DELETE_CHUNK_SIZE (0 for one transaction)."""
+    return DeletionService(db.session, current_app.config['DELETE_CHUNK_SIZE'] or None, promote=promote_waitlist)
+
+def waitlist_position(student_id, course_id):
+    """1-based place of the student in the course's waitlist, or None if not waiting."""
+    entry = db.select(Waitlist.id).where(Waitlist.student_id == student_id, Waitlist.course_id == course_id).scalar_subquery()
+    position = db.session.execute(
+        db.select(func.count(Waitlist.id)).where(Waitlist.course_id == course_id, Waitlist.id <= entry)
+    ).scalar()
+    return position or None
+
+def parse_course_times():
+    """Fill every course's meeting columns from its time text."""
+    courses = db.session.execute(text("SELECT id, time FROM course")).all()
+    if courses:
+        db.session.execute(
+            text("UPDATE course SET meeting_days = :meeting_days, start_minute = :start_minute, "
+                 "end_minute = :end_minute WHERE id = :id"),
+            [dict(meeting_columns(time), id=course_id) for course_id, time in courses]
+        )
+
+def migrate_schema():
+    """Bring an existing enrollment.db up to date with the current models."""
+    columns = [c['name'] for c in inspect(db.engine).get_columns('course')]
+    if 'enrolled_count' not in columns:
+        db.session.execute(text("ALTER TABLE course ADD COLUMN enrolled_count INTEGER NOT NULL DEFAULT 0"))
+        sync_enrolled_counts()
+        db.session.commit()
+    
+    if 'meeting_days' not in columns:
+        for column in MEETING_COLUMNS:
+            db.session.execute(text(f"ALTER TABLE course ADD COLUMN {column} INTEGER"))
+        parse_course_times()
+        db.session.commit()
+    
+    # create_all() skips tables that already exist, so add any missing indexes
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    
+    # Fill the grade statistics tables the first time they appear
+    if not db.session.execute(db.select(CourseStats.course_id).limit(1)).first() and \
+            db.session.execute(db.select(Enrollment.id).limit(1)).first():
+        recompute_grade_stats(db.session)
+        db.session.commit()
+
+def load_catalog():
+    """Build the shared course catalog: every course with its teacher and seat count, and the teacher list."""
+    # The cache keeps whatever this returns until the next write, so never build it from a lagging replica
+    with primary_reads():
+        courses = Course.query.options(joinedload(Course.teacher)).order_by(Course.id).all()
+        teachers = User.query.filter_by(role='teacher').order_by(User.last_name, User.first_name).all()
+    
+    return {
+        'courses': [{
+            'id': c.id,
+            'name': c.name,
+            'teacher_id': c.teacher_id,
+            'teacher_name': c.teacher.get_full_name(),
+            'time': c.time,
+            'capacity': c.capacity,
+            'enrolled': c.enrolled_count
+        } for c in courses],
+        'teachers': [{
+            'id': t.id,
+            'name': t.get_full_name(),
+            'username': t.username
+        } for t in teachers]
     }
-    
-    def create_form(self):
-        form = super(EnrollmentModelView, self).create_form()
-        students = User.query.filter_by(role='student').all()
-        form.student_id.choices = [(s.id, f"{s.first_name} {s.last_name} ({s.username})") for s in students]
-        
-        courses = Course.query.all()
-        form.course_id.choices = [(c.id, f"{c.name} - {c.teacher.first_name} {c.teacher.last_name}") for c in courses]
-        
-        return form
-    
-    def edit_form(self, obj):
-        form = super(EnrollmentModelView, self).edit_form(obj)
-        students = User.query.filter_by(role='student').all()
-        form.student_id.choices = [(s.id, f"{s.first_name} {s.last_name} ({s.username})") for s in students]
-        
-        courses = Course.query.all()
-        form.course_id.choices = [(c.id, f"{c.name} - {c.teacher.first_name} {c.teacher.last_name}") for c in courses]
-        
-        return form
-
-admin = Admin(app, name='UC Merced Admin', index_view=SecureAdminIndexView())
-admin.add_view(UserModelView(User, db.session))
-admin.add_view(CourseModelView(Course, db.session))
-admin.add_view(EnrollmentModelView(Enrollment, db.session))
-
-@app.route('/')
-def index():
-    if 'user_id' in session:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
+
+def load_session_user(user_id):
+    with primary_reads():
+        return db.session.get(User, user_id)
+
+def load_identity():
+    # Refreshes or clears the session if an admin changed the user since login
+    g.identity = identity_cache.load(session)
+
+def hash_password(password):
+    """A hash of `password` in the configured format, made on the bounded hashing pool."""
+    return hashing_pool.run(password_policy.hash, password)
+
+def current_identity():
+    """The signed-in user as an Identity(id, username, role, name), read from the session; None if signed out."""
+    return g.get('identity')
+
+def limit_address(remote_addr):
+    """The address the per-IP rate limits key on; None while RATE_LIMIT_BY_IP is off."""
+    return remote_addr if current_app.config['RATE_LIMIT_BY_IP'] else None
+
+def mutation_limit_keys(identity, address):
+    """The (rule, key) buckets a JSON write is charged to: its IP address, if any, and, when signed in, its user."""
+    keys = [('ip', address)] if address is not None else []
+    if identity is not None:
+        keys.append(('session', identity.id))
+    return keys
+
+def idempotency_scope(identity, path):
+    return f"{identity.id if identity is not None else '-'}:{path}"
+
+RATE_LIMITED = {'success': False, 'message': 'Too many requests, please try again shortly'}
+
+def too_many_requests(wait):
+    response = jsonify(RATE_LIMITED)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response
+
+def guarded_write(view):
+    """Rate-limit a JSON write and answer a repeated Idempotency-Key from the stored response.
+    
+    A replay is answered before the rate limit is charged and never reaches
+    the view, so a double-click or a retry costs neither a token nor a query.
+    """
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        identity = current_identity()
+        key = request.headers.get('Idempotency-Key')
+        scope = idempotency_scope(identity, request.path) if key is not None else None
+        if scope is not None:
+            found = idempotency_cache.begin(scope, key, request.get_data())
+            if found is not None:
+                status, body = found
+                headers = {'Idempotent-Replayed': 'true'} if status < 300 else {}
+                return Response(body, status, headers, mimetype='application/json')
         
-        user = User.query.filter_by(username=username).first()
+        wait = rate_limiter.check(mutation_limit_keys(identity, limit_address(request.remote_addr)))
+        if wait:
+            if scope is not None:
+                idempotency_cache.release(scope, key)
+            return too_many_requests(wait)
         
-        if user and user.check_password(password):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['user_role'] = user.role
-            session['user_name'] = user.get_full_name()
-            return redirect(url_for('dashboard'))
-        else:
-            flash('Invalid username or password', 'error')
-    
-    return render_template('login.html')
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            if scope is not None:
+                idempotency_cache.release(scope, key)
+            raise
+        if scope is not None:
+            idempotency_cache.finish(scope, key, request.get_data(), response.status_code,
+                                     response.get_data(as_text=True))
+        return response
+    return guarded
 
-@app.route('/logout')
-def logout():
-    session.clear()
-    return redirect(url_for('login'))
+def mark_replica_writes(response):
+    # Until the replica has caught up with this write, the user's reads go to the primary
+    router = current_app.extensions.get('replica_router')
+    identity = current_identity()
+    if router is not None and identity is not None and g.get('db_wrote'):
+        router.mark_write(identity.id)
+    return response
 
-@app.route('/dashboard')
-def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    
-    if user.role == 'student':
-        return redirect(url_for('student_dashboard'))
-    elif user.role == 'teacher':
-        return redirect(url_for('teacher_dashboard'))
-    elif user.role == 'admin':
-        return redirect('/admin')
-    
-    return redirect(url_for('login'))
+def after_commit(effect, *args):
+    """Run `effect(*args)`, a write to the catalog or seat-event store, once the handler's transaction is done.
 
-@app.route('/student')
-def student_dashboard():
-    if session.get('user_role') != 'student':
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    enrolled_courses = db.session.query(Course, Enrollment).join(Enrollment).filter(
-        Enrollment.student_id == user.id
-    ).all()
-    
-    all_courses = Course.query.all()
-    
-    return render_template('student_dashboard.html', 
-                         enrolled_courses=enrolled_courses, 
-                         all_courses=all_courses)
+    Flask requests run it at once. The ASGI fast path collects them in
+    g.deferred_effects and runs them off the event loop, as those stores may
+    be SQLite files.
+    """
+    deferred = g.get('deferred_effects')
+    if deferred is None:
+        effect(*args)
+    else:
+        deferred.append((effect, args))
 
-@app.route('/teacher')
-def teacher_dashboard():
-    if session.get('user_role') != 'teacher':
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    courses = Course.query.filter_by(teacher_id=user.id).all()
-    
-    return render_template('teacher_dashboard.html', courses=courses)
+def run_deferred(effects):
+    for effect, args in effects:
+        effect(*args)
 
-@app.route('/api/enroll', methods=['POST'])
-def enroll_course():
-    if session.get('user_role') != 'student':
-        return jsonify({'success': False, 'message': 'Unauthorized'})
-    
-    course_id = request.json.get('course_id')
-    student_id = session['user_id']
-    
-    existing = Enrollment.query.filter_by(student_id=student_id, course_id=course_id).first()
-    if existing:
-        return jsonify({'success': False, 'message': 'Already enrolled in this course'})
-    
-    course = Course.query.get(course_id)
-    current_enrollments = Enrollment.query.filter_by(course_id=course_id).count()
-    
-    if current_enrollments >= course.capacity:
-        return jsonify({'success': False, 'message': 'Course is at capacity'})
-    
-    enrollment = Enrollment(student_id=student_id, course_id=course_id)
-    db.session.add(enrollment)
-    db.session.commit()
-    
-    return jsonify({'success': True, 'message': 'Successfully enrolled'})
+def publish_seats(course_ids):
+    """Push the current seat counts of the given courses to live dashboards."""
+    if not course_ids:
+        return
+    seat_broadcaster.publish(db.session.execute(
+        db.select(Course.id, Course.enrolled_count, Course.capacity).where(Course.id.in_(course_ids))
+    ).all())
 
-@app.route('/api/unenroll', methods=['POST'])
-def unenroll_course():
-    if session.get('user_role') != 'student':
-        return jsonify({'success': False, 'message': 'Unauthorized'})
-    
-    course_id = request.json.get('course_id')
-    student_id = session['user_id']
-    
-    enrollment = Enrollment.query.filter_by(student_id=student_id, course_id=course_id).first()
-    if not enrollment:
-        return jsonify({'success': False, 'message': 'Not enrolled in this course'})
-    
-    db.session.delete(enrollment)
-    db.session.commit()
-    
-    return jsonify({'success': True, 'message': 'Successfully removed from course'})
+def seat_delta(course_id, enrolled, capacity, is_enrolled, waitlist_position=None):
+    """The parts of the student dashboard that change when a seat is taken or released."""
+    if is_enrolled:
+        button = 'remove'
+    elif waitlist_position:
+        button = 'waitlisted'
+    elif enrolled < capacity:
+        button = 'add'
+    else:
+        button = 'full'
+    
+    return {
+        'course': {'id': course_id, 'enrolled': enrolled, 'capacity': capacity},
+        'enrollment': {'course_id': course_id, 'grade': None} if is_enrolled else None,
+        'waitlist_position': waitlist_position,
+        'button': button
+    }
 
-@app.route('/api/update_grade', methods=['POST'])
-def update_grade():
-    if session.get('user_role') != 'teacher':
-        return jsonify({'success': False, 'message': 'Unauthorized'})
-    
-    enrollment_id = request.json.get('enrollment_id')
-    grade = request.json.get('grade')
-    
-    enrollment = Enrollment.query.get(enrollment_id)
+# JSON API handlers. Each works in the SQLAlchemy session it is given, for the
+# caller's Identity, and returns the response body, so the Flask routes and the
+# async server in asgi.py run the same code.
+
+def enroll_student(db_session, identity, data):
+    if identity is None or identity.role != 'student':
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    try:
+        course_id = int(data.get('course_id'))
+    except (TypeError, ValueError, AttributeError):
+        return {'success': False, 'message': 'Course not found'}
+    student_id = identity.id
+    
+    # Claim a seat with one conditional UPDATE; concurrent requests serialize on
+    # the row so the counter can never pass the capacity. RETURNING hands back
+    # the new seat count in the same round trip.
+    claimed = db_session.execute(
+        db.update(Course)
+        .where(Course.id == course_id, Course.enrolled_count < Course.capacity)
+        .values(enrolled_count=Course.enrolled_count + 1)
+        .returning(Course.enrolled_count, Course.capacity, Course.meeting_days, Course.start_minute, Course.end_minute),
+        execution_options={'synchronize_session': False}
+    ).first()
+    
+    if not claimed:
+        db_session.rollback()
+        if db_session.execute(db.select(Enrollment.id).filter_by(student_id=student_id, course_id=course_id)).first():
+            return {'success': False, 'message': 'Already enrolled in this course'}
+        course = db_session.get(Course, course_id)
+        if not course:
+            return {'success': False, 'message': 'Course not found'}
+        return dict(seat_delta(course_id, course.enrolled_count, course.capacity, False),
+                    success=False, message='Course is at capacity')
+    
+    # Checked after the seat is claimed. The claim only holds this course's
+    # row, and two enrolls into different courses at clashing times would each
+    # pass the check, so the student's row is locked too: one student's
+    # enrolls then run one at a time. On SQLite the claim has already taken the
+    # database-wide write lock and FOR UPDATE is left out of the SELECT.
+    if claimed.meeting_days:
+        db_session.execute(db.select(User.id).where(User.id == student_id).with_for_update())
+        clashes = student_schedule(db_session, student_id, course_id).conflicts(
+            Meeting(claimed.meeting_days, claimed.start_minute, claimed.end_minute))
+        if clashes:
+            db_session.rollback()
+            return {'success': False, 'message': f'Schedule conflict with {clashes[0]}'}
+    
+    try:
+        db_session.add(Enrollment(student_id=student_id, course_id=course_id))
+        db_session.execute(
+            db.delete(Waitlist).where(Waitlist.student_id == student_id, Waitlist.course_id == course_id),
+            execution_options={'synchronize_session': False}
+        )
+        db_session.flush()
+        apply_grade_changes(db_session, [(student_id, course_id, ABSENT, None)])
+        db_session.commit()
+    except IntegrityError:
+        # unique_enrollment rejected a duplicate; the rollback also returns the seat
+        db_session.rollback()
+        return {'success': False, 'message': 'Already enrolled in this course'}
+    
+    after_commit(course_catalog.invalidate)
+    after_commit(seat_broadcaster.publish, [(course_id, claimed.enrolled_count, claimed.capacity)])
+    
+    return dict(seat_delta(course_id, claimed.enrolled_count, claimed.capacity, True),
+                success=True, message='Successfully enrolled')
+
+def unenroll_student(db_session, identity, data):
+    if identity is None or identity.role != 'student':
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    try:
+        course_id = int(data.get('course_id'))
+    except (TypeError, ValueError, AttributeError):
+        return {'success': False, 'message': 'Not enrolled in this course'}
+    student_id = identity.id
+    
+    removed = db_session.execute(
+        db.delete(Enrollment).where(Enrollment.student_id == student_id, Enrollment.course_id == course_id)
+        .returning(Enrollment.grade),
+        execution_options={'synchronize_session': False}
+    ).first()
+    if not removed:
+        db_session.rollback()
+        return {'success': False, 'message': 'Not enrolled in this course'}
+    apply_grade_changes(db_session, [(student_id, course_id, removed.grade, ABSENT)])
+    
+    released = db_session.execute(
+        db.update(Course).where(Course.id == course_id).values(enrolled_count=Course.enrolled_count - 1)
+        .returning(Course.enrolled_count, Course.capacity),
+        execution_options={'synchronize_session': False}
+    ).first()
+    # The freed seat goes to the head of the waitlist before anyone else can claim it
+    enrolled = released.enrolled_count + len(promote_waitlist(course_id, db_session))
+    db_session.commit()
+    after_commit(course_catalog.invalidate)
+    after_commit(seat_broadcaster.publish, [(course_id, enrolled, released.capacity)])
+    
+    return dict(seat_delta(course_id, enrolled, released.capacity, False),
+                success=True, message='Successfully removed from course')
+
+def set_grade(db_session, identity, data):
+    if identity is None or identity.role != 'teacher':
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    try:
+        enrollment = db_session.get(Enrollment, int(data.get('enrollment_id')))
+    except (TypeError, ValueError, AttributeError):
+        enrollment = None
     if not enrollment:
-        return jsonify({'success': False, 'message': 'Enrollment not found'})
+        return {'success': False, 'message': 'Enrollment not found'}
+    
+    course = db_session.get(Course, enrollment.course_id)
+    if course.teacher_id != identity.id:
+        return {'success': False, 'message': 'Unauthorized'}
     
-    course = Course.query.get(enrollment.course_id)
-    if course.teacher_id != session['user_id']:
-        return jsonify({'success': False, 'message': 'Unauthorized'})
+    try:
+        grade = parse_grade(data.get('grade'))
+    except ValueError:
+        return {'success': False, 'message': 'Invalid grade'}
     
+    apply_grade_changes(db_session, [(enrollment.student_id, enrollment.course_id, enrollment.grade, grade)])
     enrollment.grade = grade
-    db.session.commit()
+    db_session.commit()
     
-    return jsonify({'success': True, 'message': 'Grade updated'})
+    return {'success': True, 'message': 'Grade updated'}
 
-@app.route('/api/course/<int:course_id>/students')
-def get_course_students(course_id):
-    if session.get('user_role') != 'teacher':
-        return jsonify({'success': False, 'message': 'Unauthorized'})
-    
-    course = Course.query.get(course_id)
-    if not course or course.teacher_id != session['user_id']:
-        return jsonify({'success': False, 'message': 'Unauthorized'})
+ROSTER_PAGE_SIZE = 100
+ROSTER_MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+def course_roster(db_session, identity, course_id, args):
+    """One page of a course's students; `args` holds the query parameters as a MultiDict."""
+    if identity is None or identity.role != 'teacher':
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    course = db_session.get(Course, course_id)
+    if not course or course.teacher_id != identity.id:
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    sort = args.get('sort', 'name')
+    order = args.get('order', 'asc')
+    if sort not in ('name', 'grade') or order not in ('asc', 'desc'):
+        return {'success': False, 'message': 'Invalid sort order'}
+    
+    limit = max(1, min(args.get('limit', ROSTER_PAGE_SIZE, type=int), ROSTER_MAX_PAGE_SIZE))
+    min_grade = args.get('min_grade', type=int)
+    max_grade = args.get('max_grade', type=int)
+    
+    # Keyset pagination: every page seeks past the last row of the previous one,
+    # so a deep page costs the same as the first. Enrollment.id breaks ties.
+    sort_key = [User.last_name, User.first_name, Enrollment.id]
+    if sort == 'grade':
+        sort_key.insert(0, func.coalesce(Enrollment.grade, -1))
+    
+    query = db_session.query(Enrollment.id, Enrollment.grade, User.first_name, User.last_name, *sort_key).join(
+        User, Enrollment.student_id == User.id
+    ).filter(Enrollment.course_id == course_id)
+    
+    if min_grade is not None:
+        query = query.filter(Enrollment.grade >= min_grade)
+    if max_grade is not None:
+        query = query.filter(Enrollment.grade <= max_grade)
+    
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return {'success': False, 'message': 'Invalid cursor'}
+        if not isinstance(after, list) or len(after) != len(sort_key):
+            return {'success': False, 'message': 'Invalid cursor'}
+        
+        if order == 'asc':
+            query = query.filter(tuple_(*sort_key) > tuple_(*after))
+        else:
+            query = query.filter(tuple_(*sort_key) < tuple_(*after))
     
-    enrollments = db.session.query(Enrollment, User).join(User).filter(
-        Enrollment.course_id == course_id
-    ).all()
+    query = query.order_by(*[key.desc() if order == 'desc' else key for key in sort_key])
+    rows = query.limit(limit + 1).all()
     
     students = []
-    for enrollment, user in enrollments:
+    for row in rows[:limit]:
         students.append({
-            'id': enrollment.id,
-            'name': user.get_full_name(),
-            'grade': enrollment.grade
+            'id': row[0],
+            'name': f"{row[2]} {row[3]}",
+            'grade': row[1]
         })
     
-    return jsonify({'success': True, 'students': students})
+    next_cursor = encode_cursor(list(rows[limit - 1][4:])) if len(rows) > limit else None
+    
+    return {'success': True, 'students': students, 'next_cursor': next_cursor}
 
-if __name__ == '__main__':
+GRADEBOOK_COLUMNS = ['enrollment_id', 'student_id', 'username', 'first_name', 'last_name', 'grade', 'enrolled_date']
+ENROLLMENT_EXPORT_COLUMNS = ['enrollment_id', 'course_id', 'course', 'time', 'teacher', 'student_id', 'username',
+                             'first_name', 'last_name', 'grade', 'enrolled_date']
+
+def export_format_error():
+    return jsonify({'success': False, 'message': f'Unknown format, choose one of: {", ".join(EXPORT_FORMATS)}'}), 400
+
+def create_app(config=None):
+    """Build the Flask application; `config` overrides the settings from load_config().
+    
+    Flask-Admin, and the WTForms scaffolding behind it, is imported and
+    registered only when ADMIN_ENABLED is set, so a worker that only serves
+    students, teachers and the JSON API starts without it.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_PROFILE']))
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                                x_proto=app.config['TRUSTED_PROXIES'])
+    
+    db.init_app(app)
     with app.app_context():
-        db.create_all()
-        
-        if User.query.count() == 0:
-            admin = User(username='admin', role='admin', first_name='Admin', last_name='User')
-            admin.set_password('admin123')
-            db.session.add(admin)
-            
-            teachers_data = [
-                ('ahepworth', 'Ammon', 'Hepworth', 'teacher123'),
-                ('swalker', 'Susan', 'Walker', 'teacher123'),
-                ('rjenkins', 'Ralph', 'Jenkins', 'teacher123')
-            ]
-            
-            for username, first, last, password in teachers_data:
-                teacher = User(username=username, role='teacher', first_name=first, last_name=last)
-                teacher.set_password(password)
-                db.session.add(teacher)
-            
-            students_data = [
-                ('cnorris', 'Chuck', 'Norris', 'student123'),
-                ('mnorris', 'Mindy', 'Norris', 'student123'),
-                ('aranganath', 'Aditya', 'Ranganath', 'student123'),
-                ('nlittle', 'Nancy', 'Little', 'student123'),
-                ('ychen', 'Yi Wen', 'Chen', 'student123'),
-                ('jstuart', 'John', 'Stuart', 'student123'),
-                ('jsantos', 'Jose', 'Santos', 'student123'),
-                ('bbrown', 'Betty', 'Brown', 'student123'),
-                ('lcheng', 'Li', 'Cheng', 'student123'),
-                ('mgarcia', 'Michael', 'Garcia', 'student123'),
-                ('ewhite', 'Emily', 'White', 'student123'),
-                ('rjohnson', 'Robert', 'Johnson', 'student123'),
-                ('amartinez', 'Anna', 'Martinez', 'student123'),
-                ('tkim', 'Thomas', 'Kim', 'student123'),
-                ('jwilson', 'Jessica', 'Wilson', 'student123'),
-                ('dclark', 'Daniel', 'Clark', 'student123'),
-                ('smoore', 'Sophia', 'Moore', 'student123'),
-                ('ataylor', 'Alex', 'Taylor', 'student123'),
-                ('mhughes', 'Maya', 'Hughes', 'student123'),
-                ('cwright', 'Chris', 'Wright', 'student123')
-            ]
-            
-            for username, first, last, password in students_data:
-                student = User(username=username, role='student', first_name=first, last_name=last)
-                student.set_password(password)
-                db.session.add(student)
-            
-            db.session.commit()
-            
-            courses_data = [
-                ('Math 101', 4, 'MWF 10:00-10:50 AM', 8),  # Ralph Jenkins (ID 4)
-                ('Physics 121', 3, 'TR 11:00-11:50 AM', 10),  # Susan Walker (ID 3)
-                ('CS 106', 2, 'MWF 2:00-2:50 PM', 10),  # Ammon Hepworth (ID 2)
-                ('CS 162', 2, 'TR 3:00-3:50 PM', 4)  # Ammon Hepworth (ID 2)
-            ]
-            
-            for name, teacher_id, time, capacity in courses_data:
-                course = Course(name=name, teacher_id=teacher_id, time=time, capacity=capacity)
-                db.session.add(course)
-            
-            db.session.commit()
-            
-            enrollments_data = [
-                # Math 101 (ID 1) - Ralph Jenkins
-                (7, 1, 92), (8, 1, 65), (6, 1, 86), (9, 1, 77),
-                # Physics 121 (ID 2) - Susan Walker
-                (4, 2, 53), (9, 2, 85), (2, 2, 94), (6, 2, 91), (8, 2, 88),
-                # CS 106 (ID 3) - Ammon Hepworth
-                (3, 3, 93), (5, 3, 85), (4, 3, 57), (2, 3, 68),
-                # CS 162 (ID 4) - Ammon Hepworth
-                (3, 4, 99), (4, 4, 87), (5, 4, 92), (6, 4, 67)
-            ]
-            
-            for student_id, course_id, grade in enrollments_data:
-                enrollment = Enrollment(student_id=student_id, course_id=course_id, grade=grade)
-                db.session.add(enrollment)
-            
-            db.session.commit()
-    
-    app.run(debug=True, port=5001)
+        install_sqlite_pragmas(db.engine, sqlite_pragmas(app.config['DB_PROFILE']))
+        replica_router = make_replica_router(app.config, db.engine.url)
+    if replica_router is not None:
+        app.extensions['replica_router'] = replica_router
+        replica_router.replica.start()
+    
+    if app.config['METRICS_ENABLED']:
+        Instrumentation(app, db)
+    
+    app.extensions['password_policy'] = PasswordPolicy(app.config['PASSWORD_HASH_METHOD'])
+    app.extensions['hashing_pool'] = make_hashing_pool(app.config['PASSWORD_HASH_WORKERS'],
+                                                       app.config['PASSWORD_HASH_QUEUE'],
+                                                       app.config['PASSWORD_HASH_TIMEOUT'])
+    app.extensions['course_catalog'] = CatalogCache(load_catalog, backend=make_backend(app.config['CATALOG_STORE']))
+    app.extensions['seat_broadcaster'] = SeatBroadcaster(backend=make_event_backend(app.config['SEAT_EVENTS_STORE']))
+    app.extensions['identity_cache'] = IdentityCache(load_session_user,
+                                                     backend=make_identity_backend(app.config['IDENTITY_STORE']))
+    if app.config['RATE_LIMIT_ENABLED']:
+        app.extensions['rate_limiter'] = RateLimiter(
+            {'session': app.config['RATE_LIMIT_SESSION'], 'ip': app.config['RATE_LIMIT_IP'],
+             'login': app.config['RATE_LIMIT_LOGIN']},
+            backend=make_bucket_backend(app.config['RATE_LIMIT_STORE'])
+        )
+    else:
+        app.extensions['rate_limiter'] = NoRateLimit()
+    app.extensions['idempotency_cache'] = IdempotencyCache(make_idempotency_backend(app.config['IDEMPOTENCY_STORE']),
+                                                           ttl=app.config['IDEMPOTENCY_TTL'])
+    app.before_request(reset_routing)
+    app.before_request(load_identity)
+    app.after_request(mark_replica_writes)
+    
+    from blueprints import api, auth, student, teacher
+    from commands import register_commands
+    for blueprint in (auth.bp, student.bp, teacher.bp, api.bp):
+        app.register_blueprint(blueprint)
+    register_commands(app)
+    
+    if app.config['ADMIN_ENABLED']:
+        from blueprints.admin import init_admin
+        init_admin(app)
+    
+    return app
+
+def __getattr__(name):
+    # The module-level `app` (for `flask --app app`, WSGI servers and the
+    # tests) is built on first use, so importing the models alone does not
+    # build an application.
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == '__main__':
+    # Go through the importable module, whose models the blueprints share
+    import app as app_module
+    
+    application = app_module.create_app()
+    with application.app_context():
+        app_module.db.create_all()
+        app_module.migrate_schema()
+        if app_module.User.query.first() is None:
+            print('The database is empty; run "flask --app app seed-demo" to load the demo accounts')
+    
+    application.run(debug=True, port=5001)
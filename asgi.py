@@ -0,0 +1,348 @@
+"""
+ASGI entry point for the UC Merced Enrollment System
+
+The short JSON calls students and teachers make most often are served on
+the event loop with async database access:
+
+    POST /api/enroll
+    POST /api/unenroll
+    POST /api/update_grade
+    GET  /api/course/<id>/students
+
+They run the same handlers as the Flask routes in app.py, through
+SQLAlchemy's asyncio extension (aiosqlite for SQLite, asyncpg for
+PostgreSQL). The caller's identity comes from the Flask session cookie.
+Every other request, including the templates and Flask-Admin, is handed to
+the Flask app unchanged, on a pool of WSGI_THREADS threads. So is any fast-path request whose session must
+first be refreshed after an admin changed the user. The writes are rate
+limited and honour Idempotency-Key like the Flask routes, with the same
+buckets and stored responses.
+
+When any of the shared stores (IDENTITY_STORE, RATE_LIMIT_STORE,
+IDEMPOTENCY_STORE, CATALOG_STORE, SEAT_EVENTS_STORE, REPLICA_STICKY_STORE)
+is set, their synchronous calls run in the loop's default executor, never on
+the event loop itself. With METRICS_ENABLED the fast path is recorded under
+the Flask endpoint names (api.enroll_course and so on). The Flask
+before_request hooks do not run here: the identity comes from the cookie
+alone, and roster reads always use the primary, not the replica.
+
+    uvicorn asgi:application --port 5001
+    python serve_asgi.py                   # production launcher settings
+
+Needs the packages in requirements-asgi.txt.
+"""
+
+import asyncio
+import functools
+import json
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import g
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+
+from auth import Identity
+from db_profile import engine_options, install_sqlite_pragmas, sqlite_pragmas
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def async_database_url(url):
+    """The async-driver equivalent of a synchronous SQLAlchemy URL."""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for "{backend}" databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+SHARED_STORES = ('IDENTITY_STORE', 'RATE_LIMIT_STORE', 'IDEMPOTENCY_STORE', 'CATALOG_STORE', 'SEAT_EVENTS_STORE',
+                 'REPLICA_STICKY_STORE')
+
+
+class ClientGone(Exception):
+    """The client went away while a Flask response was still being written."""
+
+
+class PooledWsgi(WsgiToAsgi):
+    """WsgiToAsgi on a sized thread pool.
+
+    WsgiToAsgi alone runs every request on one shared thread, so a single open
+    seat stream or slow login would hold up every other Flask page.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        instance = PooledWsgiInstance(self.wsgi_application, self.executor, self.duplicate_header_limit)
+        await instance(scope, receive, send)
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+        self.disconnected = False
+
+    async def __call__(self, scope, receive, send):
+        self.receive = receive
+
+        # Servers drop what is sent after a disconnect, so a stream would run on forever
+        async def checked_send(message):
+            if self.disconnected:
+                raise ClientGone()
+            await send(message)
+        await super().__call__(scope, receive, checked_send)
+
+    async def watch_disconnect(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+        self.disconnected = True
+
+    async def run_wsgi_app(self, body):
+        watcher = asyncio.ensure_future(self.watch_disconnect())
+        try:
+            # The parent's method wrapped in a thread-sensitive sync_to_async; rewrap the function itself
+            run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+            await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+        except ClientGone:
+            pass
+        finally:
+            watcher.cancel()
+
+
+def _json_body(endpoint, handler):
+    async def call(api, scope, body, identity):
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            return 400, {'success': False, 'message': 'Request body must be JSON'}, []
+        payload, effects = await api.run(endpoint, handler, identity, data if isinstance(data, dict) else {})
+        return 200, payload, effects
+    return call
+
+
+def _roster(endpoint, handler):
+    async def call(api, scope, body, identity, course_id):
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        payload, effects = await api.run(endpoint, handler, identity, int(course_id), args)
+        return 200, payload, effects
+    return call
+
+
+class AsyncApi:
+    """ASGI application: the hot JSON routes natively async, everything else through Flask."""
+
+    def __init__(self, app_module):
+        flask_app = app_module.app
+        self.flask_app = flask_app
+        self.wsgi = PooledWsgi(flask_app, flask_app.config['WSGI_THREADS'])
+        self.identity_cache = flask_app.extensions['identity_cache']
+        self.rate_limiter = flask_app.extensions['rate_limiter']
+        self.idempotency_cache = flask_app.extensions['idempotency_cache']
+        self.app_module = app_module
+        self.session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.session_cookie = flask_app.config['SESSION_COOKIE_NAME']
+        self.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        # In-memory stores answer in microseconds; only file or server stores are worth a thread hop
+        self.offload = any(flask_app.config.get(name) for name in SHARED_STORES)
+        self.instrumentation = flask_app.extensions.get('instrumentation')
+        self.limit_by_ip = flask_app.config['RATE_LIMIT_BY_IP']
+        self.trusted_proxies = flask_app.config['TRUSTED_PROXIES']
+
+        with flask_app.app_context():
+            url = app_module.db.engine.url
+        profile = flask_app.config['DB_PROFILE']
+        self.engine = create_async_engine(async_database_url(url), **engine_options(url, profile))
+        install_sqlite_pragmas(self.engine.sync_engine, sqlite_pragmas(profile))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        if self.instrumentation is not None:
+            self.instrumentation.watch(self.engine.sync_engine)
+
+        self.routes = [
+            ('POST', re.compile(r'/api/enroll$'), _json_body('api.enroll_course', app_module.enroll_student)),
+            ('POST', re.compile(r'/api/unenroll$'), _json_body('api.unenroll_course', app_module.unenroll_student)),
+            ('POST', re.compile(r'/api/update_grade$'), _json_body('api.update_grade', app_module.set_grade)),
+            ('GET', re.compile(r'/api/course/(\d+)/students$'),
+             _roster('api.get_course_students', app_module.course_roster)),
+        ]
+
+    async def run(self, endpoint, handler, *args):
+        """(result, deferred effects) of `handler`; the catalog and seat-event writes are left to the caller."""
+        async with self.sessions() as session:
+            return await session.run_sync(self.call_in_app_context, endpoint, handler, *args)
+
+    def call_in_app_context(self, db_session, endpoint, handler, *args):
+        with self.flask_app.app_context():
+            g.deferred_effects = []
+            if self.instrumentation is not None:
+                self.instrumentation.begin()
+            try:
+                result = handler(db_session, *args)
+            finally:
+                if self.instrumentation is not None:
+                    self.instrumentation.end(endpoint)
+            return result, g.deferred_effects
+
+    async def blocking(self, fn, *args):
+        """fn(*args), in the default executor when it may wait on a shared store."""
+        if not self.offload:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+    def run_effects(self, effects):
+        with self.flask_app.app_context():
+            self.app_module.run_deferred(effects)
+
+    def identity(self, scope):
+        """(served here, Identity or None) from the session cookie, without touching the database."""
+        cookies = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookies.load(value.decode('latin-1'))
+        if self.session_cookie not in cookies:
+            return True, None
+
+        try:
+            data = self.session_serializer.loads(cookies[self.session_cookie].value, max_age=self.session_max_age)
+        except Exception:
+            return True, None
+        if 'user_id' not in data:
+            return True, None
+
+        # A stale session is refreshed, or cleared, by Flask
+        if data.get('identity_revision', 0) != self.identity_cache.backend.get_revision(data['user_id']):
+            return False, None
+        return True, Identity(data['user_id'], data.get('username'), data.get('user_role'), data.get('user_name'))
+
+    def client_address(self, scope):
+        """The address the per-IP limits key on, the same one ProxyFix gives Flask; None while they are off."""
+        if not self.limit_by_ip:
+            return None
+        address = (scope.get('client') or ('',))[0]
+        forwarded = [value.decode('latin-1') for name, value in scope.get('headers', []) if name == b'x-forwarded-for']
+        hops = ','.join(forwarded).split(',')
+        if self.trusted_proxies and forwarded and len(hops) >= self.trusted_proxies:
+            address = hops[-self.trusted_proxies].strip()
+        return address
+
+    def match(self, scope):
+        for method, pattern, handler in self.routes:
+            found = pattern.match(scope['path'])
+            if found and scope['method'] == method:
+                return handler, found.groups()
+        return None, ()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler, params = self.match(scope) if scope['type'] == 'http' else (None, ())
+        if handler is not None:
+            served, identity = await self.blocking(self.identity, scope)
+            if served:
+                body = await self.read_body(receive)
+                if scope['method'] == 'POST':
+                    return await self.guarded_write(scope, send, body, identity, handler, params)
+                status, payload, effects = await handler(self, scope, body, identity, *params)
+                if effects:
+                    await self.blocking(self.run_effects, effects)
+                return await self.respond(send, status, payload)
+
+        return await self.wsgi(scope, receive, send)
+
+    async def guarded_write(self, scope, send, body, identity, handler, params):
+        """What guarded_write() does for the Flask routes: the same buckets and the same stored responses."""
+        key = None
+        for name, value in scope.get('headers', []):
+            if name == b'idempotency-key':
+                key = value.decode('latin-1')
+        address = self.client_address(scope)
+        idempotency_scope, early = await self.blocking(self.admit, identity, scope['path'], key, body, address)
+        if early is not None:
+            return await self.respond_body(send, *early)
+
+        try:
+            status, payload, effects = await handler(self, scope, body, identity, *params)
+        except BaseException:
+            if idempotency_scope is not None:
+                await self.blocking(self.idempotency_cache.release, idempotency_scope, key)
+            raise
+        response = json.dumps(payload).encode()
+        await self.blocking(self.complete, identity, idempotency_scope, key, body, status, response, effects)
+        return await self.respond_body(send, status, response)
+
+    def admit(self, identity, path, key, body, address):
+        """(idempotency scope, (status, body, headers) to answer with instead, or None) for a write."""
+        idempotency_scope = self.app_module.idempotency_scope(identity, path) if key is not None else None
+        if idempotency_scope is not None:
+            found = self.idempotency_cache.begin(idempotency_scope, key, body)
+            if found is not None:
+                status, stored = found
+                headers = [(b'idempotent-replayed', b'true')] if status < 300 else []
+                return idempotency_scope, (status, stored.encode(), headers)
+
+        wait = self.rate_limiter.check(self.app_module.mutation_limit_keys(identity, address))
+        if wait:
+            if idempotency_scope is not None:
+                self.idempotency_cache.release(idempotency_scope, key)
+            return idempotency_scope, (429, json.dumps(self.app_module.RATE_LIMITED).encode(),
+                                       [(b'retry-after', str(math.ceil(wait)).encode())])
+        return idempotency_scope, None
+
+    def complete(self, identity, idempotency_scope, key, body, status, response, effects):
+        self.run_effects(effects)
+        # Same read-your-writes mark the Flask routes leave
+        router = self.flask_app.extensions.get('replica_router')
+        if router is not None and identity is not None:
+            router.mark_write(identity.id)
+        if idempotency_scope is not None:
+            self.idempotency_cache.finish(idempotency_scope, key, body, status, response.decode())
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def respond(self, send, status, payload, headers=()):
+        await self.respond_body(send, status, json.dumps(payload).encode(), headers)
+
+    async def respond_body(self, send, status, body, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        *headers]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.wsgi.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(app_module=None):
+    """Build the ASGI application around the Flask app that app.py builds on first use."""
+    if app_module is None:
+        import app as app_module
+    return AsyncApi(app_module)
+
+
+application = create_asgi_app()
@@ -0,0 +1,175 @@
+"""
+Password hashing and session identity for the UC Merced Enrollment System
+
+PasswordPolicy names the hash method used for new passwords. A stored hash
+made with different parameters still verifies, and reports that it needs
+rehashing, so raising the work factor takes effect as users log in.
+
+HashingPool runs hashing on a fixed number of worker threads with a bounded
+queue. During a login storm at most that many hashes burn CPU at once, and
+requests beyond the queue are turned away instead of starving every other
+request thread.
+
+IdentityCache lets each request trust the identity stored in the session
+without reading the user row. It keeps a revision number per user that is
+bumped whenever an admin edits or deletes that user; a session holding an
+older revision is reloaded from the database once. As with the catalog
+cache, MemoryIdentityBackend is private to one process and
+SqliteIdentityBackend shares revisions between workers through a local file.
+"""
+
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+Identity = namedtuple('Identity', ['id', 'username', 'role', 'name'])
+
+
+class PasswordPolicy:
+    """Hashes new passwords with `method` and spots hashes made with anything else."""
+
+    def __init__(self, method=DEFAULT_HASH_METHOD):
+        self.method = method
+
+    @cached_property
+    def prefix(self):
+        # Expand shorthands such as "pbkdf2" to the full parameter string
+        # werkzeug writes into the hash, e.g. "pbkdf2:sha256:600000".
+        return generate_password_hash('', method=self.method, salt_length=1).split('$', 1)[0]
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, password_hash, password):
+        return check_password_hash(password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.prefix
+
+
+class PoolBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+class HashingPool:
+    """Runs password hashing on `workers` threads, queueing at most `queue_limit` more calls."""
+
+    def __init__(self, workers, queue_limit=32, timeout=5):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise PoolBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+
+class InlineHashing:
+    """Stand-in for HashingPool that hashes on the request thread."""
+
+    rejected = 0
+
+    def run(self, fn, *args):
+        return fn(*args)
+
+
+def make_hashing_pool(workers, queue_limit, timeout):
+    """Pick a pool from PASSWORD_HASH_WORKERS: 0 hashes inline on the request thread."""
+    if workers <= 0:
+        return InlineHashing()
+    return HashingPool(workers, queue_limit, timeout)
+
+
+class MemoryIdentityBackend:
+    """Keeps user revisions in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revisions = {}
+
+    def get_revision(self, user_id):
+        return self._revisions.get(user_id, 0)
+
+    def bump_revision(self, user_id):
+        with self._lock:
+            self._revisions[user_id] = self._revisions.get(user_id, 0) + 1
+
+
+class SqliteIdentityBackend:
+    """Shares user revisions between processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS identity '
+                         '(user_id INTEGER PRIMARY KEY, revision INTEGER NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get_revision(self, user_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT revision FROM identity WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_revision(self, user_id):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO identity (user_id, revision) VALUES (?, 1) '
+                         'ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1', (user_id,))
+
+
+def make_identity_backend(store):
+    """Pick a backend from the IDENTITY_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryIdentityBackend()
+    return SqliteIdentityBackend(store)
+
+
+class IdentityCache:
+    """Serves the signed-in user from the session until an admin changes that user."""
+
+    def __init__(self, loader, backend=None):
+        self.loader = loader
+        self.backend = backend or MemoryIdentityBackend()
+        self.reloads = 0
+
+    def remember(self, session, user, revision=None):
+        session['user_id'] = user.id
+        session['username'] = user.username
+        session['user_role'] = user.role
+        session['user_name'] = user.get_full_name()
+        session['identity_revision'] = self.backend.get_revision(user.id) if revision is None else revision
+
+    def load(self, session):
+        """The session's Identity, reloading it if the user changed; None when signed out or deleted."""
+        user_id = session.get('user_id')
+        if user_id is None:
+            return None
+
+        # Read the revision before the user so a change that lands mid-reload
+        # leaves the session outdated rather than wrongly current.
+        revision = self.backend.get_revision(user_id)
+        if session.get('identity_revision', 0) != revision:
+            self.reloads += 1
+            user = self.loader(user_id)
+            if user is None:
+                session.clear()
+                return None
+            self.remember(session, user, revision)
+
+        return Identity(user_id, session.get('username'), session.get('user_role'), session.get('user_name'))
+
+    def invalidate(self, user_id):
+        self.backend.bump_revision(user_id)
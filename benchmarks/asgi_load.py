@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+JSON API throughput under the WSGI and ASGI servers
+
+Seeds a synthetic campus (see campus.py) and starts the app twice: under
+the threaded Werkzeug server, and under uvicorn serving asgi.py. For each
+server, many concurrent keep-alive clients hit the JSON API:
+
+    roster   GET /api/course/<id>/students as the course's teacher
+    enroll   POST /api/enroll then /api/unenroll as a student
+
+Clients carry signed session cookies, so no login traffic is mixed in. The
+JSON report gives requests per second and latency percentiles for each
+server.
+
+    python benchmarks/asgi_load.py --clients 500 --duration 10 --output asgi.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import campus
+from run_benchmarks import free_port, load_population, percentile, git_commit
+
+MIXES = {
+    'roster': {'roster': 1},
+    'enroll': {'enroll': 1},
+    'mixed': {'roster': 3, 'enroll': 1}
+}
+
+
+def server_command(kind, port, workers, keepalive):
+    if kind == 'wsgi':
+        return [sys.executable, '-c', f'import app; app.app.run(port={port}, threaded=True)']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port), '--workers', str(workers),
+            '--timeout-keep-alive', str(keepalive), '--backlog', '2048', '--log-level', 'warning',
+            '--no-access-log']
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, reopened after errors or Connection: close."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, cookie, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', f'Cookie: {cookie}', f'Content-Length: {len(body)}']
+        if payload is not None:
+            head.append('Content-Type: application/json')
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def client(index, port, population, cookies, mix, results, recording, stop):
+    users, teacher_courses, all_courses = population
+    rng = random.Random(index)
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    student = users['student'][index % len(users['student'])]
+    teacher = users['teacher'][index % len(users['teacher'])]
+    connection = Connection(port)
+
+    async def timed(label, method, path, cookie, payload=None):
+        started = time.perf_counter()
+        try:
+            status = await connection.request(method, path, cookie, payload)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            connection.close()
+            status = None
+        if recording.is_set():
+            if status == 200:
+                results[label].append((time.perf_counter() - started) * 1000)
+            else:
+                results['errors'][label] = results['errors'].get(label, 0) + 1
+
+    while not stop.is_set():
+        if rng.choices(scenarios, weights=weights)[0] == 'roster':
+            course_id = rng.choice(teacher_courses[teacher['id']])
+            await timed('get_course_students', 'GET', f'/api/course/{course_id}/students', cookies[teacher['id']])
+        else:
+            course_id = rng.choice(all_courses)
+            await timed('enroll_course', 'POST', '/api/enroll', cookies[student['id']], {'course_id': course_id})
+            await timed('unenroll_course', 'POST', '/api/unenroll', cookies[student['id']], {'course_id': course_id})
+    connection.close()
+
+
+def summarize(latencies, errors, duration):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput_rps': round(len(ordered) / duration, 1),
+        'p50_ms': round(percentile(ordered, 50), 2),
+        'p95_ms': round(percentile(ordered, 95), 2),
+        'p99_ms': round(percentile(ordered, 99), 2)
+    }
+
+
+async def load(port, population, cookies, args):
+    await wait_for_port(port)
+    results = {'get_course_students': [], 'enroll_course': [], 'unenroll_course': [], 'errors': {}}
+    recording, stop = asyncio.Event(), asyncio.Event()
+    tasks = [asyncio.create_task(client(i, port, population, cookies, MIXES[args.mix], results, recording, stop))
+             for i in range(args.clients)]
+
+    await asyncio.sleep(args.warmup)
+    recording.set()
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recording.clear()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    endpoints = {label: summarize(results[label], results['errors'].get(label, 0), elapsed)
+                 for label in ('get_course_students', 'enroll_course', 'unenroll_course') if results[label]}
+    everything = [ms for label in endpoints for ms in results[label]]
+    return {'endpoints': endpoints, 'total': summarize(everything, sum(results['errors'].values()), elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON API throughput under WSGI and ASGI.')
+    parser.add_argument('--clients', type=int, default=500, help='Concurrent clients (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to record (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds before recording (default: %(default)s)')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (default: %(default)s)')
+    parser.add_argument('--keepalive', type=int, default=5, help='uvicorn keep-alive seconds (default: %(default)s)')
+    parser.add_argument('--servers', default='wsgi,asgi', help='Servers to run, in order (default: %(default)s)')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    campus.add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    spec = campus.spec_from_args(args)
+    db_path = os.path.join(tempfile.mkdtemp(), 'campus.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Every virtual user comes from one address; measure the app, not the rate limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import app
+
+    with app.app.app_context():
+        app.db.create_all()
+        seeded = campus.seed(app.db, spec)
+
+    population = load_population(db_path)
+    serializer = app.app.session_interface.get_signing_serializer(app.app)
+    cookies = {}
+    for role in ('student', 'teacher'):
+        for user in population[0][role]:
+            cookies[user['id']] = 'session=' + serializer.dumps(
+                {'user_id': user['id'], 'username': user['username'], 'user_role': role})
+
+    servers = {}
+    for kind in args.servers.split(','):
+        port = free_port()
+        server = subprocess.Popen(server_command(kind, port, args.workers, args.keepalive), cwd=ROOT,
+                                  env=dict(os.environ), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            servers[kind] = asyncio.run(load(port, population, cookies, args))
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'schema_version': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'clients': args.clients,
+        'mix': args.mix,
+        'duration_s': args.duration,
+        'asgi_workers': args.workers,
+        'campus': dict(spec, seeded=seeded),
+        'servers': servers
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Cold start of a worker process
+
+Starts fresh interpreters that import app.py, build the app with
+create_app() and serve one request through the test client, with the admin
+site on and off. The report gives the median milliseconds spent in each
+step, the time to the first response, and how many modules were loaded.
+
+    python benchmarks/cold_start.py --runs 10 --output cold_start.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+flask_app = app_module.create_app()
+with flask_app.app_context():
+    app_module.db.create_all()
+created = time.perf_counter()
+status = flask_app.test_client().get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'total_ms': (served - started) * 1000,
+                  'status': status, 'modules': len(sys.modules), 'admin_loaded': 'flask_admin' in sys.modules}))
+'''
+
+
+def measure(admin_enabled):
+    """One cold start in a fresh interpreter, against its own empty database."""
+    db_path = os.path.join(tempfile.mkdtemp(), 'cold.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', METRICS_ENABLED='0',
+               ADMIN_ENABLED='1' if admin_enabled else '0')
+    output = subprocess.run([sys.executable, '-c', START_SCRIPT], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    summary = {key: round(statistics.median(run[key] for run in runs), 1)
+               for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms')}
+    summary.update(modules=runs[-1]['modules'], admin_loaded=runs[-1]['admin_loaded'], runs=len(runs))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold start with and without the admin site.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per configuration (default: %(default)s)')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    # One throwaway start warms the OS file cache so the first run is not an outlier
+    measure(True)
+    report = {
+        'schema_version': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'configurations': {
+            'admin_enabled': summarize([measure(True) for _ in range(args.runs)]),
+            'admin_disabled': summarize([measure(False) for _ in range(args.runs)])
+        }
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Load test comparing the development and production database profiles
+
+Seeds a throwaway SQLite database for each profile, then runs reader and
+writer processes against it through the Flask test client for a fixed time.
+Readers fetch /student and course rosters. Writers enroll in a course and then
+unenroll. Prints reads/s, writes/s, p95 latencies and error counts for each
+profile as JSON.
+
+    python benchmarks/db_profile_load.py --readers 4 --writers 4 --seconds 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import campus
+
+CAMPUS = dict(campus.DEFAULT_SPEC, teachers=20, courses=60, min_courses_per_student=1, max_courses_per_student=1,
+              min_capacity=2000, max_capacity=2000, popularity='uniform')
+
+
+def load_app(db_path, profile):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Every virtual user comes from one address; measure the app, not the rate limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    os.environ['DB_PROFILE'] = profile
+    import app
+    return app
+
+
+def seed(db_path, profile):
+    app = load_app(db_path, profile)
+
+    with app.app.app_context():
+        app.db.create_all()
+        campus.seed(app.db, CAMPUS)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def worker(role, index, db_path, profile, start_at, seconds):
+    app = load_app(db_path, profile)
+    rng = random.Random(index)
+    client = app.app.test_client()
+
+    with app.app.app_context():
+        students = [s.id for s in app.User.query.filter_by(role='student').all()]
+        courses = [(c.id, c.teacher_id) for c in app.Course.query.all()]
+
+    latencies = []
+    errors = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'writer':
+                student_id = rng.choice(students)
+                course_id = rng.choice(courses)[0]
+                with client.session_transaction() as sess:
+                    sess['user_id'] = student_id
+                    sess['user_role'] = 'student'
+                ok = client.post('/api/enroll', json={'course_id': course_id}).status_code == 200
+                ok = client.post('/api/unenroll', json={'course_id': course_id}).status_code == 200 and ok
+            else:
+                course_id, teacher_id = rng.choice(courses)
+                if rng.random() < 0.5:
+                    with client.session_transaction() as sess:
+                        sess['user_id'] = rng.choice(students)
+                        sess['user_role'] = 'student'
+                    ok = client.get('/student').status_code == 200
+                else:
+                    with client.session_transaction() as sess:
+                        sess['user_id'] = teacher_id
+                        sess['user_role'] = 'teacher'
+                    ok = client.get(f'/api/course/{course_id}/students').status_code == 200
+        except Exception:
+            ok = False
+
+        if ok:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+
+    return role, latencies, errors
+
+
+def run_profile(profile, readers, writers, seconds):
+    ctx = multiprocessing.get_context('spawn')
+    db_path = os.path.join(tempfile.mkdtemp(), f'{profile}.db')
+
+    seeder = ctx.Process(target=seed, args=(db_path, profile))
+    seeder.start()
+    seeder.join()
+
+    roles = ['reader'] * readers + ['writer'] * writers
+    start_at = time.time() + 3
+    with ctx.Pool(len(roles)) as pool:
+        results = pool.starmap(worker, [(role, i, db_path, profile, start_at, seconds) for i, role in enumerate(roles)])
+
+    report = {'profile': profile}
+    for role in ('reader', 'writer'):
+        latencies = [ms for r, samples, _ in results if r == role for ms in samples]
+        report[f'{role}_ops_per_s'] = round(len(latencies) / seconds, 1)
+        report[f'{role}_p95_ms'] = round(percentile(latencies, 95), 2)
+        report[f'{role}_errors'] = sum(errors for r, _, errors in results if r == role)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profiles', nargs='+', default=['development', 'production'])
+    args = parser.parse_args()
+
+    reports = [run_profile(profile, args.readers, args.writers, args.seconds) for profile in args.profiles]
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the streaming enrollment export
+
+Seeds synthetic campuses of increasing size (see campus.py) and downloads
+the campus-wide export from /admin/export through the test client, reading
+it chunk by chunk. The report gives rows exported, time taken and the peak
+Python heap (tracemalloc) for each size. With a streamed export the peak
+should barely move as the row count grows.
+
+    python benchmarks/export_memory.py --sizes 1000,10000,100000 --format ndjson
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZE_SCRIPT = '''
+import json, os, sys, time, tracemalloc
+sys.path.insert(0, {benchmarks!r})
+import campus
+import app
+spec = dict(campus.DEFAULT_SPEC, students={students})
+with app.app.app_context():
+    app.db.create_all()
+    seeded = campus.seed(app.db, spec)
+    admin = app.User.query.filter_by(username=campus.ADMIN_USERNAME).one()
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        app.identity_cache.remember(sess, admin)
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get('/admin/export?format={fmt}', buffered=False)
+    size = rows = 0
+    for chunk in response.response:
+        size += len(chunk)
+        rows += chunk.count(b'\\n')
+    response.close()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+print(json.dumps({{'students': {students}, 'enrollments': seeded['enrollments'],
+                  'rows': rows - ({fmt!r} == 'csv'), 'bytes': size, 'seconds': round(elapsed, 3),
+                  'peak_kib': round(peak / 1024, 1)}}))
+'''
+
+
+def measure(students, fmt):
+    """Seed and export in a fresh interpreter so every size starts from the same heap."""
+    db_path = os.path.join(tempfile.mkdtemp(), 'campus.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', METRICS_ENABLED='0')
+    script = SIZE_SCRIPT.format(benchmarks=os.path.dirname(os.path.abspath(__file__)), students=students, fmt=fmt)
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure peak memory of the streaming export.')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='Student counts to seed (default: %(default)s)')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    report = {
+        'schema_version': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'format': args.format,
+        'runs': [measure(int(size), args.format) for size in args.sizes.split(',')]
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
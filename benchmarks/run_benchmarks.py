@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the enrollment workflows
+
+Seeds a synthetic campus (see campus.py) and drives the app with a weighted
+mix of scenarios from several concurrent virtual users:
+
+    login              POST /login with a real password check
+    student_dashboard  GET /student
+    enroll_burst       POST /api/enroll then /api/unenroll
+    roster             GET /api/course/<id>/students
+    admin_lists        GET the admin user and enrollment lists
+
+Requests go through the Flask test client by default. --serve starts a local
+server on the seeded database instead. --url with --database targets a server
+that is already running on a campus seeded by campus.py. The report is JSON,
+with throughput and latency percentiles per endpoint, so runs can be compared
+over time.
+
+    python benchmarks/run_benchmarks.py --mix registration --duration 10 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import campus
+
+MIXES = {
+    'registration': {'student_dashboard': 35, 'enroll_burst': 45, 'roster': 10, 'login': 5, 'admin_lists': 5},
+    'semester_start': {'login': 60, 'student_dashboard': 30, 'roster': 10},
+    'grading': {'roster': 60, 'student_dashboard': 30, 'admin_lists': 10},
+    'mixed': {'login': 5, 'student_dashboard': 40, 'enroll_burst': 25, 'roster': 20, 'admin_lists': 10}
+}
+
+
+class TestClientDriver:
+    """Sends requests through the Flask test client in this process."""
+
+    target = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def new_session(self):
+        return self.app.test_client()
+
+    def login(self, client, username, password):
+        return client.post('/login', data={'username': username, 'password': password}).status_code
+
+    def impersonate(self, client, user):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user['id']
+            sess['username'] = user['username']
+            sess['user_role'] = user['role']
+
+    def request(self, client, method, path, payload=None):
+        return client.open(path, method=method, json=payload).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Sends requests to a running server, one cookie jar per virtual user."""
+
+    target = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def new_session(self):
+        return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def _send(self, opener, request):
+        try:
+            with opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def login(self, opener, username, password):
+        body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        return self._send(opener, urllib.request.Request(self.base_url + '/login', data=body))
+
+    def impersonate(self, opener, user):
+        self.login(opener, user['username'], campus.BENCH_PASSWORD)
+
+    def request(self, opener, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        return self._send(opener, urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method))
+
+
+class Recorder:
+    """Collects latencies and errors per endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def time(self, label, call, ok_statuses=(200,)):
+        started = time.perf_counter()
+        status = call()
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.recording:
+            if status in ok_statuses:
+                self.latencies[label].append(elapsed)
+            else:
+                self.errors[label] += 1
+
+
+def load_population(db_path):
+    """Read user and course ids straight from the campus database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        users = defaultdict(list)
+        for user_id, username, role in conn.execute('SELECT id, username, role FROM user'):
+            users[role].append({'id': user_id, 'username': username, 'role': role})
+        courses = defaultdict(list)
+        all_courses = []
+        for course_id, teacher_id in conn.execute('SELECT id, teacher_id FROM course'):
+            courses[teacher_id].append(course_id)
+            all_courses.append(course_id)
+    finally:
+        conn.close()
+
+    users['teacher'] = [t for t in users['teacher'] if courses[t['id']]]
+    return users, courses, all_courses
+
+
+def virtual_user(index, driver, population, mix, recorder, stop):
+    users, teacher_courses, all_courses = population
+    rng = random.Random(index)
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+
+    student = users['student'][index % len(users['student'])]
+    teacher = users['teacher'][index % len(users['teacher'])]
+    sessions = {}
+    for role, user in (('student', student), ('teacher', teacher), ('admin', users['admin'][0])):
+        sessions[role] = driver.new_session()
+        driver.impersonate(sessions[role], user)
+
+    while not stop.is_set():
+        scenario = rng.choices(scenarios, weights=weights)[0]
+
+        if scenario == 'login':
+            user = rng.choice(users['student'])
+            client = driver.new_session()
+            recorder.time('login', lambda: driver.login(client, user['username'], campus.BENCH_PASSWORD), (302,))
+        elif scenario == 'student_dashboard':
+            recorder.time('student_dashboard', lambda: driver.request(sessions['student'], 'GET', '/student'))
+        elif scenario == 'enroll_burst':
+            course_id = rng.choice(all_courses)
+            recorder.time('enroll_course', lambda: driver.request(
+                sessions['student'], 'POST', '/api/enroll', {'course_id': course_id}))
+            recorder.time('unenroll_course', lambda: driver.request(
+                sessions['student'], 'POST', '/api/unenroll', {'course_id': course_id}))
+        elif scenario == 'roster':
+            course_id = rng.choice(teacher_courses[teacher['id']])
+            recorder.time('get_course_students', lambda: driver.request(
+                sessions['teacher'], 'GET', f'/api/course/{course_id}/students'))
+        elif scenario == 'admin_lists':
+            recorder.time('admin_user_list', lambda: driver.request(sessions['admin'], 'GET', '/admin/user/'))
+            recorder.time('admin_enrollment_list', lambda: driver.request(sessions['admin'], 'GET', '/admin/enrollment/'))
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def summarize(latencies, errors, duration):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput_rps': round(len(ordered) / duration, 2),
+        'p50_ms': round(percentile(ordered, 50), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'max_ms': round(ordered[-1], 3) if ordered else 0.0
+    }
+
+
+def run(driver, population, mix, concurrency, duration, warmup):
+    recorder = Recorder()
+    stop = threading.Event()
+    workers = [threading.Thread(target=virtual_user, args=(i, driver, population, mix, recorder, stop), daemon=True)
+               for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    endpoints = {label: summarize(recorder.latencies[label], recorder.errors[label], elapsed)
+                 for label in sorted(set(recorder.latencies) | set(recorder.errors))}
+    everything = [ms for samples in recorder.latencies.values() for ms in samples]
+    return endpoints, summarize(everything, sum(recorder.errors.values()), elapsed)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    server = subprocess.Popen(
+        [sys.executable, '-c', f'import app; app.app.run(port={port}, threaded=True)'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('Local server did not start')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the enrollment workflows.')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to record (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=1, help='Seconds to run before recording (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Virtual users (default: %(default)s)')
+    parser.add_argument('--serve', action='store_true', help='Start a local server and benchmark it over HTTP')
+    parser.add_argument('--url', help='Benchmark an already running server seeded by campus.py')
+    parser.add_argument('--database', help='Campus database (required with --url, otherwise a temporary file)')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    campus.add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    if args.url and not args.database:
+        parser.error('--url needs --database so virtual users can be picked from the campus')
+
+    spec = campus.spec_from_args(args)
+    db_path = os.path.abspath(args.database or os.path.join(tempfile.mkdtemp(), 'campus.db'))
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Every virtual user comes from one address; measure the app, not the rate limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import app
+
+    seeded = None
+    if not args.url:
+        with app.app.app_context():
+            app.db.create_all()
+            seeded = campus.seed(app.db, spec)
+
+    server = None
+    if args.url:
+        driver = HttpDriver(args.url)
+    elif args.serve:
+        server, url = start_server(db_path)
+        driver = HttpDriver(url)
+    else:
+        driver = TestClientDriver(app.app)
+
+    try:
+        endpoints, total = run(driver, load_population(db_path), MIXES[args.mix], args.concurrency, args.duration, args.warmup)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'schema_version': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'target': driver.target,
+        'mix': args.mix,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'campus': dict(spec, seeded=seeded),
+        'endpoints': endpoints,
+        'total': total
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
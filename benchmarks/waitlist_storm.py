@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Registration-day retry storm, with and without the waitlist
+
+One course starts full and a crowd of students wants in. Holders drop the
+course one at a time. The benchmark runs this twice through the Flask test
+client:
+
+    retry     every waiting student re-POSTs /api/enroll until it succeeds
+    waitlist  every waiting student POSTs /api/waitlist/join once and is
+              promoted when a holder's unenroll frees a seat
+
+The JSON report gives, per mode, the requests the waiting students sent,
+the seats they got, how long each took to get one, and whether seats went
+out in the order students arrived.
+
+    python benchmarks/waitlist_storm.py --waiting 200 --capacity 50 --releases 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COURSE_NAME = 'STORM 001'
+
+
+def seed(app_module, capacity, waiting):
+    """One teacher, one full course, `capacity` holders and `waiting` students; returns their ids."""
+    from importer import BulkImporter
+
+    app, db = app_module.app, app_module.db
+    users = [{'username': 'storm_teacher', 'first_name': 'Storm', 'last_name': 'Teacher', 'role': 'teacher',
+              'password_hash': 'x'}]
+    users += [{'username': f'holder{i:05d}', 'first_name': 'Holder', 'last_name': str(i), 'role': 'student',
+               'password_hash': 'x'} for i in range(capacity)]
+    users += [{'username': f'waiting{i:05d}', 'first_name': 'Waiting', 'last_name': str(i), 'role': 'student',
+               'password_hash': 'x'} for i in range(waiting)]
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        importer = BulkImporter(db.session)
+        importer.run('users', users)
+        importer.run('courses', [{'name': COURSE_NAME, 'teacher': 'storm_teacher', 'time': 'MWF 9:00-9:50 AM',
+                                  'capacity': str(capacity)}])
+        importer.run('enrollments', [{'student': f'holder{i:05d}', 'course': COURSE_NAME} for i in range(capacity)])
+        app_module.course_catalog.invalidate()
+
+        ids = {username: user_id for username, (user_id, _) in importer.users.items()}
+        return (importer.courses[COURSE_NAME],
+                [ids[f'holder{i:05d}'] for i in range(capacity)],
+                [ids[f'waiting{i:05d}'] for i in range(waiting)])
+
+
+def client_for(app, student_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = student_id
+        sess['user_role'] = 'student'
+    return client
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def run_mode(app_module, mode, args):
+    app = app_module.app
+    course_id, holders, waiting = seed(app_module, args.capacity, args.waiting)
+    stop = threading.Event()
+    lock = threading.Lock()
+    requests = {'count': 0}
+    seated_at = {}
+
+    def count_request():
+        with lock:
+            requests['count'] += 1
+
+    def attempt(client, student_id):
+        count_request()
+        endpoint = '/api/enroll' if mode == 'retry' else '/api/waitlist/join'
+        result = client.post(endpoint, json={'course_id': course_id}).get_json()
+        if result.get('enrollment'):
+            seated_at[student_id] = time.perf_counter()
+        return result['success']
+
+    def keep_retrying(client, student_id):
+        while not stop.is_set():
+            time.sleep(args.retry_interval)
+            if attempt(client, student_id):
+                return
+
+    # Students arrive one after another, so arrival order is the waiting list
+    # order and FIFO fairness can be checked against it.
+    started = time.perf_counter()
+    threads = []
+    for student_id in waiting:
+        client = client_for(app, student_id)
+        if not attempt(client, student_id) and mode == 'retry':
+            threads.append(threading.Thread(target=keep_retrying, args=(client, student_id)))
+            threads[-1].start()
+
+    release_started = time.perf_counter()
+    release_times = []
+    for student_id in holders[:args.releases]:
+        client_for(app, student_id).post('/api/unenroll', json={'course_id': course_id})
+        release_times.append(time.perf_counter())
+        time.sleep(args.release_interval)
+
+    # Give retrying students one more interval to notice the last seat
+    time.sleep(args.retry_interval * 2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        enrolled = app_module.db.session.execute(
+            app_module.db.select(app_module.Enrollment.student_id)
+            .where(app_module.Enrollment.course_id == course_id, app_module.Enrollment.student_id.in_(waiting))
+            .order_by(app_module.Enrollment.id)
+        ).all()
+
+    # Seats handed out in arrival order match the prefix of the waiting list
+    seated_order = [student_id for student_id, in enrolled]
+    fifo = seated_order == waiting[:len(seated_order)]
+
+    if mode == 'waitlist':
+        # Promotion happens inside the holder's unenroll; match seats to releases
+        waits = [(release_times[i] - release_started) * 1000 for i in range(min(len(seated_order), len(release_times)))]
+    else:
+        waits = [(seated_at[s] - release_started) * 1000 for s in seated_order if s in seated_at]
+    waits.sort()
+
+    return {
+        'requests': requests['count'],
+        'requests_per_seat': round(requests['count'] / max(len(seated_order), 1), 2),
+        'requests_per_second': round(requests['count'] / elapsed, 1),
+        'seats_filled': len(seated_order),
+        'fifo': fifo,
+        'seat_wait_p50_ms': round(percentile(waits, 50), 1),
+        'seat_wait_p95_ms': round(percentile(waits, 95), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the enroll retry storm with the waitlist.')
+    parser.add_argument('--waiting', type=int, default=100, help='Students waiting for a seat (default: %(default)s)')
+    parser.add_argument('--capacity', type=int, default=20, help='Course capacity (default: %(default)s)')
+    parser.add_argument('--releases', type=int, default=20, help='Holders who drop the course (default: %(default)s)')
+    parser.add_argument('--release-interval', type=float, default=0.05,
+                        help='Seconds between drops (default: %(default)s)')
+    parser.add_argument('--retry-interval', type=float, default=0.05,
+                        help='Seconds a retrying student waits between attempts (default: %(default)s)')
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'storm.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # Every virtual user comes from one address; measure the app, not the rate limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import app
+
+    report = {
+        'waiting': args.waiting,
+        'capacity': args.capacity,
+        'releases': args.releases,
+        'modes': {mode: run_mode(app, mode, args) for mode in ('retry', 'waitlist')}
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
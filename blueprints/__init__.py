@@ -0,0 +1,9 @@
+"""
+Route blueprints, registered by app.create_app()
+
+    auth      sign in and out, and the role-based landing redirect
+    student   the student dashboard
+    teacher   the teacher dashboard
+    api       the JSON API under /api
+    admin     Flask-Admin views, registered only when ADMIN_ENABLED is set
+"""
@@ -0,0 +1,348 @@
+"""
+The admin site: dashboard, metrics, bulk import and export, conflict report and model views
+"""
+
+from flask import current_app, flash, g, jsonify, redirect, request, session, url_for
+from flask_admin import Admin, AdminIndexView, expose
+from flask_admin.actions import action
+from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import inspect
+from sqlalchemy.orm import aliased, joinedload
+from wtforms import Form, StringField, SelectField, PasswordField
+from wtforms.fields import SelectField as WTFSelectField
+
+from app import (
+    db, User, Course, Enrollment, course_catalog, seat_broadcaster, identity_cache, hashing_pool, hash_password,
+    rate_limiter, idempotency_cache, deletion_service, promote_waitlist, publish_seats, sync_enrolled_counts,
+    ENROLLMENT_EXPORT_COLUMNS, export_format_error
+)
+from exporter import FORMATS as EXPORT_FORMATS, export_response
+from grade_stats import ABSENT, apply_grade_changes, recompute_grade_stats
+from importer import BulkImporter, KINDS as IMPORT_KINDS, read_rows
+from replica import use_replica
+from schedule import schedule_conflicts
+
+
+class SecureAdminIndexView(AdminIndexView):
+    def is_accessible(self):
+        return session.get('user_role') == 'admin'
+    
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for('auth.login'))
+    
+    @expose('/')
+    def index(self):
+        users_count = User.query.count()
+        courses_count = Course.query.count()
+        enrollments_count = Enrollment.query.count()
+        
+        return self.render('admin/index.html', 
+                         admin_view=self,
+                         users_count=users_count,
+                         courses_count=courses_count,
+                         enrollments_count=enrollments_count)
+    
+    @expose('/metrics')
+    def metrics(self):
+        instrumentation = current_app.extensions.get('instrumentation')
+        if instrumentation is None:
+            return jsonify({'enabled': False, 'routes': {}, 'catalog': course_catalog.stats(),
+                            'seat_stream': seat_broadcaster.stats(), 'login': self.login_stats(),
+                            'rate_limits': rate_limiter.stats(), 'idempotency': idempotency_cache.stats(),
+                            'replica': self.replica_stats()})
+        
+        return jsonify({'enabled': True, 'routes': instrumentation.snapshot(), 'catalog': course_catalog.stats(),
+                        'seat_stream': seat_broadcaster.stats(), 'login': self.login_stats(),
+                        'rate_limits': rate_limiter.stats(), 'idempotency': idempotency_cache.stats(),
+                        'replica': self.replica_stats()})
+    
+    def replica_stats(self):
+        router = current_app.extensions.get('replica_router')
+        return router.stats() if router is not None else {'enabled': False}
+    
+    def login_stats(self):
+        return {'identity_reloads': identity_cache.reloads, 'hash_rejected': hashing_pool.rejected}
+    
+    @expose('/import', methods=['POST'])
+    def bulk_import(self):
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            return jsonify({'success': False, 'message': f'Upload a file and choose a kind: {", ".join(IMPORT_KINDS)}'}), 400
+        
+        importer = BulkImporter(db.session, on_chunk=course_catalog.invalidate, hash_password=hash_password)
+        try:
+            result = importer.run(kind, read_rows(upload.stream, upload.filename))
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 400
+        
+        if kind == 'enrollments' and result.imported:
+            recompute_grade_stats(db.session)
+            db.session.commit()
+        
+        return jsonify(dict(result.to_dict(), success=True))
+    
+    @expose('/conflicts')
+    def conflict_report(self):
+        conflicts = schedule_conflicts(db.session)
+        student_ids = {student_id for student_id, _, _ in conflicts}
+        course_ids = {course_id for _, first, second in conflicts for course_id in (first, second)}
+        students = {u.id: u for u in User.query.filter(User.id.in_(student_ids))}
+        courses = {c.id: c for c in Course.query.filter(Course.id.in_(course_ids))}
+        unscheduled = Course.query.filter(Course.meeting_days.is_(None)).order_by(Course.name).all()
+        
+        return self.render('admin/conflicts.html',
+                         admin_view=self,
+                         conflicts=[(students[s], courses[a], courses[b]) for s, a, b in conflicts],
+                         unscheduled=unscheduled)
+    
+    @expose('/export')
+    def export_enrollments(self):
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return export_format_error()
+        
+        teacher = aliased(User)
+        statement = db.select(
+            Enrollment.id, Course.id, Course.name, Course.time, teacher.username,
+            User.id, User.username, User.first_name, User.last_name, Enrollment.grade, Enrollment.enrolled_date
+        ).join(Course, Enrollment.course_id == Course.id).join(
+            teacher, Course.teacher_id == teacher.id
+        ).join(User, Enrollment.student_id == User.id)
+        
+        course_id = request.args.get('course_id', type=int)
+        if course_id is not None:
+            statement = statement.where(Enrollment.course_id == course_id)
+        
+        return export_response(db.session, statement.order_by(Enrollment.id), ENROLLMENT_EXPORT_COLUMNS, fmt,
+                               'enrollments', current_app.config['EXPORT_BATCH_SIZE'])
+
+
+class ReplicaListMixin:
+    """Serve the paginated list view from the read replica; forms and actions stay on the primary."""
+    
+    def _handle_view(self, name, **kwargs):
+        if name == 'index_view':
+            use_replica()
+        return super(ReplicaListMixin, self)._handle_view(name, **kwargs)
+
+
+class ServiceDeleteMixin:
+    """Single and bulk admin deletes run by the DeletionService instead of the ORM."""
+    
+    # The DeletionService method that deletes this view's rows
+    delete_method = None
+    
+    def delete_rows(self, ids):
+        """Delete the rows with these primary keys and return the DeletionResult."""
+        result = getattr(deletion_service(), self.delete_method)(ids)
+        course_catalog.invalidate()
+        publish_seats(result.freed_course_ids)
+        return result
+    
+    def delete_model(self, model):
+        try:
+            self.delete_rows([model.id])
+        except Exception as e:
+            flash(f'Failed to delete record. {str(e)}', 'error')
+            return False
+        return True
+    
+    @action('delete', 'Delete', 'Are you sure you want to delete selected records?')
+    def action_delete(self, ids):
+        try:
+            self.delete_rows([int(i) for i in ids])
+        except Exception as e:
+            flash(f'Failed to delete records. {str(e)}', 'error')
+            return
+        flash(f'{len(ids)} records were successfully deleted.', 'success')
+
+
+class UserForm(Form):
+    username = StringField('Username')
+    first_name = StringField('First Name')
+    last_name = StringField('Last Name')
+    role = SelectField('Role', choices=[('student', 'Student'), ('teacher', 'Teacher'), ('admin', 'Admin')])
+    password = PasswordField('Password', description='Leave blank to keep current password when editing')
+
+
+class UserModelView(ReplicaListMixin, ServiceDeleteMixin, ModelView):
+    def is_accessible(self):
+        return session.get('user_role') == 'admin'
+    
+    delete_method = 'delete_users'
+    
+    column_list = ['username', 'first_name', 'last_name', 'role']
+    form = UserForm
+    can_delete = True
+    # Sort on the unique username index so each page is an index range scan
+    page_size = 50
+    can_set_page_size = True
+    column_default_sort = 'username'
+    
+    def on_model_change(self, form, model, is_created):
+        if hasattr(form, 'password') and form.password.data:
+            model.set_password(form.password.data)
+        elif is_created:
+            model.set_password('defaultpassword123')
+        
+        super(UserModelView, self).on_model_change(form, model, is_created)
+    
+    def after_model_change(self, form, model, is_created):
+        course_catalog.invalidate()
+        identity_cache.invalidate(model.id)
+    
+    def delete_rows(self, ids):
+        result = super(UserModelView, self).delete_rows(ids)
+        for user_id in ids:
+            identity_cache.invalidate(user_id)
+        return result
+    
+    def delete_model(self, model):
+        username = model.username
+        try:
+            result = self.delete_rows([model.id])
+        except Exception as e:
+            try:
+                flash(f'Error deleting user "{username}": {str(e)}', 'error')
+            except RuntimeError:
+                pass
+            return False
+        
+        try:
+            if result.courses > 0 or result.enrollments > 0:
+                flash(f'User "{username}" had {result.courses} courses and {result.enrollments} enrollments. These were also deleted.', 'warning')
+            flash(f'User "{username}" has been successfully deleted.', 'success')
+        except RuntimeError:
+            pass
+        
+        return True
+
+
+class CourseModelView(ReplicaListMixin, ServiceDeleteMixin, ModelView):
+    def is_accessible(self):
+        return session.get('user_role') == 'admin'
+    
+    delete_method = 'delete_courses'
+    
+    column_list = ['name', 'teacher', 'time', 'capacity']
+    form_columns = ['name', 'teacher_id', 'time', 'capacity']
+    
+    column_formatters = {
+        'teacher': lambda v, c, m, p: f"{m.teacher.first_name} {m.teacher.last_name}" if m.teacher else 'N/A'
+    }
+    
+    form_overrides = {
+        'teacher_id': WTFSelectField
+    }
+    
+    def create_form(self):
+        form = super(CourseModelView, self).create_form()
+        teachers = course_catalog.get()['teachers']
+        form.teacher_id.choices = [(t['id'], f"{t['name']} ({t['username']})") for t in teachers]
+        return form
+    
+    def edit_form(self, obj):
+        form = super(CourseModelView, self).edit_form(obj)
+        teachers = course_catalog.get()['teachers']
+        form.teacher_id.choices = [(t['id'], f"{t['name']} ({t['username']})") for t in teachers]
+        return form
+    
+    def on_model_change(self, form, model, is_created):
+        # Seats opened by a capacity raise go to the waitlist in the same commit
+        if not is_created and inspect(model).attrs.capacity.history.has_changes():
+            db.session.flush()
+            promote_waitlist(model.id)
+        
+        super(CourseModelView, self).on_model_change(form, model, is_created)
+    
+    def after_model_change(self, form, model, is_created):
+        course_catalog.invalidate()
+        publish_seats([model.id])
+        if model.meeting is None:
+            flash(f'Could not read a meeting time from "{model.time}"; schedule conflicts are not checked for '
+                  f'{model.name}. Use a form like "MWF 10:00-10:50 AM".', 'warning')
+
+
+class EnrollmentModelView(ReplicaListMixin, ServiceDeleteMixin, ModelView):
+    def is_accessible(self):
+        return session.get('user_role') == 'admin'
+    
+    delete_method = 'delete_enrollments'
+    
+    column_list = ['student', 'course', 'grade', 'enrolled_date']
+    form_columns = ['student_id', 'course_id', 'grade']
+    page_size = 50
+    can_set_page_size = True
+    column_default_sort = 'id'
+    
+    column_formatters = {
+        'student': lambda v, c, m, p: f"{m.student.first_name} {m.student.last_name}" if m.student else 'N/A',
+        'course': lambda v, c, m, p: m.course.name if m.course else 'N/A',
+        'enrolled_date': lambda v, c, m, p: m.enrolled_date.strftime('%Y-%m-%d') if m.enrolled_date else 'N/A'
+    }
+    
+    form_overrides = {
+        'student_id': WTFSelectField,
+        'course_id': WTFSelectField
+    }
+    
+    def get_query(self):
+        # The column formatters read m.student and m.course on every row
+        return super(EnrollmentModelView, self).get_query().options(
+            joinedload(Enrollment.student), joinedload(Enrollment.course)
+        )
+    
+    def create_form(self):
+        form = super(EnrollmentModelView, self).create_form()
+        students = User.query.filter_by(role='student').order_by(User.last_name, User.first_name).all()
+        form.student_id.choices = [(s.id, f"{s.first_name} {s.last_name} ({s.username})") for s in students]
+        
+        courses = course_catalog.get()['courses']
+        form.course_id.choices = [(c['id'], f"{c['name']} - {c['teacher_name']}") for c in courses]
+        
+        return form
+    
+    def edit_form(self, obj):
+        form = super(EnrollmentModelView, self).edit_form(obj)
+        students = User.query.filter_by(role='student').order_by(User.last_name, User.first_name).all()
+        form.student_id.choices = [(s.id, f"{s.first_name} {s.last_name} ({s.username})") for s in students]
+        
+        courses = course_catalog.get()['courses']
+        form.course_id.choices = [(c['id'], f"{c['name']} - {c['teacher_name']}") for c in courses]
+        
+        return form
+    
+    def on_model_change(self, form, model, is_created):
+        state = inspect(model)
+        course_ids = {model.course_id} | set(state.attrs.course_id.history.deleted)
+        g.seat_course_ids = [int(c) for c in course_ids if c is not None]
+        
+        def before(attr):
+            deleted = state.attrs[attr].history.deleted
+            return deleted[0] if deleted else getattr(model, attr)
+        
+        # The select fields hand back ids as strings
+        changes = [(int(model.student_id), int(model.course_id), ABSENT, model.grade)]
+        if not is_created:
+            changes.append((int(before('student_id')), int(before('course_id')), before('grade'), ABSENT))
+        apply_grade_changes(db.session, changes)
+        db.session.flush()
+        sync_enrolled_counts(g.seat_course_ids)
+        for course_id in g.seat_course_ids:
+            promote_waitlist(course_id)
+        
+        super(EnrollmentModelView, self).on_model_change(form, model, is_created)
+    
+    def after_model_change(self, form, model, is_created):
+        course_catalog.invalidate()
+        publish_seats(g.pop('seat_course_ids', []))
+
+
+def init_admin(app):
+    """Mount the admin site on `app`; only workers with ADMIN_ENABLED import this module."""
+    admin = Admin(app, name='UC Merced Admin', index_view=SecureAdminIndexView())
+    admin.add_view(UserModelView(User, db.session))
+    admin.add_view(CourseModelView(Course, db.session))
+    admin.add_view(EnrollmentModelView(Enrollment, db.session))
+    return admin
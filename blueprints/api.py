@@ -0,0 +1,295 @@
+"""
+The JSON API under /api: enrolment, waitlists, seats, grades, rosters and exports
+"""
+
+import hashlib
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request, session
+from sqlalchemy.exc import IntegrityError
+
+from app import (
+    db, User, Course, Enrollment, Waitlist, CourseStats, StudentStats, course_catalog, seat_broadcaster,
+    current_identity, guarded_write, promote_waitlist, waitlist_position, seat_delta, parse_grade, enroll_student,
+    unenroll_student, set_grade, course_roster, GRADEBOOK_COLUMNS, export_format_error
+)
+from exporter import FORMATS as EXPORT_FORMATS, export_response
+from grade_stats import apply_grade_changes, course_summary, transcript_summary
+from replica import replica_reads
+from schedule import student_schedule
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+@bp.route('/enroll', methods=['POST'])
+@guarded_write
+def enroll_course():
+    return jsonify(enroll_student(db.session, current_identity(), request.json))
+
+
+@bp.route('/unenroll', methods=['POST'])
+@guarded_write
+def unenroll_course():
+    return jsonify(unenroll_student(db.session, current_identity(), request.json))
+
+
+@bp.route('/waitlist/join', methods=['POST'])
+@guarded_write
+def join_waitlist():
+    identity = current_identity()
+    if identity is None or identity.role != 'student':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        course_id = int(request.json.get('course_id'))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Course not found'})
+    student_id = identity.id
+    
+    if Enrollment.query.filter_by(student_id=student_id, course_id=course_id).first():
+        return jsonify({'success': False, 'message': 'Already enrolled in this course'})
+    course = db.session.get(Course, course_id)
+    if not course:
+        return jsonify({'success': False, 'message': 'Course not found'})
+    # Promotion would pass over a student whose schedule clashes, so say so now
+    clashes = student_schedule(db.session, student_id).conflicts(course.meeting) if course.meeting else []
+    if clashes:
+        return jsonify({'success': False, 'message': f'Schedule conflict with {clashes[0]}'})
+    
+    try:
+        db.session.add(Waitlist(student_id=student_id, course_id=course_id))
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Already on the waitlist'})
+    
+    # A seat may have opened since the student saw the course as full
+    promoted = promote_waitlist(course_id)
+    position = None if student_id in promoted else waitlist_position(student_id, course_id)
+    seats = db.session.execute(
+        db.select(Course.enrolled_count, Course.capacity).where(Course.id == course_id)
+    ).first()
+    db.session.commit()
+    if promoted:
+        course_catalog.invalidate()
+        seat_broadcaster.publish([(course_id, seats.enrolled_count, seats.capacity)])
+    
+    message = f'Added to the waitlist at position {position}' if position else 'Successfully enrolled'
+    return jsonify(dict(seat_delta(course_id, seats.enrolled_count, seats.capacity, position is None, position),
+                        success=True, message=message))
+
+
+@bp.route('/waitlist/leave', methods=['POST'])
+@guarded_write
+def leave_waitlist():
+    identity = current_identity()
+    if identity is None or identity.role != 'student':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        course_id = int(request.json.get('course_id'))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Not on the waitlist for this course'})
+    
+    removed = db.session.execute(
+        db.delete(Waitlist).where(Waitlist.student_id == identity.id, Waitlist.course_id == course_id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    if not removed:
+        return jsonify({'success': False, 'message': 'Not on the waitlist for this course'})
+    
+    course = db.session.get(Course, course_id)
+    return jsonify(dict(seat_delta(course_id, course.enrolled_count, course.capacity, False),
+                        success=True, message='Removed from the waitlist'))
+
+
+@bp.route('/waitlist/<int:course_id>')
+def get_waitlist_status(course_id):
+    identity = current_identity()
+    if identity is None or identity.role != 'student':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    student_id = identity.id
+    enrolled = Enrollment.query.filter_by(student_id=student_id, course_id=course_id).first() is not None
+    
+    return jsonify({
+        'success': True,
+        'enrolled': enrolled,
+        'position': None if enrolled else waitlist_position(student_id, course_id)
+    })
+
+
+@bp.route('/courses/seats')
+def get_course_seats():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    seats = [{'id': c['id'], 'enrolled': c['enrolled'], 'capacity': c['capacity']}
+             for c in course_catalog.get()['courses']]
+    
+    # The ETag is derived from the seat data itself, so it agrees across
+    # workers and lets polling clients get an empty 304 until a seat changes.
+    response = jsonify({'success': True, 'courses': seats})
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+@bp.route('/courses/seats/stream')
+def stream_course_seats():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    # The generator runs after the app context is gone, so take what it needs now
+    broadcaster = seat_broadcaster._get_current_object()
+    heartbeat = current_app.config['SEAT_STREAM_HEARTBEAT']
+    coalesce = current_app.config['SEAT_STREAM_COALESCE']
+    
+    # Server-sent events: one "seats" event per batch of changed courses, and a
+    # comment line as a heartbeat so idle connections are not dropped.
+    def events():
+        subscription = broadcaster.subscribe()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                changes = subscription.wait(timeout=heartbeat, coalesce=coalesce)
+                if changes:
+                    yield f'event: seats\ndata: {json.dumps(changes)}\n\n'
+                else:
+                    yield ': heartbeat\n\n'
+        finally:
+            subscription.close()
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/update_grade', methods=['POST'])
+@guarded_write
+def update_grade():
+    return jsonify(set_grade(db.session, current_identity(), request.json))
+
+
+@bp.route('/update_grades', methods=['POST'])
+@guarded_write
+def update_grades():
+    identity = current_identity()
+    if identity is None or identity.role != 'teacher':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    items = request.json.get('grades') if isinstance(request.json, dict) else None
+    if not isinstance(items, list):
+        return jsonify({'success': False, 'message': 'Send {"grades": [...]}, a list of enrollment_id and grade'}), 400
+    results = []
+    requested = {}
+    for item in items:
+        try:
+            enrollment_id = int(item.get('enrollment_id'))
+            grade = parse_grade(item.get('grade'))
+        except (TypeError, ValueError, AttributeError):
+            results.append({'enrollment_id': item.get('enrollment_id') if isinstance(item, dict) else None,
+                            'success': False, 'message': 'Invalid enrollment or grade'})
+            continue
+        
+        results.append({'enrollment_id': enrollment_id, 'grade': grade})
+        requested[enrollment_id] = grade
+    
+    # One join resolves which course, and so which teacher, owns every enrollment,
+    # along with the grade it replaces
+    current = {row.id: row for row in db.session.query(
+        Enrollment.id, Enrollment.student_id, Enrollment.course_id, Enrollment.grade, Course.teacher_id
+    ).join(Course, Enrollment.course_id == Course.id).filter(Enrollment.id.in_(list(requested))).all()} if requested else {}
+    owners = {enrollment_id: row.teacher_id for enrollment_id, row in current.items()}
+    
+    updates = {}
+    for result in results:
+        if 'success' in result:
+            continue
+        
+        enrollment_id = result['enrollment_id']
+        if enrollment_id not in owners:
+            result.update(success=False, message='Enrollment not found')
+        elif owners[enrollment_id] != identity.id:
+            result.update(success=False, message='Unauthorized')
+        else:
+            result.update(success=True, message='Grade updated')
+            updates[enrollment_id] = requested[enrollment_id]
+    
+    if updates:
+        db.session.execute(db.update(Enrollment), [{'id': k, 'grade': v} for k, v in updates.items()])
+        apply_grade_changes(db.session, [(current[k].student_id, current[k].course_id, current[k].grade, v)
+                                         for k, v in updates.items()])
+        db.session.commit()
+    
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'updated': len(updates),
+        'results': results
+    })
+
+
+@bp.route('/course/<int:course_id>/students')
+@replica_reads
+def get_course_students(course_id):
+    return jsonify(course_roster(db.session, current_identity(), course_id, request.args))
+
+
+@bp.route('/replica/status')
+def get_replica_status():
+    # For monitoring: 503 once the replica lags more than REPLICA_MAX_STALENESS
+    router = current_app.extensions.get('replica_router')
+    if router is None:
+        return jsonify({'success': True, 'enabled': False})
+    
+    status = router.status()
+    return jsonify(dict(status, success=True, enabled=True)), 503 if status['stale'] else 200
+
+
+@bp.route('/course/<int:course_id>/stats')
+def get_course_stats(course_id):
+    identity = current_identity()
+    if identity is None or identity.role not in ('teacher', 'admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    course = db.session.get(Course, course_id)
+    if not course or (identity.role == 'teacher' and course.teacher_id != identity.id):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    stats = db.session.get(CourseStats, course_id)
+    return jsonify(dict(course_summary(stats), success=True, course_id=course_id))
+
+
+@bp.route('/student/<int:student_id>/transcript')
+def get_transcript_summary(student_id):
+    identity = current_identity()
+    if identity is None or (identity.role != 'admin' and identity.id != student_id):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    stats = db.session.get(StudentStats, student_id)
+    return jsonify(dict(transcript_summary(stats), success=True, student_id=student_id))
+
+
+@bp.route('/course/<int:course_id>/export')
+def export_course_gradebook(course_id):
+    identity = current_identity()
+    if identity is None or identity.role != 'teacher':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    course = db.session.get(Course, course_id)
+    if not course or course.teacher_id != identity.id:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return export_format_error()
+    
+    statement = db.select(
+        Enrollment.id, User.id, User.username, User.first_name, User.last_name, Enrollment.grade,
+        Enrollment.enrolled_date
+    ).join(User, Enrollment.student_id == User.id).where(
+        Enrollment.course_id == course_id
+    ).order_by(User.last_name, User.first_name, Enrollment.id)
+    
+    return export_response(db.session, statement, GRADEBOOK_COLUMNS, fmt, f'course-{course_id}-gradebook',
+                           current_app.config['EXPORT_BATCH_SIZE'])
@@ -0,0 +1,82 @@
+"""
+Sign in and out, and the redirect from / to each role's dashboard
+"""
+
+import math
+
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+
+from app import db, User, current_identity, hashing_pool, identity_cache, limit_address, password_policy, rate_limiter
+from auth import PoolBusy
+
+bp = Blueprint('auth', __name__)
+
+
+@bp.route('/')
+def index():
+    if 'user_id' in session:
+        return redirect(url_for('auth.dashboard'))
+    return redirect(url_for('auth.login'))
+
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        # Password guessing is charged to the address it comes from, before any hashing
+        address = limit_address(request.remote_addr)
+        wait = rate_limiter.check([('login', address)] if address is not None else [])
+        if wait:
+            flash('Too many sign-in attempts, please try again shortly', 'error')
+            return render_template('login.html'), 429, {'Retry-After': str(math.ceil(wait))}
+        
+        username = request.form['username']
+        password = request.form['password']
+        
+        user = User.query.filter_by(username=username).first()
+        
+        # Hashing runs on the bounded pool, if configured, so a login storm
+        # cannot take every request thread.
+        try:
+            verified = user is not None and hashing_pool.run(password_policy.verify, user.password_hash, password)
+        except PoolBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('login.html'), 503
+        
+        if verified:
+            if password_policy.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = hashing_pool.run(password_policy.hash, password)
+                    db.session.commit()
+                except PoolBusy:
+                    pass
+            identity_cache.remember(session, user)
+            return redirect(url_for('auth.dashboard'))
+        else:
+            flash('Invalid username or password', 'error')
+    
+    return render_template('login.html')
+
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('auth.login'))
+
+
+@bp.route('/dashboard')
+def dashboard():
+    identity = current_identity()
+    if identity is None:
+        return redirect(url_for('auth.login'))
+    
+    if identity.role == 'student':
+        return redirect(url_for('student.dashboard'))
+    elif identity.role == 'teacher':
+        return redirect(url_for('teacher.dashboard'))
+    elif identity.role == 'admin':
+        # Workers started with ADMIN_ENABLED=0 have no /admin to send the admin to
+        if not current_app.config['ADMIN_ENABLED']:
+            return render_template('admin_unavailable.html'), 503
+        return redirect(url_for('admin.index'))
+    
+    return redirect(url_for('auth.login'))
@@ -0,0 +1,43 @@
+"""
+The student dashboard: every course with the student's grades and waitlist places
+"""
+
+from flask import Blueprint, redirect, render_template, session, url_for
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from app import db, Enrollment, Waitlist, course_catalog
+from replica import replica_reads
+
+bp = Blueprint('student', __name__)
+
+
+@bp.route('/student')
+@replica_reads
+def dashboard():
+    if session.get('user_role') != 'student':
+        return redirect(url_for('auth.login'))
+    
+    # The student's grades and waitlist places, in one query, are the only
+    # per-request reads; the courses themselves come from the shared catalog.
+    student_id = session['user_id']
+    ahead = aliased(Waitlist)
+    position = db.select(func.count(ahead.id)).where(
+        ahead.course_id == Waitlist.course_id, ahead.id <= Waitlist.id
+    ).scalar_subquery()
+    rows = db.session.execute(db.union_all(
+        db.select(Enrollment.course_id, Enrollment.grade, db.null()).where(Enrollment.student_id == student_id),
+        db.select(Waitlist.course_id, db.null(), position).where(Waitlist.student_id == student_id)
+    )).all()
+    grades = {course_id: grade for course_id, grade, place in rows if place is None}
+    places = {course_id: place for course_id, grade, place in rows if place is not None}
+    
+    all_courses = []
+    for course in course_catalog.get()['courses']:
+        all_courses.append(dict(course, is_enrolled=course['id'] in grades, grade=grades.get(course['id']),
+                                waitlist_position=places.get(course['id'])))
+    enrolled_courses = [course for course in all_courses if course['is_enrolled']]
+    
+    return render_template('student_dashboard.html', 
+                         enrolled_courses=enrolled_courses, 
+                         all_courses=all_courses)
@@ -0,0 +1,21 @@
+"""
+The teacher dashboard: the courses the signed-in teacher teaches
+"""
+
+from flask import Blueprint, redirect, render_template, session, url_for
+
+from app import Course, current_identity
+from replica import replica_reads
+
+bp = Blueprint('teacher', __name__)
+
+
+@bp.route('/teacher')
+@replica_reads
+def dashboard():
+    if session.get('user_role') != 'teacher':
+        return redirect(url_for('auth.login'))
+    
+    courses = Course.query.filter_by(teacher_id=current_identity().id).all()
+    
+    return render_template('teacher_dashboard.html', courses=courses)
@@ -0,0 +1,119 @@
+"""
+Version-invalidated course catalog cache for the UC Merced Enrollment System
+
+The catalog (courses with teacher names and seat counts, plus the teacher
+list used by admin forms) is read on nearly every page but changes rarely.
+It is rebuilt only when its version number moves, and every write path bumps
+the version after committing.
+
+The version and the cached rows live in a backend. MemoryCatalogBackend is
+private to one process; SqliteCatalogBackend keeps them in a small local file
+so several worker processes see each other's invalidations.
+"""
+
+import json
+import sqlite3
+import threading
+
+
+class MemoryCatalogBackend:
+    """Keeps the catalog version and rows in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._stored = None
+
+    def get_version(self):
+        return self._version
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+
+    def load(self):
+        return self._stored
+
+    def store(self, version, data):
+        self._stored = (version, data)
+
+
+class SqliteCatalogBackend:
+    """Shares the catalog version and rows between processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS catalog '
+                         '(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, payload TEXT)')
+            conn.execute('INSERT OR IGNORE INTO catalog (id, version) VALUES (1, 0)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get_version(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT version FROM catalog WHERE id = 1').fetchone()[0]
+
+    def bump_version(self):
+        with self._connect() as conn:
+            conn.execute('UPDATE catalog SET version = version + 1, payload = NULL WHERE id = 1')
+
+    def load(self):
+        with self._connect() as conn:
+            version, payload = conn.execute('SELECT version, payload FROM catalog WHERE id = 1').fetchone()
+        if payload is None:
+            return None
+        return version, json.loads(payload)
+
+    def store(self, version, data):
+        # Only keep the rows if nobody invalidated them while they were being built
+        with self._connect() as conn:
+            conn.execute('UPDATE catalog SET payload = ? WHERE id = 1 AND version = ?', (json.dumps(data), version))
+
+
+def make_backend(store):
+    """Pick a backend from the CATALOG_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryCatalogBackend()
+    return SqliteCatalogBackend(store)
+
+
+class CatalogCache:
+    """Serves the catalog from memory until its backend version changes."""
+
+    def __init__(self, loader, backend=None):
+        self.loader = loader
+        self.backend = backend or MemoryCatalogBackend()
+        self._local = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        # Read the version before the rows so a write that lands mid-build
+        # leaves the result tagged with an already outdated version.
+        version = self.backend.get_version()
+
+        local = self._local
+        if local is None or local[0] != version:
+            local = self.backend.load()
+
+        if local is not None and local[0] == version:
+            self._local = local
+            with self._lock:
+                self.hits += 1
+            return local[1]
+
+        with self._lock:
+            self.misses += 1
+        data = self.loader()
+        self.backend.store(version, data)
+        self._local = (version, data)
+        return data
+
+    def invalidate(self):
+        self.backend.bump_version()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'version': self.backend.get_version()}
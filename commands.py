@@ -0,0 +1,124 @@
+"""
+Command-line tools, registered on the app by create_app()
+
+    flask --app app migrate-db
+    flask --app app seed-demo
+    flask --app app import-data courses courses.csv --report rejected.csv
+    flask --app app recompute-stats
+"""
+
+import click
+from flask.cli import with_appcontext
+
+from app import db, User, Course, Enrollment, course_catalog, hash_password, migrate_schema, sync_enrolled_counts
+from grade_stats import recompute_grade_stats
+from importer import BulkImporter, KINDS as IMPORT_KINDS, read_rows
+
+# The demo campus from the course's example data: (username, first, last, password)
+DEMO_ADMIN = ('admin', 'Admin', 'User', 'admin123')
+DEMO_TEACHERS = [
+    ('ahepworth', 'Ammon', 'Hepworth', 'teacher123'),
+    ('swalker', 'Susan', 'Walker', 'teacher123'),
+    ('rjenkins', 'Ralph', 'Jenkins', 'teacher123'),
+]
+DEMO_STUDENTS = [
+    (username, first, last, 'student123') for username, first, last in [
+        ('cnorris', 'Chuck', 'Norris'), ('mnorris', 'Mindy', 'Norris'), ('aranganath', 'Aditya', 'Ranganath'),
+        ('nlittle', 'Nancy', 'Little'), ('ychen', 'Yi Wen', 'Chen'), ('jstuart', 'John', 'Stuart'),
+        ('jsantos', 'Jose', 'Santos'), ('bbrown', 'Betty', 'Brown'), ('lcheng', 'Li', 'Cheng'),
+        ('mgarcia', 'Michael', 'Garcia'), ('ewhite', 'Emily', 'White'), ('rjohnson', 'Robert', 'Johnson'),
+        ('amartinez', 'Anna', 'Martinez'), ('tkim', 'Thomas', 'Kim'), ('jwilson', 'Jessica', 'Wilson'),
+        ('dclark', 'Daniel', 'Clark'), ('smoore', 'Sophia', 'Moore'), ('ataylor', 'Alex', 'Taylor'),
+        ('mhughes', 'Maya', 'Hughes'), ('cwright', 'Chris', 'Wright'),
+    ]
+]
+# (name, teacher, time, capacity, [(student, grade), ...])
+DEMO_COURSES = [
+    ('Math 101', 'rjenkins', 'MWF 10:00-10:50 AM', 8,
+     [('jsantos', 92), ('bbrown', 65), ('jstuart', 86), ('lcheng', 77)]),
+    ('Physics 121', 'swalker', 'TR 11:00-11:50 AM', 10,
+     [('nlittle', 53), ('lcheng', 85), ('mnorris', 94), ('jstuart', 91), ('bbrown', 88)]),
+    ('CS 106', 'ahepworth', 'MWF 2:00-2:50 PM', 10,
+     [('aranganath', 93), ('ychen', 85), ('nlittle', 57), ('mnorris', 68)]),
+    ('CS 162', 'ahepworth', 'TR 3:00-3:50 PM', 4,
+     [('aranganath', 99), ('nlittle', 87), ('ychen', 92), ('jstuart', 67)]),
+]
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db():
+    """Create missing tables, columns and indexes in an existing database."""
+    db.create_all()
+    migrate_schema()
+    click.echo('Database schema is up to date')
+
+
+@click.command('seed-demo')
+@with_appcontext
+def seed_demo():
+    """Create the schema and load the demo accounts, courses and grades into an empty database."""
+    db.create_all()
+    migrate_schema()
+    if User.query.first() is not None:
+        click.echo('The database already has users; nothing was seeded')
+        return
+    
+    users = {}
+    for role, accounts in (('admin', [DEMO_ADMIN]), ('teacher', DEMO_TEACHERS), ('student', DEMO_STUDENTS)):
+        for username, first, last, password in accounts:
+            users[username] = User(username=username, role=role, first_name=first, last_name=last)
+            users[username].set_password(password)
+            db.session.add(users[username])
+    db.session.flush()
+    
+    for name, teacher, time, capacity, roster in DEMO_COURSES:
+        course = Course(name=name, teacher_id=users[teacher].id, time=time, capacity=capacity)
+        db.session.add(course)
+        db.session.flush()
+        for student, grade in roster:
+            db.session.add(Enrollment(student_id=users[student].id, course_id=course.id, grade=grade))
+    
+    db.session.flush()
+    sync_enrolled_counts()
+    recompute_grade_stats(db.session)
+    db.session.commit()
+    course_catalog.invalidate()
+    click.echo(f'Seeded {len(users)} users and {len(DEMO_COURSES)} courses')
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction.')
+@click.option('--report', type=click.Path(dir_okay=False), help='Write rejected rows to this CSV file.')
+@with_appcontext
+def import_data(kind, path, chunk_size, report):
+    """Bulk import users, courses or enrollments from a CSV or XLSX file."""
+    importer = BulkImporter(db.session, chunk_size=chunk_size, on_chunk=course_catalog.invalidate,
+                            hash_password=hash_password)
+    with open(path, 'rb') as source:
+        result = importer.run(kind, read_rows(source, path))
+    
+    if kind == 'enrollments' and result.imported:
+        recompute_grade_stats(db.session)
+        db.session.commit()
+    
+    click.echo(f'Imported {result.imported} {kind}, rejected {len(result.rejections)}')
+    if report:
+        result.write_report(report)
+        click.echo(f'Rejection report written to {report}')
+
+
+@click.command('recompute-stats')
+@with_appcontext
+def recompute_stats():
+    """Rebuild the course and student grade statistics from the enrollment table."""
+    recompute_grade_stats(db.session)
+    db.session.commit()
+    click.echo('Grade statistics recomputed')
+
+
+def register_commands(app):
+    for command in (migrate_db, seed_demo, import_data, recompute_stats):
+        app.cli.add_command(command)
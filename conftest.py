@@ -0,0 +1,147 @@
+"""
+Shared pytest fixtures for the UC Merced Enrollment System
+"""
+
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported anywhere
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+os.environ['METRICS_ENABLED'] = '1'
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import (
+    app as flask_app, db, User, Course, Enrollment, Waitlist, CourseStats, StudentStats, sync_enrolled_counts,
+    course_catalog, identity_cache
+)
+from grade_stats import recompute_grade_stats
+
+# A single cheap hash keeps seeding fast; tests never log in with a password
+TEST_PASSWORD_HASH = generate_password_hash('password', method='pbkdf2:sha256:1')
+
+
+def seed_campus(num_students=20):
+    """Load the demo teachers and courses plus `num_students` students."""
+    admin = User(username='admin', role='admin', first_name='Admin', last_name='User',
+                 password_hash=TEST_PASSWORD_HASH)
+    db.session.add(admin)
+
+    teachers = {}
+    for username, first, last in [('ahepworth', 'Ammon', 'Hepworth'),
+                                  ('swalker', 'Susan', 'Walker'),
+                                  ('rjenkins', 'Ralph', 'Jenkins')]:
+        teachers[username] = User(username=username, role='teacher', first_name=first, last_name=last,
+                                  password_hash=TEST_PASSWORD_HASH)
+        db.session.add(teachers[username])
+
+    students = []
+    for i in range(num_students):
+        student = User(username=f'student{i}', role='student', first_name=f'First{i}', last_name=f'Last{i}',
+                       password_hash=TEST_PASSWORD_HASH)
+        students.append(student)
+        db.session.add(student)
+
+    db.session.flush()
+
+    courses = {}
+    for name, teacher, time, capacity in [('Math 101', 'rjenkins', 'MWF 10:00-10:50 AM', 8),
+                                          ('Physics 121', 'swalker', 'TR 11:00-11:50 AM', 10),
+                                          ('CS 106', 'ahepworth', 'MWF 2:00-2:50 PM', 10),
+                                          ('CS 162', 'ahepworth', 'TR 3:00-3:50 PM', 4)]:
+        courses[name] = Course(name=name, teacher_id=teachers[teacher].id, time=time, capacity=capacity)
+        db.session.add(courses[name])
+
+    db.session.flush()
+
+    for student in students[:3]:
+        db.session.add(Enrollment(student_id=student.id, course_id=courses['Math 101'].id, grade=85))
+
+    db.session.flush()
+    sync_enrolled_counts()
+    recompute_grade_stats(db.session)
+    db.session.commit()
+    course_catalog.invalidate()
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_campus()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login_as(client, user):
+    """Put `user` in the client's session without going through /login."""
+    with client.session_transaction() as sess:
+        identity_cache.remember(sess, user)
+
+
+class QueryCounter:
+    """Count the SQL statements issued on the app's engine."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._callback)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._callback)
+
+    def _callback(self, *args):
+        self.count += 1
+
+
+def fill_course(name, students):
+    """Enroll `students` in the named course, without grades, and return it."""
+    course = Course.query.filter_by(name=name).one()
+    for student in students:
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+    course.enrolled_count = len(students)
+    db.session.commit()
+    return course
+
+
+def queue(course, students):
+    """Put `students` on the course's waitlist, in order."""
+    for student in students:
+        db.session.add(Waitlist(student_id=student.id, course_id=course.id))
+    db.session.commit()
+
+
+def students():
+    """Every student, oldest account first."""
+    return User.query.filter_by(role='student').order_by(User.id).all()
+
+
+def grade_stats_snapshot():
+    """The non-empty course and student statistics rows, as plain tuples."""
+    db.session.expire_all()
+    return ({row.course_id: (row.graded_count, row.grade_sum, row.grade_sum_squares, row.missing_count, row.bucket_a,
+                             row.bucket_b, row.bucket_c, row.bucket_d, row.bucket_f)
+             for row in CourseStats.query if row.graded_count or row.missing_count},
+            {row.student_id: (row.graded_count, row.grade_sum, row.grade_points, row.missing_count)
+             for row in StudentStats.query if row.graded_count or row.missing_count})
+
+
+def assert_matches_recompute():
+    """Check that the incrementally kept statistics equal a full rebuild."""
+    incremental = grade_stats_snapshot()
+    recompute_grade_stats(db.session)
+    db.session.commit()
+    assert incremental == grade_stats_snapshot()
@@ -0,0 +1,90 @@
+"""
+Database engine profiles for the UC Merced Enrollment System
+
+The development profile keeps SQLAlchemy's defaults, apart from enforcing
+foreign keys on SQLite, which the schema's ON DELETE CASCADE relies on. The
+production profile sizes the connection pool and, for SQLite, switches the
+database to WAL so readers no longer block behind the writer, relaxes fsyncs
+to synchronous=NORMAL, waits on a busy database instead of failing with
+"database is locked", and enables memory-mapped I/O and a larger page cache.
+
+Every setting can be overridden through environment variables:
+
+    DB_PROFILE          development | production
+    DB_POOL_SIZE        pooled connections kept open (default 10)
+    DB_MAX_OVERFLOW     extra connections allowed under load (default 20)
+    DB_POOL_TIMEOUT     seconds to wait for a pooled connection (default 10)
+    DB_BUSY_TIMEOUT_MS  how long SQLite waits on a locked database (default 5000)
+    DB_MMAP_SIZE        bytes of the database file to memory-map (default 256 MB)
+    DB_CACHE_SIZE_KB    page cache per connection in KB (default 65536)
+"""
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+PROFILES = ('development', 'production')
+
+
+def _env_int(env, name, default):
+    return int(env.get(name, default))
+
+
+def _is_sqlite_file(url):
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri, profile, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URI and profile."""
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown DB_PROFILE "{profile}", expected one of {", ".join(PROFILES)}')
+
+    url = make_url(uri)
+    if profile == 'development' or (url.get_backend_name() == 'sqlite' and not _is_sqlite_file(url)):
+        return {}
+
+    options = {
+        'pool_size': _env_int(env, 'DB_POOL_SIZE', 10),
+        'max_overflow': _env_int(env, 'DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int(env, 'DB_POOL_TIMEOUT', 10)
+    }
+
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': _env_int(env, 'DB_BUSY_TIMEOUT_MS', 5000) / 1000}
+    else:
+        # Server databases drop idle connections; check them before use
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = 1800
+
+    return options
+
+
+def sqlite_pragmas(profile, env=os.environ):
+    """PRAGMA settings applied to every new SQLite connection for the profile."""
+    # Every profile enforces foreign keys, so ON DELETE CASCADE does its job
+    if profile != 'production':
+        return {'foreign_keys': 'ON'}
+
+    return {
+        'foreign_keys': 'ON',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': _env_int(env, 'DB_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int(env, 'DB_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': -_env_int(env, 'DB_CACHE_SIZE_KB', 65536),
+        'temp_store': 'MEMORY'
+    }
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run the given PRAGMAs on each connection the engine opens."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
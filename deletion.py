@@ -0,0 +1,139 @@
+"""
+Set-based deletion of users, courses and enrollments
+
+Enrollments, waitlist entries and statistics rows that belong to a deleted
+user or course are removed by the database through ON DELETE CASCADE
+(SQLite needs PRAGMA foreign_keys=ON, see db_profile.py), so nothing is
+loaded into the session. Before that, a few statements over the whole set
+hand back the seats of the enrollments going away and take their grades
+out of the statistics. Courses that keep running pass their freed seats to
+`promote`, which moves each course's waitlist up in the same transaction.
+
+By default one call is one transaction. With `chunk_size` the enrollments
+are first deleted `chunk_size` rows at a time, each batch in its own short
+transaction. Deleting a teacher of large courses then never holds the
+database write lock (on SQLite, every enroll on the site) for long.
+"""
+
+from grade_stats import expanding_text, subtract_enrollments
+
+
+class DeletionResult:
+    """Counts the rows deleted and the courses whose seats were freed."""
+
+    def __init__(self):
+        self.users = 0
+        self.courses = 0
+        self.enrollments = 0
+        self.batches = 0
+        self.freed_course_ids = set()
+
+    def to_dict(self):
+        return {
+            'users': self.users,
+            'courses': self.courses,
+            'enrollments': self.enrollments,
+            'batches': self.batches
+        }
+
+
+class DeletionService:
+    """Deletes rows with set-based statements and database-level cascades.
+
+    Every delete_* method commits; on an error the open transaction is
+    rolled back and the exception re-raised. In chunked mode the batches
+    already committed stay deleted, and calling the method again finishes
+    the job.
+    """
+
+    def __init__(self, db_session, chunk_size=None, promote=None):
+        self.session = db_session
+        self.chunk_size = chunk_size
+        self.promote = promote
+
+    def delete_enrollments(self, enrollment_ids):
+        return self._run(self._delete_enrollments, list(enrollment_ids))
+
+    def delete_courses(self, course_ids):
+        return self._run(self._delete_courses, list(course_ids))
+
+    def delete_users(self, user_ids):
+        return self._run(self._delete_users, list(user_ids))
+
+    def _run(self, delete, ids):
+        result = DeletionResult()
+        if not ids:
+            return result
+        try:
+            delete(ids, result)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return result
+
+    def _delete_enrollments(self, ids, result):
+        condition, params = 'id IN :enrollment_ids', {'enrollment_ids': ids}
+        self._drain(condition, params, result, promote=True)
+        self._release(condition, params, result, promote=True)
+
+    def _delete_courses(self, ids, result):
+        condition, params = 'course_id IN :course_ids', {'course_ids': ids}
+        self._drain(condition, params, result, promote=False)
+        self._release(condition, params, result, promote=False)
+        result.courses = self._execute("DELETE FROM course WHERE id IN :course_ids", params).rowcount
+
+    def _delete_users(self, ids, result):
+        params = {'user_ids': ids}
+        taught = 'course_id IN (SELECT id FROM course WHERE teacher_id IN :user_ids)'
+        attended = 'student_id IN :user_ids'
+        self._drain(taught, params, result, promote=False)
+        self._drain(attended, params, result, promote=False)
+
+        self._release(taught, params, result, promote=False)
+        self._release(attended, params, result, promote=False)
+        result.courses = self._execute("DELETE FROM course WHERE teacher_id IN :user_ids", params).rowcount
+        result.users = self._execute('DELETE FROM "user" WHERE id IN :user_ids', params).rowcount
+        # Promote only once the users' own waitlist entries are gone; deleted
+        # courses have no seats to hand out and are skipped by `promote`.
+        self._promote(result.freed_course_ids)
+
+    def _drain(self, condition, params, result, promote):
+        """In chunked mode, delete the matching enrollments batch by batch, committing each batch."""
+        if not self.chunk_size:
+            return
+
+        while True:
+            batch = [row[0] for row in self._execute(
+                f"SELECT id FROM enrollment WHERE {condition} ORDER BY id LIMIT :limit",
+                dict(params, limit=self.chunk_size)
+            )]
+            if not batch:
+                return
+            self._release('id IN :batch_ids', {'batch_ids': batch}, result, promote)
+            result.batches += 1
+            self.session.commit()
+
+    def _release(self, condition, params, result, promote):
+        """Give back the seats and grades of the matching enrollments, then delete them."""
+        # The first statement writes, so on SQLite the matching rows cannot
+        # change under the rest of the transaction.
+        subtract_enrollments(self.session, condition, params)
+        self._execute(
+            f"UPDATE course SET enrolled_count = enrolled_count - "
+            f"(SELECT COUNT(*) FROM enrollment WHERE enrollment.course_id = course.id AND {condition}) "
+            f"WHERE id IN (SELECT course_id FROM enrollment WHERE {condition})", params
+        )
+        freed = {row[0] for row in self._execute(f"SELECT DISTINCT course_id FROM enrollment WHERE {condition}", params)}
+        result.enrollments += self._execute(f"DELETE FROM enrollment WHERE {condition}", params).rowcount
+        result.freed_course_ids |= freed
+        if promote:
+            self._promote(freed)
+
+    def _promote(self, course_ids):
+        if self.promote is not None:
+            for course_id in sorted(course_ids):
+                self.promote(course_id)
+
+    def _execute(self, sql, params):
+        return self.session.execute(expanding_text(sql, params), params)
@@ -0,0 +1,197 @@
+"""
+Materialized grade statistics per course and per student
+
+course_stats keeps, for each course, the number of graded and ungraded
+enrollments, the sum and sum of squares of the grades and a letter-grade
+histogram. student_stats keeps the same counts per student plus their grade
+points. Reading a course's mean, spread and distribution, or a student's
+average and GPA, is then a primary-key lookup.
+
+The rows are maintained incrementally: every write that adds, removes or
+regrades an enrollment reports the change with apply_grade_changes() in its
+own transaction, and bulk deletes subtract whole sets of enrollments with
+subtract_enrollments(). recompute_grade_stats() rebuilds both tables from
+the enrollment table, for repairs and after bulk loads.
+"""
+
+import math
+from collections import Counter
+
+from sqlalchemy import bindparam, text
+
+# Lower bound and grade points of each letter, best first
+LETTERS = (('a', 90, 4), ('b', 80, 3), ('c', 70, 2), ('d', 60, 1), ('f', None, 0))
+
+# Marks the side of a change where the student is not enrolled in the course
+ABSENT = object()
+
+COURSE_COLUMNS = ['graded_count', 'grade_sum', 'grade_sum_squares', 'missing_count'] + \
+    [f'bucket_{letter}' for letter, _, _ in LETTERS]
+STUDENT_COLUMNS = ['graded_count', 'grade_sum', 'grade_points', 'missing_count']
+
+
+def parse_grade(value):
+    """A grade from a request or an import: None or '' clears it, anything else must be an integer 0-100."""
+    if value is None or value == '':
+        return None
+    grade = int(value)
+    if not 0 <= grade <= 100:
+        raise ValueError(value)
+    return grade
+
+
+def letter(grade):
+    for name, lower, points in LETTERS:
+        if lower is None or grade >= lower:
+            return name, points
+
+
+def _contribution(grade):
+    """What one enrollment with `grade` adds to the course and student rows."""
+    if grade is ABSENT:
+        return Counter(), Counter()
+    if grade is None:
+        return Counter(missing_count=1), Counter(missing_count=1)
+
+    name, points = letter(grade)
+    course = Counter(graded_count=1, grade_sum=grade, grade_sum_squares=grade * grade)
+    course[f'bucket_{name}'] = 1
+    student = Counter(graded_count=1, grade_sum=grade, grade_points=points)
+    return course, student
+
+
+def _upsert(key, table, columns):
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in columns)
+    return text(
+        f"INSERT INTO {table} ({key}, {', '.join(columns)}) "
+        f"VALUES (:{key}, {', '.join(':' + column for column in columns)}) "
+        f"ON CONFLICT ({key}) DO UPDATE SET {updates}"
+    )
+
+
+COURSE_UPSERT = _upsert('course_id', 'course_stats', COURSE_COLUMNS)
+STUDENT_UPSERT = _upsert('student_id', 'student_stats', STUDENT_COLUMNS)
+
+
+def apply_grade_changes(db_session, changes):
+    """Fold (student_id, course_id, old_grade, new_grade) changes into the stats rows.
+
+    A grade is an int, None for an ungraded enrollment, or ABSENT when the
+    student is not enrolled on that side of the change: enrolling is
+    (s, c, ABSENT, None) and unenrolling (s, c, grade, ABSENT). Runs in the
+    caller's transaction; each row is changed with one additive upsert, so
+    concurrent writers never lose an update.
+    """
+    courses, students = {}, {}
+    for student_id, course_id, old, new in changes:
+        old_course, old_student = _contribution(old)
+        new_course, new_student = _contribution(new)
+        course = courses.setdefault(course_id, Counter())
+        course.update(new_course)
+        course.subtract(old_course)
+        student = students.setdefault(student_id, Counter())
+        student.update(new_student)
+        student.subtract(old_student)
+
+    course_rows = [dict({column: delta[column] for column in COURSE_COLUMNS}, course_id=course_id)
+                   for course_id, delta in courses.items() if any(delta.values())]
+    student_rows = [dict({column: delta[column] for column in STUDENT_COLUMNS}, student_id=student_id)
+                    for student_id, delta in students.items() if any(delta.values())]
+    if course_rows:
+        db_session.execute(COURSE_UPSERT, course_rows)
+    if student_rows:
+        db_session.execute(STUDENT_UPSERT, student_rows)
+
+
+def _bucket_sql(lower, upper):
+    conditions = ['grade IS NOT NULL']
+    if lower is not None:
+        conditions.append(f'grade >= {lower}')
+    if upper is not None:
+        conditions.append(f'grade < {upper}')
+    return f"SUM(CASE WHEN {' AND '.join(conditions)} THEN 1 ELSE 0 END)"
+
+
+def _aggregates():
+    """SQL expressions computing COURSE_COLUMNS and STUDENT_COLUMNS over a group of enrollment rows."""
+    buckets, points, upper = [], [], None
+    for _, lower, grade_points in LETTERS:
+        buckets.append(_bucket_sql(lower, upper))
+        points.append(f'{grade_points} * {_bucket_sql(lower, upper)}')
+        upper = lower
+
+    missing = 'SUM(CASE WHEN grade IS NULL THEN 1 ELSE 0 END)'
+    course = ['COUNT(grade)', 'COALESCE(SUM(grade), 0)', 'COALESCE(SUM(grade * grade), 0)', missing] + buckets
+    student = ['COUNT(grade)', 'COALESCE(SUM(grade), 0)', ' + '.join(points), missing]
+    return course, student
+
+
+def expanding_text(sql, params):
+    """text(sql) with every list or tuple in `params` bound as an expanding IN (...) parameter."""
+    return text(sql).bindparams(*[bindparam(name, expanding=True)
+                                  for name, value in params.items() if isinstance(value, (list, tuple))])
+
+
+def recompute_grade_stats(db_session):
+    """Rebuild course_stats and student_stats from the enrollment table. Does not commit."""
+    course, student = _aggregates()
+
+    db_session.execute(text("DELETE FROM course_stats"))
+    db_session.execute(text("DELETE FROM student_stats"))
+    db_session.execute(text(
+        f"INSERT INTO course_stats (course_id, {', '.join(COURSE_COLUMNS)}) "
+        f"SELECT course_id, {', '.join(course)} FROM enrollment GROUP BY course_id"
+    ))
+    db_session.execute(text(
+        f"INSERT INTO student_stats (student_id, {', '.join(STUDENT_COLUMNS)}) "
+        f"SELECT student_id, {', '.join(student)} FROM enrollment GROUP BY student_id"
+    ))
+
+
+def subtract_enrollments(db_session, condition, params):
+    """Take the enrollment rows matching `condition` out of both tables, one UPDATE per table.
+
+    Used before deleting many enrollments at once; the rows must still exist.
+    """
+    course, student = _aggregates()
+    for table, key, columns, expressions in (('course_stats', 'course_id', COURSE_COLUMNS, course),
+                                             ('student_stats', 'student_id', STUDENT_COLUMNS, student)):
+        # Each affected row subtracts its own group of enrollments, found
+        # through the enrollment indexes on course_id and student_id
+        remaining = ', '.join(f'{table}.{column} - {expression}' for column, expression in zip(columns, expressions))
+        db_session.execute(expanding_text(
+            f"UPDATE {table} SET ({', '.join(columns)}) = "
+            f"(SELECT {remaining} FROM enrollment WHERE enrollment.{key} = {table}.{key} AND {condition}) "
+            f"WHERE {key} IN (SELECT {key} FROM enrollment WHERE {condition})", params
+        ), params)
+
+
+def course_summary(row):
+    """Average, standard deviation and letter distribution from a course_stats row (or None)."""
+    values = {column: getattr(row, column) if row is not None else 0 for column in COURSE_COLUMNS}
+    graded = values['graded_count']
+    average = stddev = None
+    if graded:
+        average = values['grade_sum'] / graded
+        stddev = math.sqrt(max(values['grade_sum_squares'] / graded - average * average, 0))
+
+    return {
+        'enrolled': graded + values['missing_count'],
+        'graded': graded,
+        'missing': values['missing_count'],
+        'average': round(average, 2) if average is not None else None,
+        'stddev': round(stddev, 2) if stddev is not None else None,
+        'distribution': {name.upper(): values[f'bucket_{name}'] for name, _, _ in LETTERS}
+    }
+
+
+def transcript_summary(row):
+    """Course count, average grade and GPA from a student_stats row (or None)."""
+    values = {column: getattr(row, column) if row is not None else 0 for column in STUDENT_COLUMNS}
+    graded = values['graded_count']
+    return {
+        'courses': graded + values['missing_count'],
+        'graded': graded,
+        'average': round(values['grade_sum'] / graded, 2) if graded else None,
+        'gpa': round(values['grade_points'] / graded, 2) if graded else None
+    }
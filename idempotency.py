@@ -0,0 +1,157 @@
+"""
+Idempotency keys for the UC Merced Enrollment System
+
+A client may send an Idempotency-Key header with a write. The first request
+with a key claims it and runs; its response is then stored under the key,
+and a repeat of the same request, a double-click or a retry after a lost
+response, gets the stored response back without running again. A repeat
+that arrives while the first is still running is told so (409), and reusing
+a key for a different request body is refused (422).
+
+Keys are scoped to the caller and the endpoint, so two users cannot collide.
+Entries live in a backend: MemoryIdempotencyBackend for one process, or
+SqliteIdempotencyBackend to share them between workers through a small
+local file.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MAX_KEY_LENGTH = 255
+
+# How long a claimed key stays locked if its request never finishes
+PENDING_TTL = 60
+
+
+class MemoryIdempotencyBackend:
+    """Keeps the entries in this process only, oldest first."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def claim(self, key, fingerprint, ttl):
+        """Claim `key` for a new request: None if claimed, else the entry (fingerprint, status, body) holding it."""
+        now = time.time()
+        with self._lock:
+            # Entries expire in the order they were written, give or take a pending one
+            while self._entries and next(iter(self._entries.values()))[0] <= now:
+                self._entries.popitem(last=False)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1:]
+            self._entries[key] = (now + ttl, fingerprint, None, None)
+            return None
+
+    def store(self, key, fingerprint, status, body, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, fingerprint, status, body)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SqliteIdempotencyBackend:
+    """Shares the entries between processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, expires REAL NOT NULL, '
+                         'fingerprint TEXT NOT NULL, status INTEGER, body TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires)')
+
+    def _connect(self):
+        # One connection per thread, kept open, in WAL mode without a sync per
+        # commit: a key lost in a crash only means a retry runs again.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key, fingerprint, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM idempotency WHERE expires <= ?', (now,))
+            claimed = conn.execute('INSERT OR IGNORE INTO idempotency (key, expires, fingerprint) VALUES (?, ?, ?)',
+                                   (key, now + ttl, fingerprint)).rowcount
+            if claimed:
+                return None
+            return conn.execute('SELECT fingerprint, status, body FROM idempotency WHERE key = ?', (key,)).fetchone()
+
+    def store(self, key, fingerprint, status, body, ttl):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO idempotency (key, expires, fingerprint, status, body) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, time.time() + ttl, fingerprint, status, body))
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM idempotency WHERE key = ?', (key,))
+
+
+def make_idempotency_backend(store):
+    """Pick a backend from the IDEMPOTENCY_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryIdempotencyBackend()
+    return SqliteIdempotencyBackend(store)
+
+
+def _error(status, message):
+    return status, json.dumps({'success': False, 'message': message})
+
+
+class IdempotencyCache:
+    """Stores the responses to keyed writes for `ttl` seconds and replays them to repeats."""
+
+    def __init__(self, backend=None, ttl=24 * 60 * 60):
+        self.backend = backend or MemoryIdempotencyBackend()
+        self.ttl = ttl
+        self.replays = 0
+        self.conflicts = 0
+
+    def begin(self, scope, key, body):
+        """None if the request should run, else the (status, JSON body) to answer it with.
+
+        `scope` names the caller and endpoint; `body` is the raw request body.
+        A request that runs must end with finish() or release().
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(400, f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters')
+
+        fingerprint = hashlib.sha256(body).hexdigest()
+        entry = self.backend.claim(f'{scope}:{key}', fingerprint, PENDING_TTL)
+        if entry is None:
+            return None
+
+        stored_fingerprint, status, stored_body = entry
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            return _error(422, 'Idempotency-Key was already used for a different request')
+        if status is None:
+            self.conflicts += 1
+            return _error(409, 'A request with this Idempotency-Key is still being processed')
+        self.replays += 1
+        return status, stored_body
+
+    def finish(self, scope, key, body, status, response_body):
+        """Keep a finished request's response; failures are released instead so the client can retry."""
+        if 200 <= status < 300:
+            self.backend.store(f'{scope}:{key}', hashlib.sha256(body).hexdigest(), status, response_body, self.ttl)
+        else:
+            self.release(scope, key)
+
+    def release(self, scope, key):
+        self.backend.release(f'{scope}:{key}')
+
+    def stats(self):
+        return {'replays': self.replays, 'conflicts': self.conflicts}
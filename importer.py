@@ -0,0 +1,401 @@
+"""
+Bulk import of users, courses and enrollments from CSV or XLSX files
+
+Rows are streamed from the file and handled in chunks. Each chunk is
+validated against in-memory maps (usernames and course names to ids, seats
+left per course, existing enrollments), written with one executemany INSERT
+and committed in its own transaction. Rows that fail validation are skipped
+and collected in a rejection report.
+
+Expected columns:
+    users:       username, first_name, last_name, role, [password], [password_hash]
+    courses:     name, teacher, time, capacity      (teacher is a username)
+    enrollments: student, course, [grade]           (student is a username, course a course name)
+
+Courses and enrollments can also come from a class roster, the layout of the
+registrar's spreadsheets: Class Name, Teacher Name, Time, Capacity, Student
+Names, Grades. Each class is written once, on the line of its first student,
+with its other students on the lines below and blank lines between classes.
+Teachers and students are named in full there, and a name must match exactly
+one user with that role.
+
+Reading .xlsx files needs the optional openpyxl package.
+"""
+
+import csv
+import io
+import itertools
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+from auth import PasswordPolicy
+from grade_stats import parse_grade
+from schedule import meeting_columns
+
+KINDS = ('users', 'courses', 'enrollments')
+ROLES = ('student', 'teacher', 'admin')
+DEFAULT_PASSWORD = 'defaultpassword123'
+DEFAULT_CHUNK_SIZE = 5000
+# Largest value an INTEGER column holds on every supported database
+MAX_CAPACITY = 2 ** 31 - 1
+
+
+def read_rows(stream, filename):
+    """Yield each data row of a CSV or XLSX file as a dict keyed by lower-cased header."""
+    if filename.lower().endswith('.xlsx'):
+        return _read_xlsx(stream)
+    return _read_csv(stream)
+
+
+def _read_csv(stream):
+    if isinstance(stream, io.TextIOBase):
+        text_stream = stream
+    else:
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    for row in csv.DictReader(text_stream):
+        yield {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+
+def _read_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError('Importing .xlsx files requires the openpyxl package')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+        for values in rows:
+            yield {key: '' if value is None else str(value).strip() for key, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def _capacity(value):
+    """A capacity cell as an int, or 0 if it is not a whole number in range; spreadsheets give 30 as 30.0."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0
+    # inf and nan are not integers either
+    if not number.is_integer() or number > MAX_CAPACITY:
+        return 0
+    return int(number)
+
+
+def _name_key(name):
+    return ' '.join(name.split()).casefold()
+
+
+def roster_rows(rows, kind):
+    """The rows of a class roster as rows of `kind`, one for each line so line numbers still match."""
+    if kind == 'users':
+        raise ValueError('A class roster has no usernames; import users from a users file first')
+
+    course = ''
+    for row in rows:
+        if row.get('class name'):
+            course = row['class name']
+            if kind == 'courses':
+                yield {'name': course, 'teacher_name': row.get('teacher name', ''), 'time': row.get('time', ''),
+                       'capacity': row.get('capacity', '')}
+                continue
+        if kind == 'courses' or not row.get('student names'):
+            # Continuation and blank lines: nothing to import for this kind
+            yield {}
+        else:
+            yield {'course': course, 'student_name': row['student names'], 'grade': row.get('grades', '')}
+
+
+class ImportResult:
+    """Counts imported rows and records why each rejected row was skipped."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.rejections = []
+
+    def reject(self, line, reason, row):
+        self.rejections.append({'line': line, 'reason': reason, 'row': row})
+
+    def sorted_rejections(self):
+        # Rows are rejected in several passes per chunk; report them in file order
+        return sorted(self.rejections, key=lambda rejection: rejection['line'])
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'imported': self.imported,
+            'rejected': len(self.rejections),
+            'rejections': self.sorted_rejections()
+        }
+
+    def write_report(self, path):
+        with open(path, 'w', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(['line', 'reason', 'row'])
+            for rejection in self.sorted_rejections():
+                writer.writerow([rejection['line'], rejection['reason'],
+                                 ', '.join(f'{k}={v}' for k, v in rejection['row'].items())])
+
+
+class BulkImporter:
+    """Streams rows of one kind into the database in chunked transactions."""
+
+    def __init__(self, session, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None, hash_password=None):
+        self.session = session
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.hash_password = hash_password or PasswordPolicy().hash
+        self._users = None
+        self._people = None
+        self._courses = None
+        self._default_hash = None
+
+    def run(self, kind, rows):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown import kind: {kind}')
+
+        handler = getattr(self, f'_import_{kind}')
+        result = ImportResult(kind)
+        chunk = []
+
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return result
+        rows = itertools.chain([first], rows)
+        if 'class name' in first and 'student names' in first:
+            rows = roster_rows(rows, kind)
+
+        # Line 1 of every file is the header
+        for line, row in enumerate(rows, start=2):
+            if not any(row.values()):
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                self._commit_chunk(handler, chunk, result)
+                chunk = []
+
+        if chunk:
+            self._commit_chunk(handler, chunk, result)
+
+        return result
+
+    def _commit_chunk(self, handler, chunk, result):
+        try:
+            result.imported += handler(chunk, result)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        if self.on_chunk is not None:
+            self.on_chunk()
+
+    @property
+    def users(self):
+        """username -> (id, role) for every existing user."""
+        if self._users is None:
+            rows = self.session.execute(text('SELECT username, id, role FROM "user"'))
+            self._users = {username: (user_id, role) for username, user_id, role in rows}
+        return self._users
+
+    @property
+    def people(self):
+        """Full name, case and spacing ignored -> [(id, role), ...] for every existing user."""
+        if self._people is None:
+            self._people = {}
+            rows = self.session.execute(text('SELECT first_name, last_name, id, role FROM "user"'))
+            for first_name, last_name, user_id, role in rows:
+                self._people.setdefault(_name_key(f'{first_name} {last_name}'), []).append((user_id, role))
+        return self._people
+
+    def _find_user(self, row, field, role):
+        """(id, None) for the `role` user a row names by username or full name, else (None, reason)."""
+        username, full_name = row.get(field, ''), row.get(f'{field}_name', '')
+        if username or not full_name:
+            user = self.users.get(username)
+            if user is None or user[1] != role:
+                return None, f'Unknown {role} "{username}"'
+            return user[0], None
+
+        matches = [user_id for user_id, user_role in self.people.get(_name_key(full_name), []) if user_role == role]
+        if len(matches) != 1:
+            return None, f'{"Ambiguous" if matches else "Unknown"} {role} "{full_name.strip()}"'
+        return matches[0], None
+
+    @property
+    def courses(self):
+        """course name -> id for every existing course."""
+        if self._courses is None:
+            rows = self.session.execute(text("SELECT name, id FROM course"))
+            self._courses = {name: course_id for name, course_id in rows}
+        return self._courses
+
+    def _hash_password(self, row):
+        if row.get('password_hash'):
+            return row['password_hash']
+        if row.get('password'):
+            return self.hash_password(row['password'])
+
+        # Rows without a password share one hash of the default password
+        # instead of paying for a fresh hash each.
+        if self._default_hash is None:
+            self._default_hash = self.hash_password(DEFAULT_PASSWORD)
+        return self._default_hash
+
+    def _import_users(self, chunk, result):
+        batch = []
+        for line, row in chunk:
+            username = row.get('username', '')
+            if not (username and row.get('first_name') and row.get('last_name')):
+                result.reject(line, 'Missing username, first_name or last_name', row)
+            elif row.get('role') not in ROLES:
+                result.reject(line, f'Unknown role "{row.get("role", "")}"', row)
+            elif username in self.users:
+                result.reject(line, 'Username already exists', row)
+            else:
+                self.users[username] = (None, row['role'])
+                batch.append({
+                    'username': username,
+                    'password_hash': self._hash_password(row),
+                    'role': row['role'],
+                    'first_name': row['first_name'],
+                    'last_name': row['last_name']
+                })
+
+        if not batch:
+            return 0
+
+        self.session.execute(text(
+            'INSERT INTO "user" (username, password_hash, role, first_name, last_name) '
+            'VALUES (:username, :password_hash, :role, :first_name, :last_name)'
+        ), batch)
+
+        new_ids = self.session.execute(
+            text('SELECT username, id, role FROM "user" WHERE username IN :usernames')
+            .bindparams(bindparam('usernames', expanding=True)),
+            {'usernames': [u['username'] for u in batch]}
+        )
+        names = {u['username']: _name_key(f'{u["first_name"]} {u["last_name"]}') for u in batch}
+        for username, user_id, role in new_ids:
+            self.users[username] = (user_id, role)
+            if self._people is not None:
+                self._people.setdefault(names[username], []).append((user_id, role))
+
+        return len(batch)
+
+    def _import_courses(self, chunk, result):
+        batch = []
+        for line, row in chunk:
+            name = row.get('name', '')
+            teacher_id, unknown_teacher = self._find_user(row, 'teacher', 'teacher')
+            capacity = _capacity(row.get('capacity', ''))
+
+            if not (name and row.get('time')):
+                result.reject(line, 'Missing name or time', row)
+            elif unknown_teacher:
+                result.reject(line, unknown_teacher, row)
+            elif capacity <= 0:
+                result.reject(line, 'Capacity must be a positive integer', row)
+            elif name in self.courses:
+                result.reject(line, 'Course already exists', row)
+            else:
+                self.courses[name] = None
+                batch.append(dict(meeting_columns(row['time']), name=name, teacher_id=teacher_id, time=row['time'],
+                                  capacity=capacity))
+
+        if not batch:
+            return 0
+
+        self.session.execute(text(
+            "INSERT INTO course (name, teacher_id, time, capacity, enrolled_count, "
+            "meeting_days, start_minute, end_minute) "
+            "VALUES (:name, :teacher_id, :time, :capacity, 0, :meeting_days, :start_minute, :end_minute)"
+        ), batch)
+
+        new_ids = self.session.execute(
+            text("SELECT name, id FROM course WHERE name IN :names")
+            .bindparams(bindparam('names', expanding=True)),
+            {'names': [c['name'] for c in batch]}
+        )
+        self.courses.update(dict(new_ids.all()))
+
+        return len(batch)
+
+    def _import_enrollments(self, chunk, result):
+        resolved = []
+        for line, row in chunk:
+            student_id, unknown_student = self._find_user(row, 'student', 'student')
+            course_id = self.courses.get(row.get('course', ''))
+
+            if unknown_student:
+                result.reject(line, unknown_student, row)
+                continue
+            if course_id is None:
+                result.reject(line, f'Unknown course "{row.get("course", "")}"', row)
+                continue
+            try:
+                grade = parse_grade(row.get('grade'))
+            except ValueError:
+                result.reject(line, f'Invalid grade "{row["grade"]}", expected 0-100', row)
+                continue
+
+            resolved.append((line, row, student_id, course_id, grade))
+
+        if not resolved:
+            return 0
+
+        # One batch pass over the chunk checks seats and unique_enrollment. The
+        # seat counts are read with a no-op UPDATE, as promote_waitlist() does,
+        # so the course rows stay locked against live enrolls until the commit.
+        course_ids = list({r[3] for r in resolved})
+        seats = {
+            course_id: capacity - enrolled
+            for course_id, enrolled, capacity in self.session.execute(
+                text("UPDATE course SET enrolled_count = enrolled_count WHERE id IN :ids "
+                     "RETURNING id, enrolled_count, capacity")
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': course_ids}
+            )
+        }
+        # Filter on student_id alone so SQLite can walk the unique_enrollment index
+        taken = set(self.session.execute(
+            text("SELECT student_id, course_id FROM enrollment WHERE student_id IN :student_ids")
+            .bindparams(bindparam('student_ids', expanding=True)),
+            {'student_ids': list({r[2] for r in resolved})}
+        ).all())
+
+        now = datetime.utcnow()
+        batch = []
+        added = {}
+        for line, row, student_id, course_id, grade in resolved:
+            if course_id not in seats:
+                result.reject(line, f'Unknown course "{row.get("course", "")}"', row)
+            elif (student_id, course_id) in taken:
+                result.reject(line, 'Already enrolled in this course', row)
+            elif seats[course_id] <= 0:
+                result.reject(line, 'Course is at capacity', row)
+            else:
+                taken.add((student_id, course_id))
+                seats[course_id] -= 1
+                added[course_id] = added.get(course_id, 0) + 1
+                batch.append({'student_id': student_id, 'course_id': course_id, 'grade': grade, 'enrolled_date': now})
+
+        if not batch:
+            return 0
+
+        self.session.execute(text(
+            "INSERT INTO enrollment (student_id, course_id, grade, enrolled_date) "
+            "VALUES (:student_id, :course_id, :grade, :enrolled_date)"
+        ).bindparams(bindparam('enrolled_date', type_=DateTime)), batch)
+        self.session.execute(
+            text("UPDATE course SET enrolled_count = enrolled_count + :added WHERE id = :course_id"),
+            [{'course_id': course_id, 'added': count} for course_id, count in added.items()]
+        )
+
+        return len(batch)
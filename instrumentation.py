@@ -0,0 +1,137 @@
+"""
+Per-request cost instrumentation for the UC Merced Enrollment System
+
+Counts SQL statements and times SQL, template rendering and the whole request
+for every endpoint. Numbers are attached to each response as a Server-Timing
+header and aggregated per endpoint for the admin metrics view.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+
+class RollingStats:
+    """Keeps the most recent samples of one metric and reports percentiles."""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.total += 1
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3)
+        }
+
+
+class Instrumentation:
+    """Hooks SQLAlchemy and Flask to record what each request costs."""
+
+    metrics = ('queries', 'sql_ms', 'template_ms', 'wall_ms')
+
+    def __init__(self, app=None, db=None, window=2048):
+        self.window = window
+        self._lock = threading.Lock()
+        self._routes = defaultdict(lambda: {name: RollingStats(self.window) for name in self.metrics})
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.extensions['instrumentation'] = self
+
+        with app.app_context():
+            self.watch(db.engine)
+
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def watch(self, engine):
+        """Count and time the statements run on `engine`, such as a second, async engine's sync_engine."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def begin(self):
+        """Start a sample for the work done in this app context."""
+        g._metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_ms': 0.0, 'template_ms': 0.0}
+
+    def end(self, endpoint):
+        """Record the app context's sample under `endpoint` and return it; None if none was started."""
+        sample = g.pop('_metrics', None)
+        if sample is None:
+            return None
+
+        sample['wall_ms'] = (time.perf_counter() - sample.pop('start')) * 1000
+        self.record(endpoint, sample)
+        return sample
+
+    def _before_request(self):
+        self.begin()
+
+    def _after_request(self, response):
+        sample = self.end(request.endpoint or 'unknown')
+        if sample is None:
+            return response
+
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={sample["sql_ms"]:.2f};desc="{sample["queries"]} queries"',
+            f'tpl;dur={sample["template_ms"]:.2f}',
+            f'total;dur={sample["wall_ms"]:.2f}'
+        ])
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_start'].pop()
+        sample = g.get('_metrics') if has_app_context() else None
+        if sample is not None:
+            sample['queries'] += 1
+            sample['sql_ms'] += (time.perf_counter() - started) * 1000
+
+    def _before_render(self, sender, template, context, **extra):
+        sample = g.get('_metrics')
+        if sample is not None:
+            sample['_render_start'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        sample = g.get('_metrics')
+        if sample is not None and '_render_start' in sample:
+            sample['template_ms'] += (time.perf_counter() - sample.pop('_render_start')) * 1000
+
+    def record(self, endpoint, sample):
+        with self._lock:
+            stats = self._routes[endpoint]
+            for name in self.metrics:
+                stats[name].add(sample[name])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {name: stat.summary() for name, stat in stats.items()}
+                for endpoint, stats in sorted(self._routes.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
@@ -0,0 +1,139 @@
+"""
+Token-bucket rate limiting for the UC Merced Enrollment System
+
+Each rule is a refill rate (tokens per second) and a burst size. Every
+client key a rule applies to (a signed-in user, an IP address) has its own
+bucket that starts full, loses one token per request and refills at the
+rule's rate. A request is turned away, with the seconds until a token is
+back, as soon as any of its buckets is empty; buckets checked before that
+one keep the token they gave.
+
+The buckets live in a backend. MemoryBucketBackend is private to one
+process and costs a few microseconds per check; SqliteBucketBackend keeps
+them in a small local file so several worker processes share one budget.
+"""
+
+import sqlite3
+import threading
+import time
+
+
+class MemoryBucketBackend:
+    """Keeps the buckets in this process only."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst):
+        """Take a token from `key`'s bucket; 0 if there was one, else the seconds until there is."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, rate, burst)
+                return 0.0
+            self._buckets[key] = (tokens, now, rate, burst)
+            return (1 - tokens) / rate
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]}
+
+
+class SqliteBucketBackend:
+    """Shares the buckets between processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute('CREATE TABLE IF NOT EXISTS bucket '
+                                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connect(self):
+        # One connection per thread, kept open: opening a file per check would
+        # cost far more than the check. Buckets are throwaway state, so the
+        # file is never synced to disk.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        conn = self._connect()
+        # Take the write lock up front so two workers cannot spend the same token
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(now - row[1], 0) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens - 1 if wait == 0 else tokens, now))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return wait
+
+
+def make_bucket_backend(store):
+    """Pick a backend from the RATE_LIMIT_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryBucketBackend()
+    return SqliteBucketBackend(store)
+
+
+def parse_rule(value):
+    """(rate, burst) from a setting like '2/10': 2 tokens a second, at most 10 at once."""
+    rate, _, burst = str(value).partition('/')
+    rate, burst = float(rate), float(burst or rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f'Invalid rate limit "{value}"; use tokens per second/burst, such as 2/10')
+    return rate, burst
+
+
+class RateLimiter:
+    """Applies named token-bucket rules to client keys and counts what it lets through."""
+
+    def __init__(self, rules, backend=None):
+        self.rules = {name: parse_rule(rule) for name, rule in rules.items()}
+        self.backend = backend or MemoryBucketBackend()
+        self.allowed = dict.fromkeys(self.rules, 0)
+        self.rejected = dict.fromkeys(self.rules, 0)
+
+    def check(self, keys):
+        """Spend a token for each (rule, key); 0 if all had one, else the seconds to wait before retrying."""
+        for rule, key in keys:
+            rate, burst = self.rules[rule]
+            wait = self.backend.take(f'{rule}:{key}', rate, burst)
+            if wait:
+                self.rejected[rule] += 1
+                return wait
+        for rule, _ in keys:
+            self.allowed[rule] += 1
+        return 0.0
+
+    def stats(self):
+        return {rule: {'allowed': self.allowed[rule], 'rejected': self.rejected[rule]} for rule in self.rules}
+
+
+class NoRateLimit:
+    """Stand-in for RateLimiter that lets every request through."""
+
+    def check(self, keys):
+        return 0.0
+
+    def stats(self):
+        return {}
@@ -0,0 +1,339 @@
+"""
+Read-replica routing for the UC Merced Enrollment System
+
+Nearly every request only reads, and on one SQLite file those reads queue
+behind the enroll writes. The read-heavy views (the dashboards, the roster
+and the admin lists) mark their request with replica_reads(). RoutingSession,
+the session class behind `db`, then sends that request's SELECTs to a
+replica engine. Writes, flushes and anything else stay on the primary, and
+so does every later statement in a request that has written.
+
+Two kinds of replica are supported:
+
+- SnapshotReplica copies the primary SQLite file with the backup API every
+  few seconds into a fresh snapshot file and swaps the engine over to it.
+- UrlReplica is any other database URL, such as a streaming PostgreSQL
+  standby.
+
+Read-your-writes: every write is stamped per user in a WriteMarks store.
+Until the replica is known to include a user's last write, that user's
+reads go to the primary. A snapshot includes every commit made before it
+started. For a URL replica, the replay lag decides, or a fixed window when
+the lag cannot be read.
+
+ReplicaRouter picks the engine for each request. It falls back to the
+primary when the replica is more than `max_staleness` seconds behind, and
+its stats() report the staleness, which is the number to alert on.
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.sql.elements import TextClause
+
+from db_profile import engine_options, install_sqlite_pragmas, sqlite_pragmas
+
+READ_VERBS = ('SELECT', 'WITH')
+
+
+def _statement_kind(clause):
+    """'write' for DML, 'read' for a SELECT, 'other' for anything that should simply stay on the primary."""
+    if clause is None:
+        return 'other'
+    if getattr(clause, 'is_dml', False):
+        return 'write'
+    if isinstance(clause, TextClause):
+        words = clause.text.split(None, 1)
+        return 'read' if words and words[0].upper() in READ_VERBS else 'write'
+    return 'read' if getattr(clause, 'is_select', False) else 'other'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy's session, sending the SELECTs of replica-routed requests to the replica."""
+
+    def execute(self, statement, params=None, *, bind_arguments=None, **kwargs):
+        # ORM compound selects such as union_all() reach get_bind() without
+        # their statement, which would leave them on the primary
+        bind_arguments = dict(bind_arguments or {})
+        bind_arguments.setdefault('clause', statement)
+        return super().execute(statement, params, bind_arguments=bind_arguments, **kwargs)
+
+    def scalar(self, statement, params=None, *, bind_arguments=None, **kwargs):
+        bind_arguments = dict(bind_arguments or {})
+        bind_arguments.setdefault('clause', statement)
+        return super().scalar(statement, params, bind_arguments=bind_arguments, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            kind = 'write' if self._flushing else _statement_kind(clause)
+            if kind == 'write':
+                g.db_wrote = True
+            elif kind == 'read' and g.get('db_route') == 'replica' and not g.get('db_wrote'):
+                engine = _request_replica()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _request_replica():
+    # Chosen once per request, so every read in it sees the same database
+    if 'db_replica' not in g:
+        router = current_app.extensions.get('replica_router')
+        identity = g.get('identity')
+        g.db_replica = router.read_engine(identity.id if identity is not None else None) if router else None
+    return g.db_replica
+
+
+def reset_routing():
+    """Forget the last request's routing; registered before every request, as app contexts may outlive one."""
+    for name in ('db_route', 'db_wrote', 'db_replica'):
+        g.pop(name, None)
+
+
+def replica_reads(view):
+    """Serve a read-only view's SELECTs from the replica, when there is a usable one."""
+    @wraps(view)
+    def routed(*args, **kwargs):
+        g.db_route = 'replica'
+        return view(*args, **kwargs)
+    return routed
+
+
+def use_replica():
+    g.db_route = 'replica'
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read from the primary inside a replica-routed request, for data that must be current."""
+    if not has_request_context():
+        yield
+        return
+    route = g.pop('db_route', None)
+    try:
+        yield
+    finally:
+        if route is not None:
+            g.db_route = route
+
+
+def _replica_engine(url, profile):
+    engine = create_engine(url, **engine_options(url, profile))
+    # Nothing may ever be written to a replica by mistake
+    install_sqlite_pragmas(engine, dict(sqlite_pragmas(profile), query_only='ON'))
+    return engine
+
+
+class SnapshotReplica:
+    """A copy of the primary SQLite file, refreshed every `interval` seconds with the backup API.
+
+    Each refresh writes a new file and swaps the engine to it, so readers of
+    the previous snapshot finish undisturbed; the one before that is deleted.
+    """
+
+    def __init__(self, source_path, directory, interval, profile='development'):
+        self.source_path = source_path
+        self.directory = directory
+        self.interval = interval
+        self.profile = profile
+        self.engine = None
+        self.taken_at = None
+        self.refreshes = 0
+        self.errors = 0
+        self.last_refresh_ms = None
+        self._paths = []
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def refresh(self):
+        with self._lock:
+            started, clock = time.time(), time.perf_counter()
+            path = os.path.join(self.directory, f'snapshot-{os.getpid()}-{self.refreshes + 1}.db')
+            source = sqlite3.connect(f'file:{self.source_path}?mode=ro', uri=True, timeout=30)
+            target = sqlite3.connect(path)
+            try:
+                # One step copies a consistent image that includes every commit before `started`
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+            previous, self.engine = self.engine, _replica_engine(f'sqlite:///{path}', self.profile)
+            self.taken_at = started
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - clock) * 1000, 2)
+            self._paths.append(path)
+            if previous is not None:
+                previous.dispose()
+            while len(self._paths) > 2:
+                with contextlib.suppress(OSError):
+                    os.remove(self._paths.pop(0))
+
+    def start(self):
+        """Refresh now and then every `interval` seconds on a background thread."""
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception:
+                    # Staleness keeps growing, which is what the alert watches
+                    self.errors += 1
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=run, name='replica-snapshot', daemon=True)
+        self._thread.start()
+
+    def staleness(self):
+        return None if self.taken_at is None else time.time() - self.taken_at
+
+    def covers(self, written_at):
+        return self.taken_at is not None and self.taken_at >= written_at
+
+    def stats(self):
+        return {'kind': 'snapshot', 'refreshes': self.refreshes, 'errors': self.errors,
+                'last_refresh_ms': self.last_refresh_ms, 'interval': self.interval}
+
+
+class UrlReplica:
+    """A replica database at its own URL; on PostgreSQL the replay lag gives its staleness."""
+
+    def __init__(self, url, sticky_seconds, profile='development', lag_ttl=1.0):
+        self.engine = _replica_engine(url, profile)
+        self.sticky_seconds = sticky_seconds
+        self.lag_ttl = lag_ttl
+        self.lag_errors = 0
+        self._lag = (None, 0.0)
+
+    def start(self):
+        pass
+
+    def staleness(self):
+        """Seconds of replay lag, read at most every `lag_ttl` seconds; None if the database cannot say."""
+        lag, checked = self._lag
+        now = time.monotonic()
+        if now - checked < self.lag_ttl:
+            return lag
+        lag = None
+        if self.engine.dialect.name == 'postgresql':
+            try:
+                with self.engine.connect() as conn:
+                    lag = conn.execute(text(
+                        "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                    )).scalar()
+            except Exception:
+                self.lag_errors += 1
+        self._lag = (float(lag) if lag is not None else None, now)
+        return self._lag[0]
+
+    def covers(self, written_at):
+        lag = self.staleness()
+        return time.time() - (self.sticky_seconds if lag is None else lag) >= written_at
+
+    def stats(self):
+        return {'kind': 'url', 'lag_errors': self.lag_errors, 'sticky_seconds': self.sticky_seconds}
+
+
+class MemoryWriteMarks:
+    """When each user last wrote, in this process only."""
+
+    def __init__(self):
+        self._marks = {}
+
+    def mark(self, user_id, when):
+        self._marks[user_id] = when
+
+    def last_write(self, user_id):
+        return self._marks.get(user_id)
+
+
+class SqliteWriteMarks:
+    """When each user last wrote, shared between processes through a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS write_mark (user_id INTEGER PRIMARY KEY, written_at REAL NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def mark(self, user_id, when):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO write_mark (user_id, written_at) VALUES (?, ?)', (user_id, when))
+
+    def last_write(self, user_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT written_at FROM write_mark WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else None
+
+
+def make_write_marks(store):
+    """Pick a store from the REPLICA_STICKY_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryWriteMarks()
+    return SqliteWriteMarks(store)
+
+
+class ReplicaRouter:
+    """Chooses, per request, between the replica and the primary, and counts the choices."""
+
+    def __init__(self, replica, max_staleness, marks=None):
+        self.replica = replica
+        self.max_staleness = max_staleness
+        self.marks = marks or MemoryWriteMarks()
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.stale_reads = 0
+
+    def read_engine(self, user_id=None):
+        """The replica engine for a read-only request by `user_id`, or None to read from the primary."""
+        staleness = self.replica.staleness()
+        if self.replica.engine is None or (staleness is not None and staleness > self.max_staleness):
+            self.stale_reads += 1
+            return None
+
+        written_at = self.marks.last_write(user_id) if user_id is not None else None
+        if written_at is not None and not self.replica.covers(written_at):
+            self.sticky_reads += 1
+            return None
+
+        self.replica_reads += 1
+        return self.replica.engine
+
+    def mark_write(self, user_id):
+        self.marks.mark(user_id, time.time())
+
+    def status(self):
+        staleness = self.replica.staleness()
+        return {
+            'staleness_seconds': round(staleness, 3) if staleness is not None else None,
+            'max_staleness': self.max_staleness,
+            'stale': self.replica.engine is None or (staleness is not None and staleness > self.max_staleness)
+        }
+
+    def stats(self):
+        return dict(self.status(), replica_reads=self.replica_reads, sticky_reads=self.sticky_reads,
+                    stale_reads=self.stale_reads, **self.replica.stats())
+
+
+def make_replica_router(config, primary_url):
+    """A ReplicaRouter from the REPLICA_* settings, or None when no replica is configured."""
+    if config['REPLICA_DATABASE_URL']:
+        replica = UrlReplica(config['REPLICA_DATABASE_URL'], config['REPLICA_STICKY_SECONDS'], config['DB_PROFILE'])
+    elif config['REPLICA_SNAPSHOT_INTERVAL'] > 0:
+        if primary_url.get_backend_name() != 'sqlite' or primary_url.database in (None, '', ':memory:'):
+            raise ValueError('REPLICA_SNAPSHOT_INTERVAL needs the primary database to be a SQLite file')
+        source = os.path.abspath(primary_url.database)
+        directory = config['REPLICA_SNAPSHOT_DIR'] or f'{source}.snapshots'
+        replica = SnapshotReplica(source, directory, config['REPLICA_SNAPSHOT_INTERVAL'], config['DB_PROFILE'])
+    else:
+        return None
+    return ReplicaRouter(replica, config['REPLICA_MAX_STALENESS'], make_write_marks(config['REPLICA_STICKY_STORE']))
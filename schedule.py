@@ -0,0 +1,184 @@
+"""
+Weekly meeting patterns and schedule conflicts
+
+Course.time is free text such as 'MWF 10:00-10:50 AM'. parse_meeting()
+reads it once, when the course is saved, into the columns kept next to it:
+a bitmask of meeting days and the start and end of each meeting in minutes
+after midnight. A course whose time cannot be read (say 'TBA') keeps NULLs
+there and never conflicts with anything.
+
+ScheduleIndex lays one student's meetings out as sorted intervals on a
+week-long axis, so checking a course against the schedule is a binary
+search. schedule_conflicts() builds one index per student in a single
+sweep over all enrollments and reports every overlapping pair.
+"""
+
+import re
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import text
+
+# Bit of each meeting day; R is Thursday and U Sunday
+DAYS = 'MTWRFSU'
+DAY_ALIASES = {'Tu': 'T', 'Th': 'R', 'Sa': 'S', 'Su': 'U'}
+MINUTES_PER_DAY = 24 * 60
+
+MEETING_COLUMNS = ('meeting_days', 'start_minute', 'end_minute')
+
+_DAY_TOKEN = re.compile(r'Tu|Th|Sa|Su|[MTWRFSU]')
+_PATTERN = re.compile(
+    r'^\s*(?P<days>[A-Za-z]+)\s+'
+    r'(?P<start>\d{1,2}(?::\d{2})?)\s*(?P<start_half>[AaPp]\.?[Mm]\.?)?\s*[-–]\s*'
+    r'(?P<end>\d{1,2}(?::\d{2})?)\s*(?P<end_half>[AaPp]\.?[Mm]\.?)?\s*$'
+)
+
+Meeting = namedtuple('Meeting', MEETING_COLUMNS)
+
+
+def _days(token):
+    mask, position = 0, 0
+    for found in _DAY_TOKEN.finditer(token):
+        if found.start() != position:
+            break
+        mask |= 1 << DAYS.index(DAY_ALIASES.get(found.group(), found.group()))
+        position = found.end()
+    if not mask or position != len(token):
+        raise ValueError(f'Unknown meeting days "{token}"')
+    return mask
+
+
+def _clock(value):
+    hours, _, minutes = value.partition(':')
+    hours, minutes = int(hours), int(minutes or 0)
+    if hours > 24 or minutes > 59:
+        raise ValueError(f'Invalid time "{value}"')
+    return hours, minutes
+
+
+def _minutes(hours, minutes, half):
+    # Hours past 12 are on the 24-hour clock whatever the suffix says
+    if half is None or hours > 12:
+        return hours * 60 + minutes
+    return (hours % 12 + (12 if half == 'p' else 0)) * 60 + minutes
+
+
+def parse_meeting(value):
+    """The Meeting for a time like 'MWF 10:00-10:50 AM' or 'TTh 11:30-12:45 PM'; ValueError if unreadable.
+
+    A single AM/PM after the end time applies to both ends unless that would
+    put the start after the end, as in '11:30-12:45 PM'.
+    """
+    found = _PATTERN.match(value or '')
+    if not found:
+        raise ValueError(f'Unrecognized meeting time "{value}"')
+
+    start_half, end_half = (found.group(name)[0].lower() if found.group(name) else None
+                            for name in ('start_half', 'end_half'))
+    start, end = _clock(found.group('start')), _clock(found.group('end'))
+    end_minute = _minutes(*end, end_half)
+    if start_half is None and end_half is not None:
+        start_minute = _minutes(*start, end_half)
+        if start_minute >= end_minute:
+            start_minute = _minutes(*start, 'a' if end_half == 'p' else 'p')
+    else:
+        start_minute = _minutes(*start, start_half)
+
+    if not 0 <= start_minute < end_minute <= MINUTES_PER_DAY:
+        raise ValueError(f'Meeting "{value}" does not end after it starts')
+    return Meeting(_days(found.group('days')), start_minute, end_minute)
+
+
+def meeting_columns(value):
+    """Column values for a course time: the parsed meeting, or all None if it cannot be read."""
+    try:
+        return parse_meeting(value)._asdict()
+    except ValueError:
+        return dict.fromkeys(MEETING_COLUMNS)
+
+
+def week_intervals(meeting):
+    """Half-open (start, end) minutes since Monday 00:00 for each day `meeting` meets."""
+    return [(day * MINUTES_PER_DAY + meeting.start_minute, day * MINUTES_PER_DAY + meeting.end_minute)
+            for day in range(len(DAYS)) if meeting.meeting_days & (1 << day)]
+
+
+class ScheduleIndex:
+    """One student's weekly meetings as intervals sorted by start, for overlap lookups in O(log n).
+
+    `reach[i]` is the latest end among the first i + 1 intervals, so the
+    intervals that can overlap a query form a run just before its insertion
+    point, found by binary search. Each interval carries an owner, whatever
+    the caller wants reported back: a course id or name.
+    """
+
+    __slots__ = ('starts', 'ends', 'reach', 'owners')
+
+    def __init__(self, meetings=()):
+        self.starts, self.ends, self.reach, self.owners = array('i'), array('i'), array('i'), []
+        for owner, meeting in meetings:
+            self.add(owner, meeting)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, owner, meeting):
+        for start, end in week_intervals(meeting):
+            i = bisect_left(self.starts, start)
+            self.starts.insert(i, start)
+            self.ends.insert(i, end)
+            self.owners.insert(i, owner)
+            self.reach.insert(i, 0)
+            latest = self.reach[i - 1] if i else 0
+            for j in range(i, len(self.reach)):
+                latest = max(latest, self.ends[j])
+                self.reach[j] = latest
+
+    def conflicts(self, meeting):
+        """Owners of the intervals that overlap `meeting`, each once."""
+        found = {}
+        for start, end in week_intervals(meeting):
+            j = bisect_left(self.starts, end) - 1
+            while j >= 0 and self.reach[j] > start:
+                if self.ends[j] > start:
+                    found[self.owners[j]] = None
+                j -= 1
+        return list(found)
+
+
+def student_schedule(db_session, student_id, except_course_id=None):
+    """A ScheduleIndex of the courses `student_id` is enrolled in, other than `except_course_id`, owned by name."""
+    # A plain <> rather than IS NOT with a parameter, which only SQLite accepts
+    excluded = "AND enrollment.course_id <> :except_course_id " if except_course_id is not None else ""
+    rows = db_session.execute(text(
+        "SELECT course.name, course.meeting_days, course.start_minute, course.end_minute "
+        "FROM enrollment JOIN course ON course.id = enrollment.course_id "
+        "WHERE enrollment.student_id = :student_id " + excluded +
+        "AND course.meeting_days IS NOT NULL"
+    ), {'student_id': student_id, 'except_course_id': except_course_id})
+    return ScheduleIndex((name, Meeting(*meeting)) for name, *meeting in rows)
+
+
+def schedule_conflicts(db_session, batch_size=1000):
+    """(student_id, course_id, other_course_id) for each pair of a student's courses that overlap.
+
+    One pass over the enrollments in student order, streamed `batch_size`
+    rows at a time; only one student's schedule is held at once.
+    """
+    rows = db_session.execute(text(
+        "SELECT enrollment.student_id, enrollment.course_id, "
+        "course.meeting_days, course.start_minute, course.end_minute "
+        "FROM enrollment JOIN course ON course.id = enrollment.course_id "
+        "WHERE course.meeting_days IS NOT NULL "
+        "ORDER BY enrollment.student_id, enrollment.course_id"
+    ).execution_options(yield_per=batch_size))
+
+    conflicts, current, index = [], None, None
+    for student_id, course_id, *meeting in rows:
+        if student_id != current:
+            current, index = student_id, ScheduleIndex()
+        meeting = Meeting(*meeting)
+        conflicts.extend((student_id, other, course_id) for other in index.conflicts(meeting))
+        index.add(course_id, meeting)
+    return conflicts
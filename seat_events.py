@@ -0,0 +1,165 @@
+"""
+Live seat-count events for the UC Merced Enrollment System
+
+Every write that changes a course's seat count publishes the new count. A
+SeatBroadcaster keeps only the latest count per course, so a burst of
+enrolls in one course reaches each subscriber as a single change, and wakes
+all subscribers at once instead of queueing a copy of every event for each.
+
+Published changes travel through a backend. MemoryEventBackend delivers them
+within one process; SqliteEventBackend appends them to a small local file
+that every worker polls, standing in for a message broker so that a seat
+freed in one worker reaches students connected to another.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryEventBackend:
+    """Hands published changes straight to the listeners in this process."""
+
+    def __init__(self):
+        self._listeners = []
+
+    def publish(self, changes):
+        for listener in list(self._listeners):
+            listener(changes)
+
+    def listen(self, callback):
+        self._listeners.append(callback)
+
+
+class SqliteEventBackend:
+    """Relays changes between processes through a SQLite file polled by each one."""
+
+    def __init__(self, path, poll_interval=0.1, retain=1000):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retain = retain
+        self.poll_errors = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS seat_event '
+                         '(seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def publish(self, changes):
+        with self._connect() as conn:
+            seq = conn.execute('INSERT INTO seat_event (payload) VALUES (?)', (json.dumps(changes),)).lastrowid
+            # Listeners only ever need the newest rows
+            if seq % 100 == 0:
+                conn.execute('DELETE FROM seat_event WHERE seq <= ?', (seq - self.retain,))
+
+    def listen(self, callback):
+        with self._connect() as conn:
+            last = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM seat_event').fetchone()[0]
+
+        def poll(last):
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    with self._connect() as conn:
+                        rows = conn.execute('SELECT seq, payload FROM seat_event WHERE seq > ? ORDER BY seq',
+                                            (last,)).fetchall()
+                    for seq, payload in rows:
+                        # Move past the row first, so one bad event is skipped rather than retried forever
+                        last = seq
+                        callback(json.loads(payload))
+                except Exception:
+                    # A locked file or a failing listener must not end the relay for this worker
+                    self.poll_errors += 1
+                    logger.exception('Polling %s for seat events failed', self.path)
+
+        threading.Thread(target=poll, args=(last,), name='seat-events', daemon=True).start()
+
+
+def make_event_backend(store):
+    """Pick a backend from the SEAT_EVENTS_STORE setting: empty for memory, else a file path."""
+    if not store:
+        return MemoryEventBackend()
+    return SqliteEventBackend(store)
+
+
+class Subscription:
+    """One listener's position in the stream of seat changes."""
+
+    def __init__(self, broadcaster, seq):
+        self.broadcaster = broadcaster
+        self.seq = seq
+
+    def wait(self, timeout=None, coalesce=0.0):
+        """Block until seats change and return the courses changed since the last call.
+
+        Returns an empty list if nothing changed within `timeout` seconds.
+        `coalesce` waits that much longer after the first change so a burst
+        arrives as one batch.
+        """
+        broadcaster = self.broadcaster
+        with broadcaster._cond:
+            if not broadcaster._cond.wait_for(lambda: broadcaster._seq > self.seq, timeout):
+                return []
+
+        if coalesce:
+            time.sleep(coalesce)
+
+        changes = []
+        with broadcaster._cond:
+            # _latest is ordered oldest change first, so walk back to our position
+            for course_id, (seq, enrolled, capacity) in reversed(broadcaster._latest.items()):
+                if seq <= self.seq:
+                    break
+                changes.append({'id': course_id, 'enrolled': enrolled, 'capacity': capacity})
+            self.seq = broadcaster._seq
+
+        changes.reverse()
+        return changes
+
+    def close(self):
+        with self.broadcaster._cond:
+            self.broadcaster.subscribers -= 1
+
+
+class SeatBroadcaster:
+    """Coalesces seat changes per course and fans them out to every subscriber."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryEventBackend()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._latest = {}
+        self._listening = False
+        self.subscribers = 0
+        self.published = 0
+
+    def publish(self, changes):
+        """Announce new seat counts as (course_id, enrolled, capacity) tuples."""
+        changes = [[course_id, enrolled, capacity] for course_id, enrolled, capacity in changes]
+        if changes:
+            self.published += len(changes)
+            self.backend.publish(changes)
+
+    def _receive(self, changes):
+        with self._cond:
+            for course_id, enrolled, capacity in changes:
+                self._seq += 1
+                self._latest.pop(course_id, None)
+                self._latest[course_id] = (self._seq, enrolled, capacity)
+            self._cond.notify_all()
+
+    def subscribe(self):
+        with self._cond:
+            if not self._listening:
+                self.backend.listen(self._receive)
+                self._listening = True
+            self.subscribers += 1
+            return Subscription(self, self._seq)
+
+    def stats(self):
+        return {'subscribers': self.subscribers, 'published': self.published}
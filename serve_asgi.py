@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Production launcher for the ASGI server (see asgi.py)
+
+Runs uvicorn with settings taken from the environment:
+
+    ASGI_HOST               interface to bind (default 0.0.0.0)
+    ASGI_PORT               port (default 5001)
+    ASGI_WORKERS            worker processes (default: WEB_CONCURRENCY, else one per CPU)
+    ASGI_KEEPALIVE          seconds an idle keep-alive connection stays open (default 5)
+    ASGI_BACKLOG            pending connections the socket queues (default 2048)
+    ASGI_LIMIT_CONCURRENCY  connections per worker before answering 503 (default: unlimited)
+    ASGI_GRACEFUL_TIMEOUT   seconds to finish in-flight requests on shutdown (default 30)
+
+With more than one worker, set CATALOG_STORE, SEAT_EVENTS_STORE and
+IDENTITY_STORE so the workers share cache invalidations, seat events and
+session revisions, and use DB_PROFILE=production.
+
+    DB_PROFILE=production ASGI_WORKERS=4 python serve_asgi.py
+"""
+
+import os
+
+import uvicorn
+
+
+def _env_int(env, name, default):
+    value = env.get(name)
+    return int(value) if value else default
+
+
+def launcher_config(env=os.environ):
+    """Keyword arguments for uvicorn.run()."""
+    return {
+        'host': env.get('ASGI_HOST', '0.0.0.0'),
+        'port': _env_int(env, 'ASGI_PORT', 5001),
+        'workers': _env_int(env, 'ASGI_WORKERS', _env_int(env, 'WEB_CONCURRENCY', os.cpu_count() or 1)),
+        'timeout_keep_alive': _env_int(env, 'ASGI_KEEPALIVE', 5),
+        'backlog': _env_int(env, 'ASGI_BACKLOG', 2048),
+        'limit_concurrency': _env_int(env, 'ASGI_LIMIT_CONCURRENCY', None),
+        'timeout_graceful_shutdown': _env_int(env, 'ASGI_GRACEFUL_TIMEOUT', 30),
+        'lifespan': 'on',
+        'access_log': False
+    }
+
+
+if __name__ == '__main__':
+    uvicorn.run('asgi:application', **launcher_config())
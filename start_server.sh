@@ -19,6 +19,10 @@ fi
 
 mkdir -p templates static/css static/js
 
+echo "Loading demo data into an empty database..."
+python3 -m flask --app app seed-demo
+echo ""
+
 echo "Starting Flask application..."
 echo "Open your browser and go to: http://localhost:5001"
 echo "Demo accounts are available in the README.md file"
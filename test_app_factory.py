@@ -0,0 +1,101 @@
+"""
+Tests for the application factory, the optional admin site and the demo seed command
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from app import create_app, db, User, Course, Enrollment, CourseStats
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_app(**config):
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    return create_app(dict({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+                            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1', 'METRICS_ENABLED': False}, **config))
+
+
+def test_blueprints_are_registered():
+    flask_app = make_app()
+
+    assert {'auth', 'student', 'teacher', 'api', 'admin'} <= set(flask_app.blueprints)
+    assert flask_app.url_map.bind('').match('/api/enroll', method='POST') == ('api.enroll_course', {})
+
+
+def test_admin_site_can_be_left_out():
+    flask_app = make_app(ADMIN_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+
+    client = flask_app.test_client()
+    assert 'admin' not in flask_app.blueprints
+    assert client.get('/admin/').status_code == 404
+    assert client.get('/login').status_code == 200
+
+
+def test_admin_without_the_admin_site_gets_an_explanation():
+    flask_app = make_app(ADMIN_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        admin = User(username='admin', role='admin', first_name='Admin', last_name='User', password_hash='x')
+        db.session.add(admin)
+        db.session.commit()
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            flask_app.extensions['identity_cache'].remember(sess, admin)
+
+        response = client.get('/dashboard')
+
+    assert response.status_code == 503
+    assert 'Admin Panel Unavailable' in response.get_data(as_text=True)
+
+
+def test_trusted_proxy_address_keys_the_login_limit():
+    flask_app = make_app(TRUSTED_PROXIES=1, RATE_LIMIT_ENABLED=True, RATE_LIMIT_BY_IP=True, RATE_LIMIT_LOGIN='0.001/1')
+    with flask_app.app_context():
+        db.create_all()
+    client = flask_app.test_client()
+
+    def attempt(forwarded_for):
+        return client.post('/login', data={'username': 'nobody', 'password': 'x'},
+                           headers={'X-Forwarded-For': forwarded_for}).status_code
+
+    assert [attempt('10.0.0.1'), attempt('10.0.0.1'), attempt('10.0.0.2')] == [200, 429, 200]
+
+
+def test_worker_without_admin_never_imports_it():
+    script = ('import sys, app; app.create_app(); '
+              'print(any(name.split(".")[0] in ("flask_admin", "wtforms") for name in sys.modules))')
+    env = dict(os.environ, ADMIN_ENABLED='0', DATABASE_URL='sqlite://')
+
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+
+    assert output.strip() == 'False'
+
+
+def test_seed_demo_loads_the_demo_campus_once():
+    flask_app = make_app()
+    runner = flask_app.test_cli_runner()
+
+    result = runner.invoke(args=['seed-demo'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Seeded 24 users and 4 courses' in result.output
+    with flask_app.app_context():
+        math = Course.query.filter_by(name='Math 101').one()
+        assert math.teacher.username == 'rjenkins'
+        assert math.enrolled_count == 4
+        assert {e.student.username for e in math.enrollments} == {'jsantos', 'bbrown', 'jstuart', 'lcheng'}
+        assert db.session.get(CourseStats, math.id).grade_sum == 92 + 65 + 86 + 77
+        assert User.query.filter_by(username='admin').one().check_password('admin123')
+
+    again = runner.invoke(args=['seed-demo'])
+
+    assert 'nothing was seeded' in again.output
+    with flask_app.app_context():
+        assert Enrollment.query.count() == 17
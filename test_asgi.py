@@ -0,0 +1,243 @@
+"""
+Tests for the ASGI entry point
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+
+import app as app_module
+from app import app as flask_app, db, User, Course, Enrollment, identity_cache
+from asgi import create_asgi_app
+from conftest import login_as
+from idempotency import IdempotencyCache
+from rate_limit import RateLimiter
+
+
+def session_cookie(user):
+    data = {}
+    identity_cache.remember(data, user)
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return f'session={serializer.dumps(data)}'
+
+
+async def call(api, method, path, payload=None, cookie=None, query=b'', extra_headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    headers = [(b'host', b'localhost'), *extra_headers]
+    if payload is not None:
+        headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if cookie:
+        headers.append((b'cookie', cookie.encode()))
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query, 'root_path': '',
+             'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 1234)}
+    sent = []
+    requested = []
+
+    # Like a server: the body once, then nothing until the client disconnects
+    async def receive():
+        if requested:
+            await asyncio.Event().wait()
+        requested.append(True)
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await api(scope, receive, send)
+    status = sent[0]['status']
+    content = b''.join(m.get('body', b'') for m in sent[1:])
+    return status, content, dict(sent[0]['headers'])
+
+
+def run(scenario):
+    async def main():
+        api = create_asgi_app(app_module)
+        try:
+            return await scenario(api)
+        finally:
+            await api.engine.dispose()
+            api.wsgi.executor.shutdown(wait=False)
+    return asyncio.run(main())
+
+
+def test_enroll_and_unenroll_run_async(app):
+    course = Course.query.filter_by(name='CS 162').one()
+    cookie = session_cookie(User.query.filter_by(username='student5').one())
+
+    async def scenario(api):
+        enrolled = await call(api, 'POST', '/api/enroll', {'course_id': course.id}, cookie)
+        again = await call(api, 'POST', '/api/enroll', {'course_id': course.id}, cookie)
+        removed = await call(api, 'POST', '/api/unenroll', {'course_id': course.id}, cookie)
+        return enrolled, again, removed
+
+    enrolled, again, removed = run(scenario)
+
+    assert enrolled[0] == 200
+    assert json.loads(enrolled[1])['course'] == {'id': course.id, 'enrolled': 1, 'capacity': 4}
+    assert json.loads(again[1])['message'] == 'Already enrolled in this course'
+    assert json.loads(removed[1])['button'] == 'add'
+    db.session.expire_all()
+    assert Enrollment.query.filter_by(course_id=course.id).count() == 0
+
+
+def test_roster_matches_flask_route(client):
+    teacher = User.query.filter_by(username='rjenkins').one()
+    course = Course.query.filter_by(name='Math 101').one()
+    login_as(client, teacher)
+    expected = client.get(f'/api/course/{course.id}/students?limit=2').get_json()
+
+    status, content, _ = run(lambda api: call(api, 'GET', f'/api/course/{course.id}/students',
+                                              cookie=session_cookie(teacher), query=b'limit=2'))
+
+    assert status == 200
+    assert json.loads(content) == expected
+
+
+def test_anonymous_calls_are_unauthorized(app):
+    status, content, _ = run(lambda api: call(api, 'POST', '/api/enroll', {'course_id': 1}))
+
+    assert json.loads(content) == {'success': False, 'message': 'Unauthorized'}
+
+
+def test_other_routes_go_through_flask(app):
+    status, content, _ = run(lambda api: call(api, 'GET', '/login'))
+
+    assert status == 200
+    assert b'<form' in content
+
+
+def test_stale_session_is_refreshed_by_flask(app):
+    student = User.query.filter_by(username='student5').one()
+    cookie = session_cookie(student)
+    identity_cache.invalidate(student.id)
+    course = Course.query.filter_by(name='CS 162').one()
+
+    status, content, _ = run(lambda api: call(api, 'POST', '/api/enroll', {'course_id': course.id}, cookie))
+
+    assert json.loads(content)['success']
+
+
+def test_writes_share_limits_and_idempotency_keys_with_flask(client, monkeypatch):
+    monkeypatch.setitem(flask_app.extensions, 'idempotency_cache', IdempotencyCache())
+    monkeypatch.setitem(flask_app.extensions, 'rate_limiter', RateLimiter({'session': '0.001/2', 'ip': '10/10'}))
+    student = User.query.filter_by(username='student5').one()
+    ids = [Course.query.filter_by(name=name).one().id for name in ('CS 106', 'CS 162')]
+    login_as(client, student)
+    key = [(b'idempotency-key', b'enroll-once')]
+    first = client.post('/api/enroll', json={'course_id': ids[0]}, headers={'Idempotency-Key': 'enroll-once'})
+
+    async def scenario(api):
+        replayed = await call(api, 'POST', '/api/enroll', {'course_id': ids[0]}, session_cookie(student),
+                              extra_headers=key)
+        second = await call(api, 'POST', '/api/enroll', {'course_id': ids[1]}, session_cookie(student))
+        third = await call(api, 'POST', '/api/unenroll', {'course_id': ids[1]}, session_cookie(student))
+        return replayed, second, third
+
+    replayed, second, third = run(scenario)
+
+    assert json.loads(replayed[1]) == first.get_json()
+    assert replayed[2][b'idempotent-replayed'] == b'true'
+    assert json.loads(second[1])['success']
+    assert third[0] == 429 and b'retry-after' in third[2]
+
+
+def test_fast_path_is_recorded_under_the_flask_endpoint(app):
+    instrumentation = flask_app.extensions['instrumentation']
+    instrumentation.reset()
+    course = Course.query.filter_by(name='CS 162').one()
+    cookie = session_cookie(User.query.filter_by(username='student5').one())
+
+    run(lambda api: call(api, 'POST', '/api/enroll', {'course_id': course.id}, cookie))
+
+    enroll = instrumentation.snapshot()['api.enroll_course']
+    assert enroll['queries']['count'] == 1
+    assert enroll['queries']['p50'] > 0
+
+
+def test_shared_store_calls_stay_off_the_event_loop(app, monkeypatch):
+    threads = {}
+
+    class RecordingLimiter:
+        def check(self, keys):
+            threads['rate_limit'] = threading.get_ident()
+            return 0
+
+    class RecordingBroadcaster:
+        def publish(self, changes):
+            threads['publish'] = threading.get_ident()
+
+    monkeypatch.setitem(flask_app.extensions, 'rate_limiter', RecordingLimiter())
+    monkeypatch.setitem(flask_app.extensions, 'seat_broadcaster', RecordingBroadcaster())
+    monkeypatch.setitem(flask_app.config, 'RATE_LIMIT_STORE', 'sqlite:///limits.db')
+    course = Course.query.filter_by(name='CS 162').one()
+    cookie = session_cookie(User.query.filter_by(username='student5').one())
+
+    async def scenario(api):
+        status, _, _ = await call(api, 'POST', '/api/enroll', {'course_id': course.id}, cookie)
+        return status, threading.get_ident()
+
+    status, loop_thread = run(scenario)
+
+    assert status == 200
+    assert set(threads) == {'rate_limit', 'publish'}
+    assert loop_thread not in threads.values()
+
+
+def test_open_seat_stream_does_not_hold_up_other_flask_requests(app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SEAT_STREAM_HEARTBEAT', 0.05)
+    broadcaster = flask_app.extensions['seat_broadcaster']
+    subscribers = broadcaster.stats()['subscribers']
+    cookie = session_cookie(User.query.filter_by(username='student5').one())
+
+    async def scenario(api):
+        streaming, gone = asyncio.Event(), asyncio.Event()
+        requested = []
+
+        async def receive():
+            if requested:
+                await gone.wait()
+                return {'type': 'http.disconnect'}
+            requested.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message.get('body'):
+                streaming.set()
+
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': '/api/courses/seats/stream', 'raw_path': b'/api/courses/seats/stream',
+                 'query_string': b'', 'root_path': '', 'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+                 'server': ('localhost', 80), 'client': ('127.0.0.1', 1234)}
+        stream = asyncio.ensure_future(api(scope, receive, send))
+        await asyncio.wait_for(streaming.wait(), 5)
+        login = await asyncio.wait_for(call(api, 'GET', '/login'), 5)
+        open_while_serving = broadcaster.stats()['subscribers']
+
+        gone.set()
+        await asyncio.wait_for(stream, 5)
+        return login, open_while_serving
+
+    login, open_while_serving = run(scenario)
+
+    assert login[0] == 200
+    assert open_while_serving == subscribers + 1
+    assert broadcaster.stats()['subscribers'] == subscribers
+
+
+def test_fast_path_limits_the_forwarded_address(app):
+    async def scenario(api):
+        api.limit_by_ip, api.trusted_proxies = True, 1
+        scope = {'client': ('10.0.0.9', 1234), 'headers': [(b'x-forwarded-for', b'192.0.2.7, 198.51.100.4')]}
+        trusted = api.client_address(scope)
+        api.trusted_proxies = 0
+        direct = api.client_address(scope)
+        api.limit_by_ip = False
+        return trusted, direct, api.client_address(scope)
+
+    assert run(scenario) == ('198.51.100.4', '10.0.0.9', None)
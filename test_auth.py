@@ -0,0 +1,93 @@
+"""
+Tests for password hashing policy and the session identity cache
+"""
+
+import threading
+
+import pytest
+
+from app import app as flask_app, db, User
+from auth import HashingPool, PasswordPolicy, PoolBusy, SqliteIdentityBackend
+from conftest import QueryCounter, TEST_PASSWORD_HASH, login_as
+
+
+def test_login_rehashes_outdated_password(client, monkeypatch):
+    monkeypatch.setitem(flask_app.extensions, 'password_policy', PasswordPolicy('pbkdf2:sha256:1000'))
+    student = User.query.filter_by(username='student0').one()
+    assert student.password_hash == TEST_PASSWORD_HASH
+
+    response = client.post('/login', data={'username': 'student0', 'password': 'password'})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert User.query.filter_by(username='student0').one().password_hash.startswith('pbkdf2:sha256:1000$')
+
+    response = client.post('/login', data={'username': 'student0', 'password': 'wrong'})
+    assert b'Invalid username or password' in response.data
+
+
+def test_dashboard_uses_session_identity(client):
+    login_as(client, User.query.filter_by(username='rjenkins').one())
+
+    with QueryCounter() as queries:
+        response = client.get('/dashboard')
+
+    assert response.headers['Location'].endswith('/teacher')
+    assert queries.count == 0
+
+
+def test_admin_edit_refreshes_session(client):
+    student = User.query.filter_by(username='student0').one()
+    login_as(client, student)
+    assert client.get('/dashboard').headers['Location'].endswith('/student')
+
+    admin = flask_app.test_client()
+    login_as(admin, User.query.filter_by(role='admin').one())
+    response = admin.post(f'/admin/user/edit/?id={student.id}', data={
+        'username': 'student0', 'first_name': 'First0', 'last_name': 'Last0', 'role': 'teacher', 'password': ''
+    })
+    assert response.status_code == 302
+
+    assert client.get('/dashboard').headers['Location'].endswith('/teacher')
+    with client.session_transaction() as sess:
+        assert sess['user_role'] == 'teacher'
+
+
+def test_admin_delete_signs_user_out(client):
+    student = User.query.filter_by(username='student1').one()
+    login_as(client, student)
+
+    admin = flask_app.test_client()
+    login_as(admin, User.query.filter_by(role='admin').one())
+    admin.post('/admin/user/delete/', data={'id': str(student.id)})
+
+    assert client.get('/dashboard').headers['Location'].endswith('/login')
+    assert client.post('/api/enroll', json={'course_id': 1}).get_json()['message'] == 'Unauthorized'
+
+
+def test_hashing_pool_turns_away_overflow():
+    pool = HashingPool(workers=1, queue_limit=0, timeout=0.05)
+    release = threading.Event()
+    busy = threading.Thread(target=pool.run, args=(release.wait,))
+    busy.start()
+
+    try:
+        with pytest.raises(PoolBusy):
+            pool.run(lambda: None)
+    finally:
+        release.set()
+        busy.join()
+
+    assert pool.rejected == 1
+    assert pool.run(lambda: 42) == 42
+
+
+def test_sqlite_identity_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'identity.db')
+    first, second = SqliteIdentityBackend(path), SqliteIdentityBackend(path)
+
+    first.bump_revision(7)
+    first.bump_revision(7)
+
+    assert second.get_revision(7) == 2
+    assert second.get_revision(8) == 0
@@ -0,0 +1,42 @@
+"""
+Tests for the synthetic campus used by the benchmarks
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import campus
+
+
+def generate_rows(**overrides):
+    spec = dict(campus.DEFAULT_SPEC, students=200, teachers=5, courses=20, **overrides)
+    return [list(rows) for rows in campus.generate(spec, 'hash')]
+
+
+def test_campus_is_reproducible():
+    assert generate_rows() == generate_rows()
+    assert generate_rows() != generate_rows(seed=1)
+
+
+def test_campus_follows_spec():
+    users, courses, enrollments = generate_rows(min_courses_per_student=2, max_courses_per_student=3)
+
+    assert sum(u['role'] == 'student' for u in users) == 200
+    assert sum(u['role'] == 'teacher' for u in users) == 5
+    assert len(courses) == 20
+    assert all(u['password_hash'] == 'hash' for u in users)
+
+    per_student = {}
+    for row in enrollments:
+        per_student[row['student']] = per_student.get(row['student'], 0) + 1
+    assert set(per_student.values()) <= {2, 3}
+
+
+def test_zipf_popularity_skews_enrollments():
+    _, _, enrollments = generate_rows()
+
+    first = sum(row['course'] == campus.course_name(0) for row in enrollments)
+    last = sum(row['course'] == campus.course_name(19) for row in enrollments)
+    assert first > 3 * last
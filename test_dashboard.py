@@ -0,0 +1,202 @@
+"""
+Tests for the student and teacher dashboards
+"""
+
+import pytest
+
+from app import db, User, Course, Enrollment, course_catalog, identity_cache
+from conftest import QueryCounter, login_as
+
+
+def add_courses(count):
+    teacher = User.query.filter_by(role='teacher').first()
+    for i in range(count):
+        db.session.add(Course(name=f'Extra {i}', teacher_id=teacher.id, time='TR 9:00-9:50 AM', capacity=30))
+    db.session.commit()
+    course_catalog.invalidate()
+
+
+def test_student_dashboard_shows_enrollments(client):
+    student = Enrollment.query.first().student
+    login_as(client, student)
+
+    page = client.get('/student').get_data(as_text=True)
+
+    assert 'Math 101' in page
+    assert 'Ralph Jenkins' in page
+    assert '3/8' in page
+    assert 'remove-btn' in page
+
+
+def test_student_dashboard_query_count_is_constant(client):
+    login_as(client, Enrollment.query.first().student)
+
+    with QueryCounter() as small:
+        client.get('/student')
+
+    add_courses(50)
+    with QueryCounter() as large:
+        client.get('/student')
+
+    with QueryCounter() as cached:
+        client.get('/student')
+
+    assert small.count == 3
+    assert large.count == small.count
+    assert cached.count == 1
+
+
+def test_student_dashboard_shows_new_seat_count_after_enroll(client):
+    course = Course.query.filter_by(name='CS 162').one()
+    student = User.query.filter_by(username='student10').one()
+    login_as(client, student)
+
+    assert '0/4' in client.get('/student').get_data(as_text=True)
+    misses = course_catalog.misses
+
+    assert client.post('/api/enroll', json={'course_id': course.id}).get_json()['success']
+    page = client.get('/student').get_data(as_text=True)
+
+    assert '1/4' in page
+    assert '0/4' not in page
+    assert course_catalog.misses == misses + 1
+
+
+def test_catalog_backends_share_invalidations(tmp_path):
+    from catalog import CatalogCache, SqliteCatalogBackend
+
+    loads = []
+    store = str(tmp_path / 'catalog.db')
+
+    def loader():
+        loads.append(1)
+        return {'courses': [{'id': len(loads)}]}
+
+    worker_a = CatalogCache(loader, SqliteCatalogBackend(store))
+    worker_b = CatalogCache(loader, SqliteCatalogBackend(store))
+
+    assert worker_a.get() == {'courses': [{'id': 1}]}
+    assert worker_b.get() == {'courses': [{'id': 1}]}
+    assert len(loads) == 1
+
+    worker_a.invalidate()
+
+    assert worker_b.get() == {'courses': [{'id': 2}]}
+    assert worker_a.get() == {'courses': [{'id': 2}]}
+    assert (worker_b.hits, worker_b.misses) == (1, 1)
+
+
+def test_update_grades_applies_batch_with_per_item_results(client):
+    math = Course.query.filter_by(name='Math 101').one()
+    login_as(client, math.teacher)
+    ids = [e.id for e in math.enrollments]
+    other = Enrollment(student_id=User.query.filter_by(username='student9').one().id,
+                       course_id=Course.query.filter_by(name='CS 162').one().id)
+    db.session.add(other)
+    db.session.commit()
+
+    payload = [{'enrollment_id': ids[0], 'grade': 70},
+               {'enrollment_id': ids[1], 'grade': 71},
+               {'enrollment_id': ids[2], 'grade': None},
+               {'enrollment_id': other.id, 'grade': 99},
+               {'enrollment_id': 9999, 'grade': 50},
+               {'enrollment_id': ids[0], 'grade': 101}]
+    with QueryCounter() as queries:
+        result = client.post('/api/update_grades', json={'grades': payload}).get_json()
+
+    assert not result['success']
+    assert result['updated'] == 3
+    assert [r['message'] for r in result['results']] == [
+        'Grade updated', 'Grade updated', 'Grade updated', 'Unauthorized', 'Enrollment not found',
+        'Invalid enrollment or grade'
+    ]
+    # Ownership lookup, one executemany UPDATE, then one upsert each for the
+    # course and student grade statistics
+    assert queries.count == 4
+
+    db.session.expire_all()
+    assert [db.session.get(Enrollment, i).grade for i in ids] == [70, 71, None]
+    assert db.session.get(Enrollment, other.id).grade is None
+
+
+def test_update_grades_requires_teacher(client):
+    login_as(client, User.query.filter_by(role='student').first())
+
+    result = client.post('/api/update_grades', json={'grades': []}).get_json()
+
+    assert result == {'success': False, 'message': 'Unauthorized'}
+
+
+@pytest.mark.parametrize('body', [[], 'x', {}, {'grades': 5}, {'grades': '90'}, {'grades': {'enrollment_id': 1}}])
+def test_update_grades_rejects_a_body_without_a_grades_list(client, body):
+    login_as(client, User.query.filter_by(username='rjenkins').one())
+
+    response = client.post('/api/update_grades', json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_update_grades_follows_a_role_change(client):
+    math = Course.query.filter_by(name='Math 101').one()
+    login_as(client, math.teacher)
+    math.teacher.role = 'student'
+    db.session.commit()
+    identity_cache.invalidate(math.teacher_id)
+
+    result = client.post('/api/update_grades', json={'grades': [{'enrollment_id': math.enrollments[0].id,
+                                                                 'grade': 70}]}).get_json()
+
+    assert result == {'success': False, 'message': 'Unauthorized'}
+
+
+def enroll_students(course, count):
+    for i, student in enumerate(User.query.filter_by(role='student').order_by(User.id).limit(count)):
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id, grade=None if i % 4 == 0 else 60 + i))
+    db.session.commit()
+
+
+def fetch_roster(client, course, **params):
+    pages = []
+    while True:
+        result = client.get(f'/api/course/{course.id}/students', query_string=params).get_json()
+        assert result['success']
+        pages.append(result['students'])
+        if not result['next_cursor']:
+            return pages
+        params['cursor'] = result['next_cursor']
+
+
+def test_roster_keyset_pages_cover_every_student_once(client):
+    course = Course.query.filter_by(name='Physics 121').one()
+    course.capacity = 50
+    enroll_students(course, 17)
+    login_as(client, course.teacher)
+
+    pages = fetch_roster(client, course, limit=5)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 2]
+    names = [s['name'] for page in pages for s in page]
+    expected = sorted(names, key=lambda name: (name.split()[1], name.split()[0]))
+    assert names == expected
+    assert len({s['id'] for page in pages for s in page}) == 17
+
+
+def test_roster_sorts_and_filters_by_grade(client):
+    course = Course.query.filter_by(name='Physics 121').one()
+    enroll_students(course, 10)
+    login_as(client, course.teacher)
+
+    pages = fetch_roster(client, course, sort='grade', order='desc', min_grade=62, max_grade=68, limit=2)
+
+    grades = [s['grade'] for page in pages for s in page]
+    assert grades == [67, 66, 65, 63, 62]
+
+
+def test_roster_rejects_bad_cursor(client):
+    course = Course.query.filter_by(name='Math 101').one()
+    login_as(client, course.teacher)
+
+    result = client.get(f'/api/course/{course.id}/students', query_string={'cursor': 'not-a-cursor'}).get_json()
+
+    assert result == {'success': False, 'message': 'Invalid cursor'}
@@ -0,0 +1,48 @@
+"""
+Tests for the database engine profiles
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+from db_profile import engine_options, sqlite_pragmas, install_sqlite_pragmas
+
+
+def test_development_profile_keeps_defaults():
+    assert engine_options('sqlite:///enrollment.db', 'development') == {}
+    assert sqlite_pragmas('development') == {'foreign_keys': 'ON'}
+
+
+def test_production_profile_for_sqlite_file():
+    options = engine_options('sqlite:///enrollment.db', 'production', env={'DB_POOL_SIZE': '4', 'DB_BUSY_TIMEOUT_MS': '2500'})
+
+    assert options['pool_size'] == 4
+    assert options['connect_args'] == {'timeout': 2.5}
+
+
+def test_production_profile_for_server_database():
+    options = engine_options('postgresql://enroll@localhost/enrollment', 'production', env={})
+
+    assert options['pool_pre_ping']
+    assert 'connect_args' not in options
+
+
+def test_production_profile_leaves_memory_database_alone():
+    assert engine_options('sqlite://', 'production') == {}
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        engine_options('sqlite:///enrollment.db', 'staging')
+
+
+def test_production_pragmas_are_applied(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "profile.db"}')
+    install_sqlite_pragmas(engine, sqlite_pragmas('production', env={'DB_CACHE_SIZE_KB': '1024'}))
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        assert conn.exec_driver_sql('PRAGMA cache_size').scalar() == -1024
+        assert conn.exec_driver_sql('PRAGMA foreign_keys').scalar() == 1
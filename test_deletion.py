@@ -0,0 +1,95 @@
+"""
+Tests for set-based deletes and database-level cascades
+"""
+
+from app import app as flask_app, db, User, Course, Enrollment, Waitlist, CourseStats, deletion_service
+from conftest import assert_matches_recompute, fill_course as fill_course_rows, login_as, queue, students
+from grade_stats import recompute_grade_stats
+
+
+def fill_course(name, students):
+    course = fill_course_rows(name, students)
+    recompute_grade_stats(db.session)
+    db.session.commit()
+    return course
+
+
+def admin_client():
+    client = flask_app.test_client()
+    login_as(client, User.query.filter_by(role='admin').one())
+    return client
+
+
+def test_deleting_a_course_cascades_in_the_database(app):
+    course = fill_course('CS 162', students()[:4])
+    queue(course, students()[4:6])
+    course_id = course.id
+
+    result = deletion_service().delete_courses([course_id])
+
+    assert (result.courses, result.enrollments) == (1, 4)
+    assert Enrollment.query.filter_by(course_id=course_id).count() == 0
+    # Nothing deleted these explicitly; ON DELETE CASCADE did
+    assert Waitlist.query.filter_by(course_id=course_id).count() == 0
+    assert db.session.get(CourseStats, course_id) is None
+    assert_matches_recompute()
+
+
+def test_deleting_a_teacher_in_batches(app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'DELETE_CHUNK_SIZE', 2)
+    teacher_id = User.query.filter_by(username='ahepworth').one().id
+    fill_course('CS 106', students()[:7])
+    cs162 = fill_course('CS 162', students()[7:11])
+    queue(cs162, students()[11:13])
+    math = Course.query.filter_by(name='Math 101').one()
+
+    result = deletion_service().delete_users([teacher_id])
+
+    assert (result.users, result.courses, result.enrollments) == (1, 2, 11)
+    assert result.batches == 6
+    assert Course.query.filter_by(teacher_id=teacher_id).count() == 0
+    assert Waitlist.query.count() == 0
+    db.session.refresh(math)
+    assert math.enrolled_count == 3
+    assert_matches_recompute()
+
+
+def test_deleting_a_student_promotes_waitlists(app):
+    ids = [student.id for student in students()]
+    course = fill_course('CS 162', students()[:4])
+    queue(course, students()[4:6])
+
+    deletion_service().delete_users([ids[0]])
+
+    db.session.expire_all()
+    assert {e.student_id for e in Enrollment.query.filter_by(course_id=course.id)} == set(ids[1:5])
+    assert db.session.get(Course, course.id).enrolled_count == 4
+    assert [w.student_id for w in Waitlist.query.filter_by(course_id=course.id)] == [ids[5]]
+    assert_matches_recompute()
+
+
+def test_bulk_delete_action_for_enrollments(client):
+    course = fill_course('CS 162', students()[:4])
+    queue(course, students()[4:7])
+    doomed = [e.id for e in Enrollment.query.filter_by(course_id=course.id).order_by(Enrollment.id).limit(2)]
+
+    response = admin_client().post('/admin/enrollment/action/', data={'action': 'delete', 'rowid': doomed})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert Enrollment.query.filter(Enrollment.id.in_(doomed)).count() == 0
+    assert db.session.get(Course, course.id).enrolled_count == 4
+    assert [w.student_id for w in Waitlist.query.filter_by(course_id=course.id)] == [students()[6].id]
+    assert_matches_recompute()
+
+
+def test_bulk_delete_action_for_users(client):
+    doomed = [students()[0].id, students()[1].id, User.query.filter_by(username='swalker').one().id]
+
+    admin_client().post('/admin/user/action/', data={'action': 'delete', 'rowid': [str(i) for i in doomed]})
+
+    db.session.expire_all()
+    assert User.query.filter(User.id.in_(doomed)).count() == 0
+    assert Course.query.filter_by(name='Physics 121').count() == 0
+    assert db.session.get(Course, Course.query.filter_by(name='Math 101').one().id).enrolled_count == 1
+    assert_matches_recompute()
@@ -0,0 +1,162 @@
+"""
+Tests for course enrollment and seat accounting
+"""
+
+import threading
+
+from app import app as flask_app, db, User, Course, Enrollment
+from conftest import login_as
+
+
+def get_course(name):
+    return Course.query.filter_by(name=name).one()
+
+
+def get_students():
+    return User.query.filter_by(role='student').order_by(User.id).all()
+
+
+def test_enroll_claims_seat(client):
+    course = get_course('CS 162')
+    student = get_students()[5]
+    login_as(client, student)
+
+    result = client.post('/api/enroll', json={'course_id': course.id}).get_json()
+
+    assert result['success']
+    db.session.refresh(course)
+    assert course.enrolled_count == 1
+    assert Enrollment.query.filter_by(student_id=student.id, course_id=course.id).count() == 1
+
+
+def test_enroll_twice_is_rejected(client):
+    course = get_course('CS 162')
+    login_as(client, get_students()[5])
+
+    client.post('/api/enroll', json={'course_id': course.id})
+    result = client.post('/api/enroll', json={'course_id': course.id}).get_json()
+
+    assert not result['success']
+    assert result['message'] == 'Already enrolled in this course'
+    db.session.refresh(course)
+    assert course.enrolled_count == 1
+
+
+def test_enroll_full_course_is_rejected(client):
+    course = get_course('CS 162')
+    for student in get_students()[:course.capacity]:
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+    course.enrolled_count = course.capacity
+    db.session.commit()
+
+    login_as(client, get_students()[-1])
+    result = client.post('/api/enroll', json={'course_id': course.id}).get_json()
+
+    assert not result['success']
+    assert result['message'] == 'Course is at capacity'
+
+
+def test_unenroll_releases_seat(client):
+    course = get_course('Math 101')
+    student = course.enrollments[0].student
+    login_as(client, student)
+
+    result = client.post('/api/unenroll', json={'course_id': course.id}).get_json()
+
+    assert result['success']
+    db.session.refresh(course)
+    assert course.enrolled_count == 2
+
+    result = client.post('/api/unenroll', json={'course_id': course.id}).get_json()
+    assert not result['success']
+    db.session.refresh(course)
+    assert course.enrolled_count == 2
+
+
+def test_enroll_and_unenroll_return_seat_deltas(client):
+    course = get_course('Math 101')
+    login_as(client, get_students()[5])
+
+    result = client.post('/api/enroll', json={'course_id': course.id}).get_json()
+
+    assert result['course'] == {'id': course.id, 'enrolled': 4, 'capacity': 8}
+    assert result['enrollment'] == {'course_id': course.id, 'grade': None}
+    assert result['button'] == 'remove'
+
+    result = client.post('/api/unenroll', json={'course_id': course.id}).get_json()
+
+    assert result['course'] == {'id': course.id, 'enrolled': 3, 'capacity': 8}
+    assert result['enrollment'] is None
+    assert result['button'] == 'add'
+
+
+def test_full_course_delta_offers_no_enroll(client):
+    course = get_course('CS 162')
+    for student in get_students()[:course.capacity]:
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+    course.enrolled_count = course.capacity
+    db.session.commit()
+
+    login_as(client, get_students()[-1])
+    result = client.post('/api/enroll', json={'course_id': course.id}).get_json()
+
+    assert result['button'] == 'full'
+    assert result['course']['enrolled'] == course.capacity
+
+
+def test_seats_endpoint_is_conditional(client):
+    course = get_course('CS 162')
+    login_as(client, get_students()[5])
+
+    first = client.get('/api/courses/seats')
+    assert first.status_code == 200
+    assert {'id': course.id, 'enrolled': 0, 'capacity': 4} in first.get_json()['courses']
+
+    unchanged = client.get('/api/courses/seats', headers={'If-None-Match': first.headers['ETag']})
+    assert unchanged.status_code == 304
+
+    client.post('/api/enroll', json={'course_id': course.id})
+    changed = client.get('/api/courses/seats', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_admin_user_delete_releases_seats(app):
+    from blueprints.admin import UserModelView
+
+    course = get_course('Math 101')
+    student = course.enrollments[0].student
+
+    with app.test_request_context():
+        assert UserModelView(User, db.session).delete_model(student)
+
+    db.session.expire_all()
+    assert get_course('Math 101').enrolled_count == 2
+
+
+def test_concurrent_enrolls_never_exceed_capacity(app):
+    course = get_course('CS 162')
+    students = get_students()
+    course_id, capacity = course.id, course.capacity
+    barrier = threading.Barrier(len(students))
+    results = []
+
+    def enroll(student_id):
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = student_id
+            sess['user_role'] = 'student'
+        barrier.wait()
+        results.append(client.post('/api/enroll', json={'course_id': course_id}).get_json())
+
+    threads = [threading.Thread(target=enroll, args=(s.id,)) for s in students]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.session.expire_all()
+    assert len(results) == len(students)
+    assert sum(r['success'] for r in results) == capacity
+    assert Enrollment.query.filter_by(course_id=course_id).count() == capacity
+    assert get_course('CS 162').enrolled_count == capacity
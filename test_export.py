@@ -0,0 +1,85 @@
+"""
+Tests for the streaming gradebook and enrollment exports
+"""
+
+import csv
+import io
+import json
+
+from app import app as flask_app, db, User, Course, Enrollment
+from conftest import login_as
+
+
+def get_course(name):
+    return Course.query.filter_by(name=name).one()
+
+
+def test_teacher_exports_course_gradebook_as_csv(client):
+    course = get_course('Math 101')
+    login_as(client, User.query.filter_by(username='rjenkins').one())
+
+    response = client.get(f'/api/course/{course.id}/export')
+
+    assert response.mimetype == 'text/csv'
+    assert f'course-{course.id}-gradebook.csv' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['username'] for row in rows] == ['student0', 'student1', 'student2']
+    assert {row['grade'] for row in rows} == {'85'}
+
+
+def test_teacher_cannot_export_other_course(client):
+    login_as(client, User.query.filter_by(username='swalker').one())
+
+    result = client.get(f'/api/course/{get_course("Math 101").id}/export').get_json()
+
+    assert result == {'success': False, 'message': 'Unauthorized'}
+
+
+def test_unknown_format_is_rejected(client):
+    course = get_course('Math 101')
+    login_as(client, User.query.filter_by(username='rjenkins').one())
+
+    response = client.get(f'/api/course/{course.id}/export?format=xml')
+
+    assert response.status_code == 400
+    assert not response.get_json()['success']
+
+
+def test_admin_exports_every_enrollment_as_ndjson(client):
+    students = User.query.filter_by(role='student').order_by(User.id).all()
+    physics = get_course('Physics 121')
+    db.session.add(Enrollment(student_id=students[5].id, course_id=physics.id, grade=None))
+    db.session.commit()
+    login_as(client, User.query.filter_by(role='admin').one())
+
+    lines = client.get('/admin/export?format=ndjson').get_data(as_text=True).splitlines()
+
+    records = [json.loads(line) for line in lines]
+    assert len(records) == Enrollment.query.count() == 4
+    assert records[-1]['course'] == 'Physics 121'
+    assert records[-1]['teacher'] == 'swalker'
+    assert records[-1]['grade'] is None
+
+    only_physics = client.get(f'/admin/export?format=ndjson&course_id={physics.id}').get_data(as_text=True)
+    assert len(only_physics.splitlines()) == 1
+
+
+def test_export_requires_admin(client):
+    login_as(client, User.query.filter_by(username='student0').one())
+
+    response = client.get('/admin/export')
+
+    assert response.status_code == 302
+
+
+def test_export_streams_in_batches(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'EXPORT_BATCH_SIZE', 1)
+    login_as(client, User.query.filter_by(role='admin').one())
+
+    response = client.get('/admin/export', buffered=False)
+    chunks = list(response.response)
+    response.close()
+
+    # One chunk per fetched batch, the first led by the header row
+    assert len(chunks) == 3
+    assert chunks[0].startswith(b'enrollment_id,course_id,course')
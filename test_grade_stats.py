@@ -0,0 +1,120 @@
+"""
+Tests for the materialized course and student grade statistics
+"""
+
+from sqlalchemy import text
+
+from app import app as flask_app, db, User, Course, Enrollment, CourseStats
+from conftest import QueryCounter, assert_matches_recompute, grade_stats_snapshot, login_as
+
+
+def get_course(name):
+    return Course.query.filter_by(name=name).one()
+
+
+def get_user(username):
+    return User.query.filter_by(username=username).one()
+
+
+def test_course_stats_read_from_one_row(client):
+    math = get_course('Math 101')
+    login_as(client, math.teacher)
+
+    with QueryCounter() as queries:
+        result = client.get(f'/api/course/{math.id}/stats').get_json()
+
+    assert result['success']
+    assert (result['enrolled'], result['graded'], result['missing']) == (3, 3, 0)
+    assert (result['average'], result['stddev']) == (85, 0)
+    assert result['distribution'] == {'A': 0, 'B': 3, 'C': 0, 'D': 0, 'F': 0}
+    # At most the course (for its owner) and its statistics row
+    assert queries.count <= 2
+
+
+def test_course_stats_require_owner_or_admin(client):
+    math = get_course('Math 101')
+    login_as(client, get_user('swalker'))
+    assert client.get(f'/api/course/{math.id}/stats').get_json()['message'] == 'Unauthorized'
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    assert client.get(f'/api/course/{math.id}/stats').get_json()['graded'] == 3
+
+
+def test_grade_updates_keep_stats_current(client):
+    math = get_course('Math 101')
+    login_as(client, math.teacher)
+    first, second, third = sorted(math.enrollments, key=lambda e: e.id)
+
+    client.post('/api/update_grade', json={'enrollment_id': first.id, 'grade': 95})
+    client.post('/api/update_grades', json={'grades': [{'enrollment_id': second.id, 'grade': 55},
+                                                       {'enrollment_id': third.id, 'grade': None}]})
+
+    result = client.get(f'/api/course/{math.id}/stats').get_json()
+    assert (result['graded'], result['missing'], result['average']) == (2, 1, 75)
+    assert result['stddev'] == 20
+    assert result['distribution'] == {'A': 1, 'B': 0, 'C': 0, 'D': 0, 'F': 1}
+    assert_matches_recompute()
+
+
+def test_update_grade_rejects_invalid_grade(client):
+    math = get_course('Math 101')
+    login_as(client, math.teacher)
+
+    result = client.post('/api/update_grade', json={'enrollment_id': math.enrollments[0].id, 'grade': 'A+'}).get_json()
+
+    assert result == {'success': False, 'message': 'Invalid grade'}
+
+
+def test_enrollment_changes_keep_stats_current(client):
+    students = User.query.filter_by(role='student').order_by(User.id).all()
+    cs162 = get_course('CS 162')
+    math = get_course('Math 101')
+
+    login_as(client, students[0])
+    client.post('/api/unenroll', json={'course_id': math.id})
+    client.post('/api/enroll', json={'course_id': cs162.id})
+
+    admin = flask_app.test_client()
+    login_as(admin, User.query.filter_by(role='admin').one())
+    enrollment = Enrollment.query.filter_by(student_id=students[1].id, course_id=math.id).one()
+    admin.post(f'/admin/enrollment/edit/?id={enrollment.id}', data={
+        'student_id': str(students[1].id), 'course_id': str(cs162.id), 'grade': '62'
+    })
+    admin.post('/admin/enrollment/new/', data={
+        'student_id': str(students[4].id), 'course_id': str(math.id), 'grade': '100'
+    })
+    doomed = Enrollment.query.filter_by(student_id=students[2].id, course_id=math.id).one()
+    admin.post('/admin/enrollment/delete/', data={'id': str(doomed.id)})
+
+    courses, by_student = grade_stats_snapshot()
+    assert courses[cs162.id] == (1, 62, 62 * 62, 1, 0, 0, 0, 1, 0)
+    assert courses[math.id] == (1, 100, 100 * 100, 0, 1, 0, 0, 0, 0)
+    assert students[2].id not in by_student
+    assert_matches_recompute()
+
+    admin.post('/admin/user/delete/', data={'id': str(math.teacher_id)})
+    admin.post('/admin/course/delete/', data={'id': str(cs162.id)})
+    assert grade_stats_snapshot() == ({}, {})
+    assert_matches_recompute()
+
+
+def test_transcript_summary(client):
+    student = get_user('student0')
+    login_as(client, student)
+
+    result = client.get(f'/api/student/{student.id}/transcript').get_json()
+
+    assert (result['courses'], result['graded'], result['average'], result['gpa']) == (1, 1, 85, 3)
+    assert client.get(f'/api/student/{get_user("student1").id}/transcript').get_json()['message'] == 'Unauthorized'
+
+
+def test_recompute_command_repairs_stats(app):
+    db.session.execute(text("UPDATE course_stats SET grade_sum = 0, bucket_b = 7"))
+    db.session.commit()
+
+    output = app.test_cli_runner().invoke(args=['recompute-stats']).output
+
+    assert 'recomputed' in output
+    math = db.session.get(CourseStats, get_course('Math 101').id)
+    db.session.refresh(math)
+    assert (math.grade_sum, math.bucket_b) == (255, 3)
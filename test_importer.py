@@ -0,0 +1,178 @@
+"""
+Tests for the bulk import pipeline
+"""
+
+import csv
+import io
+import os
+
+import pytest
+
+from app import db, User, Course
+from conftest import login_as
+
+
+ROSTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Enrollment example data for Lab8-1.xlsx')
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_cli_imports_users_courses_and_enrollments(app, tmp_path):
+    runner = app.test_cli_runner()
+
+    users = write_csv(tmp_path / 'users.csv', ['username', 'first_name', 'last_name', 'role'], [
+        ['newteacher', 'New', 'Teacher', 'teacher'],
+        ['new0', 'New', 'Zero', 'student'],
+        ['new1', 'New', 'One', 'student'],
+        ['student0', 'Dup', 'User', 'student'],
+        ['bad', 'Bad', 'Role', 'janitor']
+    ])
+    result = runner.invoke(args=['import-data', 'users', users])
+    assert 'Imported 3 users, rejected 2' in result.output
+
+    courses = write_csv(tmp_path / 'courses.csv', ['name', 'teacher', 'time', 'capacity'], [
+        ['CS 999', 'newteacher', 'TR 1:00-1:50 PM', '1'],
+        ['CS 998', 'student0', 'TR 1:00-1:50 PM', '5']
+    ])
+    result = runner.invoke(args=['import-data', 'courses', courses])
+    assert 'Imported 1 courses, rejected 1' in result.output
+
+    report = tmp_path / 'rejected.csv'
+    enrollments = write_csv(tmp_path / 'enrollments.csv', ['student', 'course', 'grade'], [
+        ['new0', 'CS 999', '88'],
+        ['new1', 'CS 999', ''],
+        ['new0', 'Math 101', ''],
+        ['new0', 'Math 101', ''],
+        ['nobody', 'Math 101', '']
+    ])
+    result = runner.invoke(args=['import-data', 'enrollments', enrollments, '--report', str(report)])
+    assert 'Imported 2 enrollments, rejected 3' in result.output
+
+    reasons = [row['reason'] for row in csv.DictReader(open(report))]
+    assert reasons == ['Course is at capacity', 'Already enrolled in this course', 'Unknown student "nobody"']
+
+    db.session.expire_all()
+    course = Course.query.filter_by(name='CS 999').one()
+    assert course.enrolled_count == 1
+    assert course.enrollments[0].grade == 88
+    assert Course.query.filter_by(name='Math 101').one().enrolled_count == 4
+
+
+def test_imports_the_class_roster_spreadsheet(app, tmp_path):
+    pytest.importorskip('openpyxl')
+    runner = app.test_cli_runner()
+    users = write_csv(tmp_path / 'users.csv', ['username', 'first_name', 'last_name', 'role'], [
+        ['jsantos', 'Jose', 'Santos', 'student'], ['bbrown', 'Betty', 'Brown', 'student'],
+        ['jstuart', 'John', 'Stuart', 'student'], ['lcheng', 'Li', 'Cheng', 'student'],
+        ['nlittle', 'Nancy', 'Little', 'student'], ['mnorris', 'Mindy', 'Norris', 'student'],
+        ['aranganath', 'Aditya', 'Ranganath', 'student'], ['ychen', 'Yi Wen', 'Chen', 'student']
+    ])
+    runner.invoke(args=['import-data', 'users', users])
+
+    # The seeded campus already has the four classes, with the same teachers
+    report = tmp_path / 'courses.csv'
+    result = runner.invoke(args=['import-data', 'courses', ROSTER, '--report', str(report)])
+    assert 'Imported 0 courses, rejected 4' in result.output
+    assert [row['line'] for row in csv.DictReader(open(report))] == ['2', '7', '14', '19']
+    assert {row['reason'] for row in csv.DictReader(open(report))} == {'Course already exists'}
+
+    result = runner.invoke(args=['import-data', 'enrollments', ROSTER])
+    assert 'Imported 17 enrollments, rejected 0' in result.output
+
+    db.session.expire_all()
+    mindy = User.query.filter_by(username='mnorris').one()
+    assert sorted(e.grade for e in mindy.enrollments) == [68, 94]
+    assert Course.query.filter_by(name='CS 162').one().enrolled_count == 4
+
+
+def test_rejects_grades_outside_0_to_100(app):
+    from importer import BulkImporter
+
+    rows = [{'student': f'student{i}', 'course': 'CS 106', 'grade': grade}
+            for i, grade in enumerate(['100', '101', '-1', 'A', '0'], start=5)]
+
+    result = BulkImporter(db.session).run('enrollments', iter(rows))
+
+    assert result.imported == 2
+    assert [r['line'] for r in result.rejections] == [3, 4, 5]
+    assert result.rejections[0]['reason'] == 'Invalid grade "101", expected 0-100'
+
+
+def test_rejects_capacities_that_are_not_positive_integers(app):
+    from importer import BulkImporter
+
+    capacities = ['30', '30.0', 'inf', '1e400', 'nan', '2.5', '0', '9' * 20]
+    rows = [{'name': f'CS {900 + i}', 'teacher': 'ahepworth', 'time': 'TR 1:00-1:50 PM', 'capacity': capacity}
+            for i, capacity in enumerate(capacities)]
+
+    result = BulkImporter(db.session).run('courses', iter(rows))
+
+    assert result.imported == 2
+    assert [r['line'] for r in result.rejections] == [4, 5, 6, 7, 8, 9]
+    assert {r['reason'] for r in result.rejections} == {'Capacity must be a positive integer'}
+    assert [c.capacity for c in Course.query.filter(Course.name.in_(['CS 900', 'CS 901']))] == [30, 30]
+
+
+def test_imports_in_chunks(app):
+    from importer import BulkImporter
+
+    rows = [{'username': f'bulk{i}', 'first_name': 'Bulk', 'last_name': str(i), 'role': 'student'} for i in range(2500)]
+    chunks = []
+
+    result = BulkImporter(db.session, chunk_size=1000, on_chunk=lambda: chunks.append(1)).run('users', iter(rows))
+
+    assert result.imported == 2500
+    assert len(chunks) == 3
+    assert User.query.filter(User.username.like('bulk%')).count() == 2500
+
+
+def test_imported_passwords_use_the_password_policy(app):
+    from importer import BulkImporter
+    from auth import PasswordPolicy
+
+    policy = PasswordPolicy('pbkdf2:sha256:2')
+    rows = [{'username': 'hashed0', 'first_name': 'A', 'last_name': 'B', 'role': 'student', 'password': 'secret123'},
+            {'username': 'hashed1', 'first_name': 'C', 'last_name': 'D', 'role': 'student'},
+            {'username': 'hashed2', 'first_name': 'E', 'last_name': 'F', 'role': 'student'}]
+
+    BulkImporter(db.session, hash_password=policy.hash).run('users', iter(rows))
+
+    users = User.query.filter(User.username.like('hashed%')).order_by(User.username).all()
+    assert not any(policy.needs_rehash(user.password_hash) for user in users)
+    assert policy.verify(users[0].password_hash, 'secret123')
+    assert users[1].password_hash == users[2].password_hash
+
+
+def test_admin_import_endpoint_accepts_xlsx(client):
+    openpyxl = pytest.importorskip('openpyxl')
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Student', 'Course', 'Grade'])
+    sheet.append(['student10', 'CS 162', 91])
+    sheet.append(['student11', 'No Such Course', None])
+    upload = io.BytesIO()
+    workbook.save(upload)
+    upload.seek(0)
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    result = client.post('/admin/import', data={'kind': 'enrollments', 'file': (upload, 'enrollments.xlsx')}).get_json()
+
+    assert result['success']
+    assert result['imported'] == 1
+    assert result['rejections'][0]['line'] == 3
+    assert Course.query.filter_by(name='CS 162').one().enrolled_count == 1
+
+
+def test_admin_import_requires_admin(client):
+    login_as(client, User.query.filter_by(role='student').first())
+
+    response = client.post('/admin/import', data={'kind': 'users'})
+
+    assert response.status_code == 302
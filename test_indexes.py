@@ -0,0 +1,83 @@
+"""
+Tests that the hot query shapes are served by indexes
+"""
+
+from sqlalchemy import event, inspect, text
+
+from app import app as flask_app, db, User, Course, migrate_schema, course_catalog
+from blueprints.admin import UserModelView
+from conftest import login_as
+
+
+def capture_statements(action):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        action()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def full_scans(statements):
+    scans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+                if row[3].startswith('SCAN '):
+                    scans.append((row[3], statement))
+    return scans
+
+
+def test_hot_queries_use_indexes(client):
+    math = Course.query.filter_by(name='Math 101').one()
+    cs162 = Course.query.filter_by(name='CS 162').one()
+    student = math.enrollments[0].student
+    teacher = math.teacher
+    course_catalog.get()
+
+    def hot_paths():
+        login_as(client, student)
+        client.get('/student')
+        client.post('/api/enroll', json={'course_id': cs162.id})
+        client.post('/api/unenroll', json={'course_id': cs162.id})
+
+        login_as(client, teacher)
+        client.get('/teacher')
+        client.get(f'/api/course/{math.id}/students')
+        client.post('/api/update_grades', json={'grades': [{'enrollment_id': math.enrollments[0].id, 'grade': 90}]})
+
+        User.query.filter_by(role='teacher').order_by(User.last_name, User.first_name).all()
+        with flask_app.test_request_context():
+            UserModelView(User, db.session).delete_model(teacher)
+
+    statements = capture_statements(hot_paths)
+
+    assert len(statements) > 10
+    assert full_scans(statements) == []
+
+
+def test_migrate_schema_upgrades_existing_database(app):
+    with db.engine.begin() as conn:
+        for index in ('ix_user_role_name', 'ix_course_teacher_id', 'ix_enrollment_course_student'):
+            conn.execute(text(f'DROP INDEX {index}'))
+        conn.execute(text('ALTER TABLE course DROP COLUMN enrolled_count'))
+    # Start from fresh connections, as a migration would in a new process
+    db.session.remove()
+    db.engine.dispose()
+
+    migrate_schema()
+
+    inspector = inspect(db.engine)
+    assert 'enrolled_count' in [c['name'] for c in inspector.get_columns('course')]
+    assert 'ix_enrollment_course_student' in [i['name'] for i in inspector.get_indexes('enrollment')]
+    assert 'ix_course_teacher_id' in [i['name'] for i in inspector.get_indexes('course')]
+    assert 'ix_user_role_name' in [i['name'] for i in inspector.get_indexes('user')]
+
+    db.session.expire_all()
+    assert Course.query.filter_by(name='Math 101').one().enrolled_count == 3
@@ -0,0 +1,43 @@
+"""
+Tests for per-request instrumentation
+"""
+
+from app import app as flask_app, User, Enrollment
+from conftest import login_as
+
+
+def test_server_timing_header(client):
+    login_as(client, Enrollment.query.first().student)
+
+    response = client.get('/student')
+
+    timing = response.headers['Server-Timing']
+    assert 'db;dur=' in timing
+    assert 'queries"' in timing
+    assert 'tpl;dur=' in timing
+    assert 'total;dur=' in timing
+
+
+def test_admin_metrics_reports_percentiles(client):
+    flask_app.extensions['instrumentation'].reset()
+    login_as(client, Enrollment.query.first().student)
+    for _ in range(5):
+        client.get('/student')
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    metrics = client.get('/admin/metrics').get_json()
+
+    assert metrics['enabled']
+    dashboard = metrics['routes']['student.dashboard']
+    assert dashboard['queries']['count'] == 5
+    assert dashboard['queries']['p50'] == 1
+    assert metrics['catalog']['hits'] >= 4
+    assert set(dashboard['wall_ms']) == {'count', 'p50', 'p95', 'p99'}
+
+
+def test_admin_metrics_requires_admin(client):
+    login_as(client, Enrollment.query.first().student)
+
+    response = client.get('/admin/metrics')
+
+    assert response.status_code == 302
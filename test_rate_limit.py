@@ -0,0 +1,177 @@
+"""
+Tests for token-bucket rate limiting and Idempotency-Key replays
+"""
+
+import time
+
+import pytest
+
+from app import app as flask_app, User, Course, Enrollment
+from conftest import QueryCounter, login_as
+from idempotency import IdempotencyCache, SqliteIdempotencyBackend
+from rate_limit import RateLimiter, SqliteBucketBackend, parse_rule
+
+
+@pytest.fixture(autouse=True)
+def fresh_keys(monkeypatch):
+    # User ids repeat from test to test, so stored responses must not carry over
+    monkeypatch.setitem(flask_app.extensions, 'idempotency_cache', IdempotencyCache())
+
+
+def limit(monkeypatch, **rules):
+    limiter = RateLimiter(dict({'session': '1000/1000', 'ip': '1000/1000', 'login': '1000/1000'}, **rules))
+    monkeypatch.setitem(flask_app.extensions, 'rate_limiter', limiter)
+    return limiter
+
+
+def student(i=0):
+    return User.query.filter_by(username=f'student{i}').one()
+
+
+def course(name):
+    return Course.query.filter_by(name=name).one()
+
+
+def test_bucket_allows_a_burst_then_refills():
+    limiter = RateLimiter({'session': '50/2'})
+
+    assert [limiter.check([('session', 1)]) for _ in range(3)][:2] == [0, 0]
+    assert 0 < limiter.check([('session', 1)]) <= 1 / 50
+    assert limiter.check([('session', 2)]) == 0
+
+    time.sleep(0.05)
+    assert limiter.check([('session', 1)]) == 0
+    assert limiter.stats() == {'session': {'allowed': 4, 'rejected': 2}}
+
+
+def test_any_empty_bucket_rejects():
+    limiter = RateLimiter({'session': '1/5', 'ip': '1/1'})
+
+    assert limiter.check([('ip', '10.0.0.1'), ('session', 1)]) == 0
+    assert limiter.check([('ip', '10.0.0.1'), ('session', 2)]) > 0
+    assert limiter.stats()['ip']['rejected'] == 1
+
+
+@pytest.mark.parametrize('value', ['0/5', '2/0', 'fast'])
+def test_parse_rule_rejects_bad_settings(value):
+    with pytest.raises(ValueError):
+        parse_rule(value)
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    first = RateLimiter({'ip': '0.001/2'}, SqliteBucketBackend(str(tmp_path / 'limits.db')))
+    second = RateLimiter({'ip': '0.001/2'}, SqliteBucketBackend(str(tmp_path / 'limits.db')))
+
+    assert first.check([('ip', 'a')]) == 0
+    assert second.check([('ip', 'a')]) == 0
+    assert first.check([('ip', 'a')]) > 0
+
+
+def test_writes_are_limited_per_session(client, monkeypatch):
+    limiter = limit(monkeypatch, session='0.001/2')
+    login_as(client, student())
+    ids = [course(name).id for name in ('Physics 121', 'CS 106', 'CS 162')]
+
+    responses = [client.post('/api/enroll', json={'course_id': course_id}) for course_id in ids]
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert int(responses[2].headers['Retry-After']) >= 1
+    assert responses[2].get_json()['success'] is False
+    assert Enrollment.query.filter_by(student_id=student().id, course_id=ids[2]).count() == 0
+    assert limiter.stats()['session'] == {'allowed': 2, 'rejected': 1}
+
+    login_as(client, student(1))
+    assert client.post('/api/enroll', json={'course_id': ids[2]}).status_code == 200
+
+
+def test_login_attempts_are_limited_per_address(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'RATE_LIMIT_BY_IP', True)
+    limit(monkeypatch, login='0.001/2')
+
+    for _ in range(2):
+        assert client.post('/login', data={'username': 'student0', 'password': 'wrong'}).status_code == 200
+    response = client.post('/login', data={'username': 'student0', 'password': 'password'})
+
+    assert response.status_code == 429
+    assert b'Too many sign-in attempts' in response.data
+    assert client.get('/login').status_code == 200
+
+
+def test_ip_rules_are_off_until_the_address_is_trusted(client, monkeypatch):
+    limiter = limit(monkeypatch, login='0.001/1', ip='0.001/1')
+    login_as(client, student())
+    ids = [course(name).id for name in ('Physics 121', 'CS 106')]
+
+    logins = [client.post('/login', data={'username': 'student0', 'password': 'wrong'}) for _ in range(2)]
+    writes = [client.post('/api/enroll', json={'course_id': course_id}) for course_id in ids]
+
+    assert [r.status_code for r in logins + writes] == [200] * 4
+    assert limiter.stats()['ip']['allowed'] == limiter.stats()['login']['allowed'] == 0
+
+
+def test_repeated_idempotency_key_replays_without_queries(client):
+    login_as(client, student())
+    course_id = course('CS 106').id
+    headers = {'Idempotency-Key': 'enroll-cs106'}
+
+    first = client.post('/api/enroll', json={'course_id': course_id}, headers=headers)
+    with QueryCounter() as queries:
+        second = client.post('/api/enroll', json={'course_id': course_id}, headers=headers)
+
+    assert first.get_json()['message'] == 'Successfully enrolled'
+    assert second.get_json() == first.get_json()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert queries.count == 0
+    assert flask_app.extensions['idempotency_cache'].stats()['replays'] == 1
+
+    # Without the key the request runs again
+    again = client.post('/api/enroll', json={'course_id': course_id})
+    assert again.get_json()['message'] == 'Already enrolled in this course'
+
+
+def test_idempotency_keys_are_scoped_and_checked(client):
+    cs106, cs162 = course('CS 106'), course('CS 162')
+    headers = {'Idempotency-Key': 'same-key'}
+    login_as(client, student())
+    client.post('/api/enroll', json={'course_id': cs106.id}, headers=headers)
+
+    reused = client.post('/api/enroll', json={'course_id': cs162.id}, headers=headers)
+    assert reused.status_code == 422
+
+    login_as(client, student(1))
+    other = client.post('/api/enroll', json={'course_id': cs106.id}, headers=headers)
+    assert other.get_json()['message'] == 'Successfully enrolled'
+    assert Enrollment.query.filter_by(course_id=cs106.id).count() == 2
+
+    assert client.post('/api/enroll', json={'course_id': cs106.id},
+                       headers={'Idempotency-Key': 'x' * 300}).status_code == 400
+
+
+def test_key_in_flight_is_a_conflict_and_limited_requests_release_it(client, monkeypatch):
+    login_as(client, student())
+    cs106 = course('CS 106')
+    cache = flask_app.extensions['idempotency_cache']
+    assert cache.begin(f'{student().id}:/api/enroll', 'busy', b'{}') is None
+
+    busy = client.post('/api/enroll', json={}, headers={'Idempotency-Key': 'busy'})
+    assert busy.status_code == 409
+
+    limit(monkeypatch, session='0.001/1')
+    client.post('/api/unenroll', json={'course_id': cs106.id})
+    limited = client.post('/api/enroll', json={'course_id': cs106.id}, headers={'Idempotency-Key': 'later'})
+    assert limited.status_code == 429
+
+    limit(monkeypatch)
+    retried = client.post('/api/enroll', json={'course_id': cs106.id}, headers={'Idempotency-Key': 'later'})
+    assert retried.get_json()['message'] == 'Successfully enrolled'
+
+
+def test_sqlite_idempotency_entries_are_shared(tmp_path):
+    first = IdempotencyCache(SqliteIdempotencyBackend(str(tmp_path / 'keys.db')))
+    second = IdempotencyCache(SqliteIdempotencyBackend(str(tmp_path / 'keys.db')))
+
+    assert first.begin('1:/api/enroll', 'k', b'{"course_id": 1}') is None
+    assert second.begin('1:/api/enroll', 'k', b'{"course_id": 1}')[0] == 409
+    first.finish('1:/api/enroll', 'k', b'{"course_id": 1}', 200, '{"success": true}')
+
+    assert second.begin('1:/api/enroll', 'k', b'{"course_id": 1}') == (200, '{"success": true}')
@@ -0,0 +1,140 @@
+"""
+Tests for read-replica routing, snapshot replicas and read-your-writes stickiness
+"""
+
+import pytest
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.exc import OperationalError
+
+from app import app as flask_app, db, User, Course, Enrollment
+from conftest import login_as
+from replica import ReplicaRouter, SnapshotReplica, _statement_kind, make_replica_router
+
+
+@pytest.fixture
+def router(app, tmp_path, monkeypatch):
+    replica = SnapshotReplica(db.engine.url.database, str(tmp_path / 'snapshots'), interval=3600)
+    replica.refresh()
+    router = ReplicaRouter(replica, max_staleness=30)
+    monkeypatch.setitem(flask_app.extensions, 'replica_router', router)
+    yield router
+    replica.engine.dispose()
+
+
+def teacher_client(client):
+    login_as(client, User.query.filter_by(username='rjenkins').one())
+    return client
+
+
+def math_roster(client):
+    # Grades by enrollment id
+    course_id = Course.query.filter_by(name='Math 101').one().id
+    return {s['id']: s['grade'] for s in client.get(f'/api/course/{course_id}/students').get_json()['students']}
+
+
+def write_behind_the_replica(grade):
+    # A write by someone else, which leaves no mark for the teacher
+    enrollment = Enrollment.query.join(Course).filter(Course.name == 'Math 101').order_by(Enrollment.id).first()
+    db.session.execute(text('UPDATE enrollment SET grade = :grade WHERE id = :id'), {'grade': grade, 'id': enrollment.id})
+    db.session.commit()
+    return enrollment.id
+
+
+@pytest.mark.parametrize('statement, kind', [
+    (select(User), 'read'),
+    (text('  select 1'), 'read'),
+    (text('WITH x AS (SELECT 1) SELECT * FROM x'), 'read'),
+    (insert(User), 'write'),
+    (delete(User), 'write'),
+    (text('UPDATE course SET capacity = 1'), 'write'),
+    (None, 'other'),
+])
+def test_statement_kind(statement, kind):
+    assert _statement_kind(statement) == kind
+
+
+def test_read_only_views_read_the_snapshot(client, router):
+    client = teacher_client(client)
+    enrollment_id = write_behind_the_replica(42)
+
+    assert math_roster(client)[enrollment_id] == 85
+    assert router.replica_reads == 1
+
+    router.replica.refresh()
+    assert math_roster(client)[enrollment_id] == 42
+
+
+def test_writer_reads_its_own_writes(client, router):
+    client = teacher_client(client)
+    enrollment_id = Enrollment.query.join(Course).filter(Course.name == 'Math 101').order_by(Enrollment.id).first().id
+
+    assert client.post('/api/update_grade', json={'enrollment_id': enrollment_id, 'grade': 71}).get_json()['success']
+
+    assert math_roster(client)[enrollment_id] == 71
+    assert (router.sticky_reads, router.replica_reads) == (1, 0)
+
+    router.replica.refresh()
+    assert math_roster(client)[enrollment_id] == 71
+    assert router.replica_reads == 1
+
+
+def test_stale_replica_falls_back_to_the_primary(client, router):
+    client = teacher_client(client)
+    enrollment_id = write_behind_the_replica(42)
+    router.replica.taken_at -= 60
+
+    assert math_roster(client)[enrollment_id] == 42
+    assert router.stale_reads == 1
+
+    status = client.get('/api/replica/status')
+    assert status.status_code == 503
+    assert status.get_json()['stale'] is True and status.get_json()['staleness_seconds'] >= 60
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    assert client.get('/admin/metrics').get_json()['replica']['stale_reads'] == 1
+
+
+def test_catalog_is_built_from_the_primary(client, router):
+    teacher = User.query.filter_by(username='swalker').one()
+    db.session.add(Course(name='Stat 131', teacher_id=teacher.id, time='MW 6:00-7:15 PM', capacity=5))
+    db.session.commit()
+    flask_app.extensions['course_catalog'].invalidate()
+    login_as(client, User.query.filter_by(username='student0').one())
+
+    page = client.get('/student').get_data(as_text=True)
+
+    assert 'Stat 131' in page
+    assert router.replica_reads == 1
+
+
+def test_admin_list_reads_the_snapshot(client, router):
+    db.session.add(User(username='newcomer', role='student', first_name='New', last_name='Comer',
+                        password_hash='x'))
+    db.session.commit()
+    login_as(client, User.query.filter_by(role='admin').one())
+
+    assert 'newcomer' not in client.get('/admin/user/').get_data(as_text=True)
+    router.replica.refresh()
+    assert 'newcomer' in client.get('/admin/user/').get_data(as_text=True)
+
+
+def test_snapshot_is_read_only(router):
+    with pytest.raises(OperationalError):
+        with router.replica.engine.begin() as conn:
+            conn.execute(text("DELETE FROM enrollment"))
+
+
+def test_old_snapshots_are_removed(router, tmp_path):
+    for _ in range(3):
+        router.replica.refresh()
+
+    assert len(list((tmp_path / 'snapshots').iterdir())) == 2
+
+
+def test_replica_settings(app, tmp_path):
+    config = dict(flask_app.config, REPLICA_SNAPSHOT_INTERVAL=5, REPLICA_SNAPSHOT_DIR=str(tmp_path))
+
+    assert make_replica_router(dict(config, REPLICA_SNAPSHOT_INTERVAL=0), db.engine.url) is None
+    assert make_replica_router(config, db.engine.url).replica.directory == str(tmp_path)
+    with pytest.raises(ValueError):
+        make_replica_router(config, db.engine.url.set(database=':memory:'))
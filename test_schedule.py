@@ -0,0 +1,142 @@
+"""
+Tests for meeting time parsing and schedule conflict detection
+"""
+
+import pytest
+from sqlalchemy import text
+
+from app import db, User, Course, Enrollment, Waitlist, migrate_schema
+from conftest import login_as, students
+from schedule import Meeting, ScheduleIndex, parse_meeting, schedule_conflicts
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('MWF 10:00-10:50 AM', (0b10101, 600, 650)),
+    ('TR 3:00-3:50 PM', (0b01010, 900, 950)),
+    ('TTh 11:30-12:45 PM', (0b01010, 690, 765)),
+    ('M 10:00 AM-2:00 PM', (0b00001, 600, 840)),
+    ('F 13:00-14:15', (0b10000, 780, 855)),
+    ('SaSu 9-10 am', (0b1100000, 540, 600)),
+])
+def test_parse_meeting(value, expected):
+    assert parse_meeting(value) == Meeting(*expected)
+
+
+@pytest.mark.parametrize('value', ['TBA', 'Online', 'MWF', 'MX 9:00-10:00 AM', 'M 10:00-9:00 AM', ''])
+def test_parse_meeting_rejects_unreadable_times(value):
+    with pytest.raises(ValueError):
+        parse_meeting(value)
+
+
+def test_schedule_index_finds_overlaps():
+    index = ScheduleIndex([('Math', parse_meeting('MWF 10:00-10:50 AM')),
+                           ('Lab', parse_meeting('TR 9:00-12:00 PM')),
+                           ('Seminar', parse_meeting('R 11:00-11:30 AM'))])
+
+    assert sorted(index.conflicts(parse_meeting('R 10:30-11:10 AM'))) == ['Lab', 'Seminar']
+    assert index.conflicts(parse_meeting('MW 10:50-11:40 AM')) == []
+    assert index.conflicts(parse_meeting('F 9:00-10:01 AM')) == ['Math']
+    assert len(index) == 6
+
+
+def add_course(name, time, capacity=5):
+    teacher = User.query.filter_by(username='swalker').one()
+    course = Course(name=name, teacher_id=teacher.id, time=time, capacity=capacity)
+    db.session.add(course)
+    db.session.commit()
+    return course
+
+
+def test_course_time_is_parsed_when_set(app):
+    course = add_course('Stat 131', 'MW 10:30-11:45 AM')
+    assert (course.meeting_days, course.start_minute, course.end_minute) == (0b101, 630, 705)
+
+    course.time = 'TBA'
+    db.session.commit()
+    assert course.meeting is None
+
+
+def test_enroll_rejects_overlapping_course(client):
+    stats = add_course('Stat 131', 'MW 10:30-11:45 AM')
+    evening = add_course('Stat 132', 'MW 6:00-7:15 PM')
+    login_as(client, students()[0])
+
+    result = client.post('/api/enroll', json={'course_id': stats.id}).get_json()
+
+    assert result == {'success': False, 'message': 'Schedule conflict with Math 101'}
+    db.session.expire_all()
+    assert db.session.get(Course, stats.id).enrolled_count == 0
+    assert client.post('/api/enroll', json={'course_id': evening.id}).get_json()['success']
+    assert client.post('/api/enroll', json={'course_id': evening.id}).get_json()['message'] == \
+        'Already enrolled in this course'
+
+
+def test_waitlist_promotion_passes_over_conflicting_students(client):
+    cs162 = Course.query.filter_by(name='CS 162').one()
+    lab = add_course('CS 162L', 'R 3:30-5:20 PM')
+    holders, first, second = students()[3:7], students()[7], students()[8]
+    for student in holders:
+        db.session.add(Enrollment(student_id=student.id, course_id=cs162.id))
+    cs162.enrolled_count = len(holders)
+    db.session.add_all([Waitlist(student_id=first.id, course_id=cs162.id),
+                        Waitlist(student_id=second.id, course_id=cs162.id)])
+    db.session.add(Enrollment(student_id=first.id, course_id=lab.id))
+    db.session.commit()
+
+    login_as(client, holders[0])
+    client.post('/api/unenroll', json={'course_id': cs162.id})
+
+    assert {e.student_id for e in Enrollment.query.filter_by(course_id=cs162.id)} == \
+        {s.id for s in holders[1:]} | {second.id}
+    assert [w.student_id for w in Waitlist.query.filter_by(course_id=cs162.id)] == [first.id]
+
+    login_as(client, students()[9])
+    db.session.add(Enrollment(student_id=students()[9].id, course_id=lab.id))
+    db.session.commit()
+    result = client.post('/api/waitlist/join', json={'course_id': cs162.id}).get_json()
+    assert result == {'success': False, 'message': 'Schedule conflict with CS 162L'}
+
+
+def test_conflict_report(client):
+    overlap = add_course('Stat 131', 'MW 10:30-11:45 AM')
+    add_course('Online 1', 'TBA')
+    student = students()[1]
+    db.session.add(Enrollment(student_id=student.id, course_id=overlap.id))
+    db.session.commit()
+    math = Course.query.filter_by(name='Math 101').one()
+
+    assert schedule_conflicts(db.session, batch_size=2) == [(student.id, math.id, overlap.id)]
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    page = client.get('/admin/conflicts').get_data(as_text=True)
+    assert '1 pair of overlapping courses' in page
+    assert 'student1' in page and 'Stat 131' in page
+    assert 'Online 1' in page
+
+
+def test_migrate_schema_parses_existing_course_times(app):
+    with db.engine.begin() as conn:
+        for column in ('meeting_days', 'start_minute', 'end_minute'):
+            conn.execute(text(f'ALTER TABLE course DROP COLUMN {column}'))
+    db.session.remove()
+    db.engine.dispose()
+
+    migrate_schema()
+
+    db.session.expire_all()
+    course = Course.query.filter_by(name='CS 106').one()
+    assert course.meeting == parse_meeting('MWF 2:00-2:50 PM')
+
+
+def test_student_schedule_can_leave_out_one_course(app):
+    from schedule import student_schedule
+
+    student = User.query.filter_by(username='student0').one()
+    math = Course.query.filter_by(name='Math 101').one()
+    physics = Course.query.filter_by(name='Physics 121').one()
+    db.session.add(Enrollment(student_id=student.id, course_id=physics.id))
+    db.session.commit()
+
+    # One interval per meeting day, each owned by its course
+    assert set(student_schedule(db.session, student.id).owners) == {'Math 101', 'Physics 121'}
+    assert set(student_schedule(db.session, student.id, math.id).owners) == {'Physics 121'}
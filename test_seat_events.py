@@ -0,0 +1,139 @@
+"""
+Tests for the live seat-count stream
+"""
+
+import json
+import threading
+import time
+
+from app import app as flask_app, Course, User
+from conftest import login_as
+from seat_events import SeatBroadcaster, SqliteEventBackend
+
+
+def test_changes_are_coalesced_per_course():
+    broadcaster = SeatBroadcaster()
+    subscription = broadcaster.subscribe()
+
+    for enrolled in range(1, 51):
+        broadcaster.publish([(1, enrolled, 60)])
+    broadcaster.publish([(2, 5, 10)])
+
+    assert subscription.wait(timeout=1) == [
+        {'id': 1, 'enrolled': 50, 'capacity': 60},
+        {'id': 2, 'enrolled': 5, 'capacity': 10}
+    ]
+    assert subscription.wait(timeout=0.01) == []
+
+    subscription.close()
+    assert broadcaster.stats() == {'subscribers': 0, 'published': 51}
+
+
+def test_fan_out_to_1000_subscribers():
+    broadcaster = SeatBroadcaster()
+    subscriptions = [broadcaster.subscribe() for _ in range(1000)]
+    received = [None] * len(subscriptions)
+    ready = threading.Barrier(len(subscriptions) + 1)
+
+    def listen(i):
+        ready.wait()
+        changes = subscriptions[i].wait(timeout=10)
+        received[i] = (time.perf_counter(), changes)
+
+    threads = [threading.Thread(target=listen, args=(i,)) for i in range(len(subscriptions))]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+
+    published_at = time.perf_counter()
+    broadcaster.publish([(7, 3, 4)])
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted((at - published_at) * 1000 for at, _ in received)
+    assert all(changes == [{'id': 7, 'enrolled': 3, 'capacity': 4}] for _, changes in received)
+    assert latencies[990] < 2000
+
+
+def test_sqlite_backend_shares_changes_between_workers(tmp_path):
+    path = str(tmp_path / 'seat_events.db')
+    publisher = SeatBroadcaster(SqliteEventBackend(path, poll_interval=0.01))
+    listener = SeatBroadcaster(SqliteEventBackend(path, poll_interval=0.01))
+    subscription = listener.subscribe()
+
+    publisher.publish([(3, 9, 10)])
+
+    assert subscription.wait(timeout=2) == [{'id': 3, 'enrolled': 9, 'capacity': 10}]
+
+
+def test_sqlite_backend_keeps_polling_after_an_error(tmp_path):
+    path = str(tmp_path / 'seat_events.db')
+    backend = SqliteEventBackend(path, poll_interval=0.01)
+    received = []
+
+    def listener(changes):
+        if not received:
+            received.append(None)
+            raise RuntimeError('listener failed')
+        received.append(changes)
+
+    backend.listen(listener)
+    backend.publish([{'id': 1}])
+    deadline = time.monotonic() + 2
+    while backend.poll_errors == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    backend.publish([{'id': 2}])
+    while len(received) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert backend.poll_errors == 1
+    assert received == [None, [{'id': 2}]]
+
+
+def test_stream_pushes_enrollments(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SEAT_STREAM_COALESCE', 0)
+    course = Course.query.filter_by(name='CS 162').one()
+    student = User.query.filter_by(username='student5').one()
+    login_as(client, student)
+
+    response = client.get('/api/courses/seats/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    events = iter(response.response)
+    assert next(events).startswith(b'retry:')
+
+    client.post('/api/enroll', json={'course_id': course.id})
+
+    event, data = next(events).decode().strip().split('\n')
+    assert event == 'event: seats'
+    assert json.loads(data[len('data: '):]) == [{'id': course.id, 'enrolled': 1, 'capacity': 4}]
+    response.close()
+
+
+def test_stream_is_read_outside_the_app_context(client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SEAT_STREAM_COALESCE', 0)
+    course = Course.query.filter_by(name='CS 162').one()
+    login_as(client, User.query.filter_by(username='student5').one())
+    received = []
+    subscribed = threading.Event()
+
+    # A fresh thread has none of the fixture's app context, like a server writing the body out
+    def read():
+        try:
+            response = client.get('/api/courses/seats/stream', buffered=False)
+            events = iter(response.response)
+            received.append(next(events))
+            subscribed.set()
+            received.append(next(events))
+            response.close()
+        except Exception as error:
+            received.append(error)
+            subscribed.set()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    subscribed.wait(timeout=5)
+    client.post('/api/enroll', json={'course_id': course.id})
+    reader.join(timeout=5)
+
+    assert received[0].startswith(b'retry:')
+    assert received[1].startswith(b'event: seats')
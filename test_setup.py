@@ -28,11 +28,12 @@ def test_app_creation():
     """Test if the Flask app can be created"""
     print("\nTesting app creation...")
     try:
-        from app import app, db, User, Course, Enrollment
+        from app import app, db, User, Course, Enrollment, migrate_schema
         
         with app.app_context():
             # Test database connection
             db.create_all()
+            migrate_schema()
             print("Database tables created successfully")
             
             # Test sample data
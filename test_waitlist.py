@@ -0,0 +1,114 @@
+"""
+Tests for course waitlists and seat promotion
+"""
+
+import threading
+
+from app import app as flask_app, db, User, Course, Enrollment, Waitlist
+from conftest import fill_course, login_as, queue, students
+
+
+def waiting_ids(course):
+    return [w.student_id for w in Waitlist.query.filter_by(course_id=course.id).order_by(Waitlist.id)]
+
+
+def enrolled_ids(course):
+    return {e.student_id for e in Enrollment.query.filter_by(course_id=course.id)}
+
+
+def test_join_waitlist_reports_position(client):
+    course = fill_course('CS 162', students()[:4])
+
+    login_as(client, students()[4])
+    first = client.post('/api/waitlist/join', json={'course_id': course.id}).get_json()
+    login_as(client, students()[5])
+    second = client.post('/api/waitlist/join', json={'course_id': course.id}).get_json()
+    again = client.post('/api/waitlist/join', json={'course_id': course.id}).get_json()
+
+    assert first['success'] and first['waitlist_position'] == 1 and first['button'] == 'waitlisted'
+    assert second['waitlist_position'] == 2
+    assert again == {'success': False, 'message': 'Already on the waitlist'}
+    assert client.get(f'/api/waitlist/{course.id}').get_json() == {'success': True, 'enrolled': False, 'position': 2}
+
+    assert 'Waitlisted #2' in client.get('/student').get_data(as_text=True)
+
+
+def test_joining_with_a_free_seat_enrolls(client):
+    course = Course.query.filter_by(name='CS 162').one()
+    login_as(client, students()[0])
+
+    result = client.post('/api/waitlist/join', json={'course_id': course.id}).get_json()
+
+    assert result['success'] and result['button'] == 'remove'
+    assert result['course']['enrolled'] == 1
+    assert waiting_ids(course) == []
+
+
+def test_unenroll_promotes_head_of_waitlist(client):
+    holders = students()[:4]
+    course = fill_course('CS 162', holders)
+    queue(course, students()[4:7])
+
+    login_as(client, holders[0])
+    result = client.post('/api/unenroll', json={'course_id': course.id}).get_json()
+
+    assert result['success']
+    assert result['course']['enrolled'] == 4
+    db.session.expire_all()
+    assert enrolled_ids(course) == {s.id for s in holders[1:]} | {students()[4].id}
+    assert waiting_ids(course) == [s.id for s in students()[5:7]]
+    assert db.session.get(Course, course.id).enrolled_count == 4
+
+
+def test_capacity_raise_promotes_in_order(client):
+    course = fill_course('CS 162', students()[:4])
+    queue(course, students()[4:9])
+
+    login_as(client, User.query.filter_by(role='admin').one())
+    response = client.post(f'/admin/course/edit/?id={course.id}', data={
+        'name': course.name, 'teacher_id': str(course.teacher_id), 'time': course.time, 'capacity': '6'
+    })
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Course, course.id).enrolled_count == 6
+    assert {students()[4].id, students()[5].id} <= enrolled_ids(course)
+    assert waiting_ids(course) == [s.id for s in students()[6:9]]
+
+
+def test_concurrent_unenrolls_promote_fifo(app):
+    holders = students()[:4]
+    course = fill_course('CS 162', holders)
+    waiting = students()[4:12]
+    queue(course, waiting)
+    course_id = course.id
+    barrier = threading.Barrier(len(holders))
+
+    def unenroll(student_id):
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = student_id
+            sess['user_role'] = 'student'
+        barrier.wait()
+        client.post('/api/unenroll', json={'course_id': course_id})
+
+    threads = [threading.Thread(target=unenroll, args=(s.id,)) for s in holders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.session.expire_all()
+    assert enrolled_ids(course) == {s.id for s in waiting[:4]}
+    assert waiting_ids(course) == [s.id for s in waiting[4:]]
+    assert db.session.get(Course, course_id).enrolled_count == 4
+
+
+def test_waitlist_calls_reject_a_body_that_is_not_an_object(client):
+    login_as(client, students()[0])
+
+    for url in ('/api/waitlist/join', '/api/waitlist/leave'):
+        for body in ([], 'x', 7):
+            response = client.post(url, json=body)
+            assert response.status_code == 200
+            assert response.get_json()['success'] is False